@@ -0,0 +1,154 @@
+"""
+Account creation and email lookups.
+
+Emails are unique regardless of case: migration 0009 adds a unique index on
+LOWER(email) to auth_user (empty emails excluded), and `email_lookup()`
+filters on that same expression so both SQLite and PostgreSQL search the
+index instead of scanning the table. Django's `email__iexact` compiles to
+LIKE on SQLite and UPPER() on PostgreSQL, neither of which the index
+covers. SQLite's LOWER() only folds ASCII, so 'Élise@exemple.fr' is
+'Élise@exemple.fr' to the index but 'élise@exemple.fr' to str.lower();
+each email is looked up both through the database's LOWER() and lowered by
+Python, which finds it whether it was stored as typed or lowered (as
+create_user() does to domains and Provisioner to whole addresses). Two
+addresses that differ only in the case of a non-ASCII letter are still
+different to SQLite's index; PostgreSQL's LOWER() folds them.
+
+`register()` creates the User and its UserProfile in one transaction; a
+duplicate that slips past validation hits the unique indexes and surfaces
+as `AccountError`.
+
+`Provisioner` (the provision_users command) imports accounts for ticket
+holders from partner sales. Rows are taken a batch at a time: existing
+usernames and emails are skipped with one query each, passwords are hashed
+on a thread pool (hashlib's PBKDF2 releases the GIL) and the users and
+profiles are written with bulk_create in one transaction. Imported
+passwords use PASSWORD_ITERATIONS PBKDF2 rounds instead of Django's
+default; PBKDF2PasswordHasher sees the lower count on the first login and
+re-hashes the password at full cost, so the shortcut lasts until then. At
+1000 rounds a hash costs about a millisecond against half a second for the
+default; raise it when the hashes of accounts that never log in matter. Rows
+without a password get an unusable one (the holder sets it by reset).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from .models import UserProfile
+
+DEFAULTS = {
+    'PASSWORD_ITERATIONS': 1000,     # PBKDF2 rounds for imported passwords
+    'WORKERS': 8,                    # hashing threads
+    'BATCH_SIZE': 1000,
+}
+
+
+class AccountError(Exception):
+    """An account that cannot be created; the message says why."""
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_ACCOUNTS', {})}
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def email_lookup(emails):
+    """Users whose email matches any of `emails`, ignoring case."""
+    return User.objects.annotate(email_key=Lower('email')).filter(
+        email_key__in=[
+            key for email in emails
+            for key in (Lower(Value((email or '').strip())), normalize_email(email))
+        ]
+    )
+
+
+def user_for_email(email):
+    return email_lookup([email]).first() if normalize_email(email) else None
+
+
+def register(username, email, password, is_organizer=False):
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(username=username, email=email, password=password)
+            UserProfile.objects.create(user=user, is_organizer=is_organizer)
+    except IntegrityError:
+        raise AccountError('Username or email already exists')
+    return user
+
+
+# ============================================
+# BULK PROVISIONING
+# ============================================
+
+class Provisioner:
+    """Buffers account records and writes them a batch at a time."""
+
+    def __init__(self, iterations=None, workers=None, batch_size=None):
+        config = get_config()
+        self.iterations = iterations or config['PASSWORD_ITERATIONS']
+        self.batch_size = batch_size or config['BATCH_SIZE']
+        self.hasher = PBKDF2PasswordHasher()
+        self.pool = ThreadPoolExecutor(max_workers=workers or config['WORKERS'])
+        self.pending = []
+        self.seen = set()   # usernames and emails taken earlier in this run
+        self.stats = {'created': 0, 'skipped': 0}
+
+    def add(self, where, record):
+        email = normalize_email(record.get('email'))
+        if not email or '@' not in email:
+            raise AccountError(f'{where}: missing or invalid email')
+        username = (record.get('username') or email).strip()
+        if len(username) > User._meta.get_field('username').max_length:
+            raise AccountError(f'{where}: username is too long')
+        if username in self.seen or email in self.seen:
+            self.stats['skipped'] += 1
+            return
+        self.seen.update((username, email))
+        self.pending.append((username, email, record))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _hash(self, password):
+        if not password:
+            return make_password(None)
+        return self.hasher.encode(password, self.hasher.salt(), iterations=self.iterations)
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        taken = set(User.objects.filter(username__in=[row[0] for row in batch])
+                    .values_list('username', flat=True))
+        taken.update(normalize_email(email) for email in email_lookup([row[1] for row in batch])
+                     .values_list('email', flat=True))
+        fresh = [row for row in batch if row[0] not in taken and row[1] not in taken]
+        self.stats['skipped'] += len(batch) - len(fresh)
+        batch = fresh
+        passwords = self.pool.map(self._hash, [row[2].get('password') for row in batch])
+        users = [
+            User(username=username, email=email, password=password,
+                 first_name=record.get('first_name', ''), last_name=record.get('last_name', ''))
+            for (username, email, record), password in zip(batch, passwords)
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                UserProfile.objects.bulk_create(UserProfile(user=user) for user in users)
+        except IntegrityError as exc:
+            raise AccountError(f'Batch rejected, an account was created meanwhile: {exc}')
+        self.stats['created'] += len(users)
+
+    def finish(self):
+        try:
+            self.flush()
+        finally:
+            self.pool.shutdown()
+        return self.stats
@@ -1,5 +1,9 @@
+from django import forms
 from django.contrib import admin
-from .models import UserProfile, Artist, Event, Ticket, Stage, Performance
+from django.core.exceptions import ValidationError
+from .conflicts import check, make_slot, message
+from .models import UserProfile, Artist, Event, Ticket, Reservation, Stage, Performance
+from .purchases import rebalance_shards
 
 
 @admin.register(UserProfile)
@@ -15,8 +19,57 @@ class ArtistAdmin(admin.ModelAdmin):
     search_fields = ['name', 'genre']
 
 
+def _slot(data, instance, event=None):
+    """A conflicts.Slot for cleaned form data, or None while fields are missing."""
+    event = event or data.get('event')
+    values = [data.get(name) for name in ('stage', 'artist', 'start_time', 'end_time')]
+    if event is None or event.start_datetime is None or None in values:
+        return None
+    return make_slot(instance.pk, event, *values[:2], data.get('title', ''), *values[2:])
+
+
+class PerformanceAdminForm(forms.ModelForm):
+    """Rejects sets overlapping another on the same stage or of the same artist."""
+
+    class Meta:
+        model = Performance
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        slot = _slot(cleaned_data, self.instance)
+        if slot is not None:
+            errors = [message(conflict) for conflict in check([slot])]
+            if errors:
+                raise ValidationError(errors)
+        return cleaned_data
+
+
+class PerformanceInlineFormSet(forms.BaseInlineFormSet):
+    """Checks the event's sets against each other as well as what is stored."""
+
+    def clean(self):
+        super().clean()
+        slots, removed = [], []
+        for form in self.forms:
+            if not hasattr(form, 'cleaned_data') or not form.cleaned_data:
+                continue
+            if self.can_delete and self._should_delete_form(form):
+                if form.instance.pk:
+                    removed.append(form.instance.pk)
+                continue
+            slot = _slot(form.cleaned_data, form.instance, event=self.instance)
+            if slot is not None:
+                slots.append(slot)
+        # Sets of other events are compared with what is stored.
+        errors = [message(conflict) for conflict in check(slots, exclude=removed)]
+        if errors:
+            raise ValidationError(errors)
+
+
 class PerformanceInline(admin.TabularInline):
     model = Performance
+    formset = PerformanceInlineFormSet
     extra = 1
 
 
@@ -29,14 +82,21 @@ class EventAdmin(admin.ModelAdmin):
         'location_name',
         'ticket_price',
         'capacity',
-        'tickets_sold',
+        'sold_count',
+        'shard_count',
     ]
     list_filter = ['start_datetime']
     search_fields = ['title', 'location_name', 'host__username']
     filter_horizontal = ['artists']
     ordering = ('start_datetime',)
+    readonly_fields = ['shard_count']
     inlines = [PerformanceInline]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and obj.shard_count and 'capacity' in form.changed_data:
+            rebalance_shards(obj)
+
 
 @admin.register(Ticket)
 class TicketAdmin(admin.ModelAdmin):
@@ -45,6 +105,13 @@ class TicketAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'event__title']
 
 
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'event', 'created_at', 'expires_at']
+    list_filter = ['expires_at']
+    search_fields = ['user__username', 'event__title']
+
+
 @admin.register(Stage)
 class StageAdmin(admin.ModelAdmin):
     list_display = ("name", "location", "order")
@@ -53,6 +120,7 @@ class StageAdmin(admin.ModelAdmin):
 
 @admin.register(Performance)
 class PerformanceAdmin(admin.ModelAdmin):
+    form = PerformanceAdminForm
     list_display = ("get_label", "artist", "stage", "event", "start_time", "end_time")
     list_filter = ("event", "stage", "artist")
     # 🔴 FIXED: use event__start_datetime instead of event__start_date
@@ -0,0 +1,257 @@
+"""
+JWT authentication that answers "who is this" from the token.
+
+`issue_tokens()` (register and login) adds the claims permission checks
+need - username, is_staff and is_organizer - to the token pair, plus the
+user's stamp: a random value kept in the festify.caching alias that the
+receivers in festify.signals replace whenever the User or its UserProfile
+is saved or deleted. A stamp is never reused, so one lost to eviction or a
+cache restart is replaced by a new value and can't match old tokens again.
+
+`CachedJWTAuthentication` checks the signature and expiry as usual, then
+reads the stamp with one cache lookup instead of loading the User. While it
+still matches, request.user is a `TokenUser`: id, username and the claims
+come from the token, and anything else (email, profile, passing it to the
+ORM) loads the User with its profile from a small in-process cache, bounded
+to USER_CACHE_SIZE entries of USER_CACHE_TTL seconds and keyed by the
+stamp, or from the database on a miss. A token without a stamp, or with one
+that moved on, may carry stale claims (or a deleted user), so the user is
+loaded up front, checked the way simplejwt does, and returned as a plain
+User.
+
+Stamps only work when every worker reads the same cache. With TRUST_CLAIMS
+left at 'shared-cache', a per-process alias (local memory, dummy) means the
+claims are never trusted; set it to True only for a single process, such as
+tests and runserver. Untrusted requests still take the user from the same
+in-process cache, under UNSTAMPED instead of a stamp. A change is seen at
+once by the process that saved it (the receivers drop the entry), and by
+the other workers once their entry expires after USER_CACHE_TTL seconds.
+Set USER_CACHE_TTL to 0 to load the user on every request.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import caching
+from .revocation import RevocableRefreshToken
+
+DEFAULTS = {
+    'USER_CACHE_SIZE': 1024,
+    'USER_CACHE_TTL': 60,   # seconds
+    'TRUST_CLAIMS': 'shared-cache',   # True, False or 'shared-cache'
+}
+
+CLAIMS = ('username', 'is_staff', 'is_organizer')
+STAMP_CLAIM = 'user_stamp'
+UNSTAMPED = ''   # cache entries of users loaded while claims aren't trusted
+
+_users = OrderedDict()   # user id -> (expires at, stamp, User)
+_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_AUTH', {})}
+
+
+def trusts_claims():
+    trust = get_config()['TRUST_CLAIMS']
+    if trust == 'shared-cache':
+        return caching.is_shared(caching.get_cache())
+    return bool(trust)
+
+
+# ============================================
+# STAMPS
+# ============================================
+
+def _stamp_key(user_id):
+    return f'festify:auth:stamp:{user_id}'
+
+
+def current_stamp(user_id):
+    """The user's stamp, or None when there is none (yet, or any more)."""
+    return caching.get_cache().get(_stamp_key(user_id))
+
+
+def issue_stamp(user_id):
+    """The user's stamp, starting a new one when there is none."""
+    cache = caching.get_cache()
+    key = _stamp_key(user_id)
+    cache.add(key, uuid.uuid4().hex, None)
+    return cache.get(key)
+
+
+def restamp(user_id):
+    """Stop trusting the claims of every token issued to the user so far."""
+    caching.get_cache().set(_stamp_key(user_id), uuid.uuid4().hex, None)
+
+
+def is_organizer(user):
+    """The is_organizer claim for token users, the profile flag otherwise."""
+    if isinstance(user, TokenUser):
+        return user.is_organizer
+    profile = getattr(user, 'profile', None)
+    return bool(profile and profile.is_organizer)
+
+
+def set_claims(token, user, stamp):
+    token['username'] = user.username
+    token['is_staff'] = user.is_staff
+    token['is_organizer'] = is_organizer(user)
+    if stamp is None:
+        token.payload.pop(STAMP_CLAIM, None)
+    else:
+        token[STAMP_CLAIM] = stamp
+
+
+def issue_tokens(user):
+    """{'refresh', 'access'} for `user`, carrying the claims above."""
+    stamp = issue_stamp(user.pk) if trusts_claims() else None
+    refresh = RevocableRefreshToken.for_user(user)
+    set_claims(refresh, user, stamp)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+# ============================================
+# USER CACHE
+# ============================================
+
+def _load_user(user_id):
+    return User.objects.select_related('profile').filter(pk=user_id).first()
+
+
+def cached_user(user_id, stamp):
+    """
+    The User with its profile, or None; each caller gets its own copy. A
+    copy is only reused under the stamp it was loaded with, and a None
+    stamp always reads the database.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is not None and entry[0] > now and stamp is not None and entry[1] == stamp:
+            _users.move_to_end(user_id)
+            return copy.deepcopy(entry[2])
+    user = _load_user(user_id)
+    if user is None or stamp is None:
+        return user
+    config = get_config()
+    with _lock:
+        _users[user_id] = (now + config['USER_CACHE_TTL'], stamp, user)
+        _users.move_to_end(user_id)
+        while len(_users) > config['USER_CACHE_SIZE']:
+            _users.popitem(last=False)
+    return copy.deepcopy(user)
+
+
+def forget(user_id):
+    with _lock:
+        _users.pop(user_id, None)
+
+
+def clear():
+    with _lock:
+        _users.clear()
+
+
+# ============================================
+# AUTHENTICATION
+# ============================================
+
+class TokenUser(SimpleLazyObject):
+    """A User that loads itself (see cached_user) only when it has to."""
+
+    def __init__(self, user_id, claims):
+        super().__init__(lambda: cached_user(user_id, claims[STAMP_CLAIM]))
+        self.__dict__['_user_id'] = user_id
+        self.__dict__['_claims'] = claims
+
+    @property
+    def id(self):
+        return self._user_id
+
+    pk = id
+
+    is_authenticated = True
+    is_anonymous = False
+
+    @property
+    def username(self):
+        return self._claims['username']
+
+    @property
+    def is_staff(self):
+        return self._claims['is_staff']
+
+    @property
+    def is_organizer(self):
+        return self._claims['is_organizer']
+
+    def __bool__(self):
+        # DRF's permissions test `request.user and ...`.
+        return True
+
+    def __repr__(self):
+        return f'<TokenUser: {self._user_id}>'
+
+
+def _user_id(token):
+    try:
+        # simplejwt writes the id as a string.
+        return User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValidationError):
+        raise InvalidToken('Token contained no recognizable user identification')
+
+
+def _active_user(user_id, stamp):
+    user = cached_user(user_id, stamp)
+    if user is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = _user_id(validated_token)
+        if not trusts_claims():
+            return _active_user(user_id, UNSTAMPED)
+        stamp = current_stamp(user_id)
+        claims = {name: validated_token.get(name) for name in (*CLAIMS, STAMP_CLAIM)}
+        if stamp is not None and None not in claims.values() and claims[STAMP_CLAIM] == stamp:
+            return TokenUser(user_id, claims)
+        return _active_user(user_id, stamp)
+
+
+def refresh_tokens(refresh):
+    """{'access'} (and a new 'refresh' when rotating) for a verified refresh token."""
+    user_id = _user_id(refresh)
+    # Read before the user, so a change in between restamps the new claims
+    # instead of giving the old ones the new stamp.
+    stamp = issue_stamp(user_id) if trusts_claims() else None
+    user = _active_user(user_id, None)
+    tokens = {}
+    if api_settings.ROTATE_REFRESH_TOKENS:
+        if api_settings.BLACKLIST_AFTER_ROTATION:
+            refresh.blacklist()
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        refresh.outstand()
+    # Claims are re-read, so a refresh also catches up with profile changes.
+    set_claims(refresh, user, stamp)
+    if api_settings.ROTATE_REFRESH_TOKENS:
+        tokens['refresh'] = str(refresh)
+    tokens['access'] = str(refresh.access_token)
+    return tokens
@@ -0,0 +1,540 @@
+"""
+Synthetic data and a repeatable benchmark harness for the hot endpoints.
+
+`seed()` (the seed_benchmark_data command) fills the database with
+`bench-*` users, events, artists, stages, performances and tickets, skewed
+the way ticketing is: event demand, artist bookings and purchases per fan
+follow Zipf-like curves, so a few events sell out while the long tail sells
+a handful of seats and a few fans hold dozens of tickets. The same seed
+always produces the same data.
+
+`run()` (the run_benchmarks command) drives SCENARIOS one request at a time
+through Django's test client, counting every query, or over HTTP against a
+running server (query counts then come from the X-Query-Count header that
+DEBUG servers send). Each scenario reports p50/p95/p99 latency, throughput,
+queries per request and the response statuses. In-process buys skip the
+waiting room and are rolled back afterwards so runs stay repeatable;
+against a server they are real purchases. Results record the git commit
+and dataset size so files from different commits can be diffed with
+`compare()`.
+
+'login-stuffing' replays a credential-stuffing attack from one address:
+wrong passwords against a rotating list of accounts, each named by
+username and email in turn. Its 401s are the attempts that reached the
+password hasher, its 429s the ones the login throttle (festify.throttling)
+turned away first; in-process runs start from empty throttle counts.
+
+'auth-claims', 'auth-cached' and 'auth-lookup' request the same owner-only
+page with the same token: trusting its claims (festify.authentication),
+taking the user from the per-process user cache, and loading the user
+every time, so the differences are the authentication cost.
+'refresh-filter' and 'refresh-table' refresh the same token with the
+revocation Bloom filter (festify.revocation) and with the plain blacklist
+lookup; `revoked` seeds that many unexpired blacklisted tokens to check
+against. Scenarios
+listed in SETTINGS run in-process under those settings; over HTTP the
+server's own settings apply.
+"""
+import contextlib
+import http.client
+import json
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication, caching, geo, revocation, search, sync, throttling
+from .models import Artist, Event, Performance, Stage, Ticket, UserProfile
+
+PREFIX = 'bench-'
+PASSWORD = 'bench-password'
+
+DEFAULTS = {
+    'users': 2000,
+    'events': 200,
+    'artists': 500,
+    'stages': 8,
+    'performances': 6,   # per event
+    'tickets': 20000,
+    'revoked': 0,        # blacklisted refresh tokens
+    'seed': 1,
+}
+
+GENRES = ('rock', 'techno', 'jazz', 'hip hop', 'folk', 'house', 'indie', 'metal', 'pop', 'classical')
+CITIES = (
+    ('Amsterdam', 52.37, 4.90), ('Berlin', 52.52, 13.40), ('Barcelona', 41.39, 2.17),
+    ('London', 51.51, -0.13), ('Lisbon', 38.72, -9.14), ('Prague', 50.08, 14.44),
+    ('Copenhagen', 55.68, 12.57), ('Budapest', 47.50, 19.04),
+)
+
+
+def _zipf_cumulative(count, exponent=1.1):
+    """Cumulative weights where the n-th item is drawn ~1/n**exponent as often."""
+    total, cumulative = 0.0, []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+# ============================================
+# SEED DATA
+# ============================================
+
+def is_seeded():
+    return User.objects.filter(username__startswith=PREFIX).exists()
+
+
+def clear():
+    """Delete everything seed() created."""
+    OutstandingToken.objects.filter(
+        Q(jti__startswith=PREFIX) | Q(user__username__startswith=PREFIX)
+    ).delete()
+    User.objects.filter(username__startswith=PREFIX).delete()
+    Artist.objects.filter(name__startswith='Bench Artist ').delete()
+    Stage.objects.filter(name__startswith='Bench Stage ').delete()
+
+
+def seed(users, events, artists, stages, performances, tickets, seed, revoked=0, batch_size=2000):
+    """Create the data set; returns row counts per model."""
+    rng = random.Random(seed)
+    with transaction.atomic():
+        host = User.objects.create_user(username=f'{PREFIX}host', password=PASSWORD)
+        UserProfile.objects.create(user=host, is_organizer=True)
+
+        # One hash for everyone: hashing per user would dominate seeding.
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'{PREFIX}user-{index}', email=f'{PREFIX}user-{index}@example.com',
+                 password=password)
+            for index in range(users)
+        ], batch_size=batch_size)
+        user_ids = list(
+            User.objects.filter(username__startswith=f'{PREFIX}user-')
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=pk) for pk in user_ids], batch_size=batch_size
+        )
+
+        artist_rows = Artist.objects.bulk_create([
+            Artist(name=f'Bench Artist {index}', genre=rng.choice(GENRES),
+                   description=f'Synthetic artist number {index}.')
+            for index in range(artists)
+        ], batch_size=batch_size)
+        stage_rows = Stage.objects.bulk_create([
+            Stage(name=f'Bench Stage {index}', location=f'Field {index}', order=index + 1)
+            for index in range(stages)
+        ], batch_size=batch_size)
+
+        # Demand per event and purchases per fan are skewed independently
+        # of ids and dates.
+        demand = _zipf_cumulative(events)
+        activity = _zipf_cumulative(len(user_ids))
+        ranked_events = rng.sample(range(events), events)
+        ranked_users = rng.sample(user_ids, len(user_ids))
+        pairs, draws = set(), 0
+        while len(pairs) < min(tickets, events * len(user_ids)) and draws < tickets * 20:
+            batch = tickets - len(pairs)
+            pairs.update(zip(
+                (ranked_events[i] for i in _draw(rng, demand, batch)),
+                (ranked_users[i] for i in _draw(rng, activity, batch)),
+            ))
+            draws += batch
+        sold = Counter(event for event, _ in pairs)
+
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        event_rows = []
+        for index in range(events):
+            city, latitude, longitude = rng.choice(CITIES)
+            start = today + timedelta(days=rng.randint(-30, 180), hours=rng.randint(12, 20))
+            days = rng.choice((0, 0, 1, 2, 3))
+            capacity = rng.choice((200, 500, 1000, 5000, 20000))
+            event = Event(
+                host=host, title=f'Bench Festival {index}',
+                description=f'Synthetic festival number {index} in {city}.',
+                start_datetime=start,
+                end_datetime=start + timedelta(days=days, hours=6) if rng.random() < 0.8 else None,
+                location_name=f'{city} Park', address=f'Festival road {index}, {city}',
+                latitude=latitude + rng.uniform(-0.2, 0.2),
+                longitude=longitude + rng.uniform(-0.2, 0.2),
+                ticket_price=Decimal(rng.choice((25, 45, 60, 89, 120, 250))),
+                # The most wanted events sell out.
+                capacity=capacity if sold[index] < capacity * 0.9 else sold[index],
+                tickets_sold=sold[index],
+            )
+            event.geo_cell = geo.cell_for(event.latitude, event.longitude)
+            event_rows.append(event)
+        Event.objects.bulk_create(event_rows, batch_size=batch_size)
+
+        Ticket.objects.bulk_create([
+            Ticket(event_id=event_rows[event].pk, user_id=user_id)
+            for event, user_id in sorted(pairs)
+        ], batch_size=batch_size)
+
+        # Headliners are booked far more often than the long tail.
+        bookings = _zipf_cumulative(artists)
+        performance_rows, lineup = [], set()
+        for event in event_rows:
+            for slot in range(performances):
+                artist = artist_rows[_draw(rng, bookings, 1)[0]]
+                # Stages run their slots back to back from noon.
+                start = datetime.combine(today.date(), dt_time(12)) + timedelta(
+                    minutes=90 * (slot // stages)
+                )
+                performance_rows.append(Performance(
+                    event=event, artist=artist, stage=stage_rows[slot % stages],
+                    start_time=start.time(), end_time=(start + timedelta(minutes=75)).time(),
+                ))
+                lineup.add((event.pk, artist.pk))
+        Performance.objects.bulk_create(performance_rows, batch_size=batch_size)
+        through = Event.artists.through
+        through.objects.bulk_create(
+            [through(event_id=event_id, artist_id=artist_id) for event_id, artist_id in sorted(lineup)],
+            batch_size=batch_size,
+        )
+
+        _seed_revoked(revoked, batch_size)
+
+        # Bulk writes fire no signals; do their work once for everything.
+        for label, rows in (('artist', artist_rows), ('stage', stage_rows),
+                            ('event', event_rows), ('performance', performance_rows)):
+            sync.record(label, [row.pk for row in rows])
+    search.index_events([event.pk for event in event_rows])
+    revocation.invalidate()
+    caching.bump('event', 'artist', 'stage', 'performance')
+    return dataset()
+
+
+def _seed_revoked(count, batch_size):
+    """`count` unexpired refresh tokens, all blacklisted."""
+    now = timezone.now()
+    expires = now + jwt_settings.REFRESH_TOKEN_LIFETIME
+    for start in range(0, count, batch_size):
+        outstanding = OutstandingToken.objects.bulk_create([
+            OutstandingToken(jti=f'{PREFIX}revoked-{index}', token='', created_at=now, expires_at=expires)
+            for index in range(start, min(start + batch_size, count))
+        ])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in outstanding])
+
+
+def _draw(rng, cumulative, count):
+    """`count` indexes drawn by the given cumulative weights."""
+    return rng.choices(range(len(cumulative)), cum_weights=cumulative, k=count)
+
+
+def dataset():
+    """Row counts of the seeded data."""
+    events = Event.objects.filter(host__username=f'{PREFIX}host')
+    return {
+        'users': User.objects.filter(username__startswith=f'{PREFIX}user-').count(),
+        'events': events.count(),
+        'artists': Artist.objects.filter(name__startswith='Bench Artist ').count(),
+        'stages': Stage.objects.filter(name__startswith='Bench Stage ').count(),
+        'performances': Performance.objects.filter(event__in=events).count(),
+        'tickets': Ticket.objects.filter(event__in=events).count(),
+        'revoked': BlacklistedToken.objects.filter(token__jti__startswith=PREFIX).count(),
+    }
+
+
+# ============================================
+# HARNESS
+# ============================================
+
+class Fixtures:
+    """What the scenarios request, picked from the seeded data."""
+
+    def __init__(self, buyers_needed):
+        events = Event.objects.filter(host__username=f'{PREFIX}host')
+        self.events = list(events.order_by('-tickets_sold', 'pk').values_list('pk', flat=True)[:50])
+        if not self.events:
+            raise ValueError('No benchmark data; run seed_benchmark_data first')
+        self.stages = list(
+            Stage.objects.filter(name__startswith='Bench Stage ').order_by('pk').values_list('pk', flat=True)
+        )
+        busiest = (
+            events.annotate(month=TruncMonth('start_datetime')).values('month')
+            .annotate(count=Count('pk')).order_by('-count', 'month').first()
+        )
+        self.month = (busiest['month'].year, busiest['month'].month)
+        self.host = User.objects.get(username=f'{PREFIX}host')
+        self.refresh = str(revocation.RevocableRefreshToken.for_user(self.host))
+        self.fan = (
+            User.objects.filter(username__startswith=f'{PREFIX}user-')
+            .annotate(count=Count('tickets')).order_by('-count', 'pk').first()
+        )
+        # Buyers need a seat and no ticket yet, one per request.
+        self.buy_event = events.order_by('tickets_sold', '-capacity', 'pk').values_list('pk', flat=True)[0]
+        self.buyers = list(
+            User.objects.filter(username__startswith=f'{PREFIX}user-')
+            .exclude(tickets__event_id=self.buy_event).order_by('pk')[:buyers_needed]
+        )
+        self.victims = list(
+            User.objects.filter(username__startswith=f'{PREFIX}user-')
+            .order_by('pk').values_list('username', 'email')[:20]
+        )
+
+
+def _stuffing_attempt(fx, i):
+    username, email = fx.victims[i // 2 % len(fx.victims)]
+    return 'POST', '/api/auth/login/', None, {
+        'username': email if i % 2 else username, 'password': f'guess-{i}',
+    }
+
+
+# name -> fixtures, iteration -> (method, path, user or None[, JSON body])
+SCENARIOS = {
+    'events-list': lambda fx, i: ('GET', '/api/events/', None),
+    'events-retrieve': lambda fx, i: ('GET', f'/api/events/{fx.events[i % len(fx.events)]}/', None),
+    'events-buy': lambda fx, i: (
+        'POST', f'/api/events/{fx.buy_event}/buy/', fx.buyers[i % len(fx.buyers)]
+    ),
+    'profile': lambda fx, i: ('GET', '/api/profile/', fx.fan),
+    'user-tickets': lambda fx, i: ('GET', '/api/profile/tickets/', fx.fan),
+    'home': lambda fx, i: ('GET', '/', None),
+    'month-calendar': lambda fx, i: ('GET', '/calendar/{}/{}/'.format(*fx.month), None),
+    'stage-detail': lambda fx, i: ('GET', f'/stage/{fx.stages[i % len(fx.stages)]}/', None),
+    'login-stuffing': _stuffing_attempt,
+    'auth-claims': lambda fx, i: ('GET', f'/api/events/{fx.events[0]}/conflicts/', fx.host),
+    'auth-cached': lambda fx, i: ('GET', f'/api/events/{fx.events[0]}/conflicts/', fx.host),
+    'auth-lookup': lambda fx, i: ('GET', f'/api/events/{fx.events[0]}/conflicts/', fx.host),
+    'refresh-filter': lambda fx, i: ('POST', '/api/auth/refresh/', None, {'refresh': fx.refresh}),
+    'refresh-table': lambda fx, i: ('POST', '/api/auth/refresh/', None, {'refresh': fx.refresh}),
+}
+WRITES = {'events-buy'}
+THROTTLED = {'login-stuffing'}
+# name -> {setting: values merged into the configured dict}
+SETTINGS = {
+    'auth-claims': {'FESTIFY_AUTH': {'TRUST_CLAIMS': True}},
+    'auth-cached': {'FESTIFY_AUTH': {'TRUST_CLAIMS': False}},
+    'auth-lookup': {'FESTIFY_AUTH': {'TRUST_CLAIMS': False, 'USER_CACHE_TTL': 0}},
+    'refresh-filter': {'FESTIFY_REVOCATION': {'USE_FILTER': True}},
+    'refresh-table': {'FESTIFY_REVOCATION': {'USE_FILTER': False}},
+}
+# Scenarios whose requests are meant to fail; the rest expect 2xx.
+EXPECTED_STATUSES = {'login-stuffing': (401, 429)}
+
+
+class _Counter:
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class ClientTarget:
+    """Requests through django.test.Client in this process."""
+    counts_queries = True
+
+    def __init__(self):
+        host = next((h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')), 'localhost')
+        self.client = Client(SERVER_NAME=host, raise_request_exception=False)
+
+    def scenario(self, name):
+        return _ClientScenario(self, name)
+
+    def request(self, method, path, headers, body=None):
+        counter = _Counter()
+        data = json.dumps(body) if body is not None else ''
+        with connection.execute_wrapper(counter):
+            response = self.client.generic(
+                method, path, data, content_type='application/json', headers=headers
+            )
+        return response.status_code, counter.queries
+
+
+class _ClientScenario:
+    # Writes run with the waiting room off (it would cap them at its admit
+    # rate) inside a transaction that is rolled back afterwards. Throttled
+    # scenarios start and leave the throttle counts empty, and scenarios
+    # with their own settings the user cache (its entries keep the TTL
+    # they were stored with).
+    def __init__(self, target, name):
+        self.target, self.writes, self.throttled = target, name in WRITES, name in THROTTLED
+        self.overrides = {
+            setting: {**getattr(settings, setting, {}), **values}
+            for setting, values in SETTINGS.get(name, {}).items()
+        }
+        if self.writes:
+            self.overrides['FESTIFY_WAITING_ROOM'] = {'ENABLED': False}
+        self._settings = None
+
+    def __enter__(self):
+        if self.throttled:
+            throttling.reset()
+        if self.overrides:
+            authentication.clear()
+            self._settings = override_settings(**self.overrides)
+            self._settings.enable()
+        if self.writes:
+            self._atomic = transaction.atomic()
+            self._atomic.__enter__()
+        if self._settings is None:
+            return self.target
+        return ClientTarget()   # fresh middleware chain under the override
+
+    def __exit__(self, *exc_info):
+        if self.writes:
+            transaction.set_rollback(True)
+            self._atomic.__exit__(*exc_info)
+        if self._settings is not None:
+            self._settings.disable()
+            authentication.clear()
+        if self.throttled:
+            throttling.reset()
+        return False
+
+
+class HttpTarget:
+    """Requests over one keep-alive connection to a running server."""
+    counts_queries = False
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def scenario(self, name):
+        return contextlib.nullcontext(self)
+
+    def request(self, method, path, headers, body=None):
+        if body is not None:
+            headers, body = {**headers, 'Content-Type': 'application/json'}, json.dumps(body)
+        try:
+            self.connection.request(method, self.prefix + path, body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            self.connection.close()
+            self.connection.request(method, self.prefix + path, body, headers=headers)
+            response = self.connection.getresponse()
+        response.read()
+        queries = response.getheader('X-Query-Count')
+        return response.status, int(queries) if queries is not None else None
+
+
+def _percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else None
+        return {'p50': value, 'p95': value, 'p99': value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def _access_token(user):
+    # Claims and stamp as login issues them; ignored unless claims are trusted.
+    token = AccessToken.for_user(user)
+    authentication.set_claims(token, user, authentication.issue_stamp(user.pk))
+    return str(token)
+
+
+def run_scenario(target, name, fixtures, requests, warmup, cold=False):
+    build = SCENARIOS[name]
+    tokens = {}
+    latencies, queries, statuses = [], [], Counter()
+    with target.scenario(name) as target:
+        started = None
+        for index in range(warmup + requests):
+            if index == warmup:
+                started = time.perf_counter()
+            method, path, user, *body = build(fixtures, index)
+            headers = {}
+            if user is not None:
+                if user.pk not in tokens:
+                    tokens[user.pk] = _access_token(user)
+                headers['Authorization'] = f'Bearer {tokens[user.pk]}'
+            if cold:
+                caching.get_cache().clear()
+
+            begin = time.perf_counter()
+            status, count = target.request(method, path, headers, *body)
+            elapsed = time.perf_counter() - begin
+            if index >= warmup:
+                latencies.append(elapsed * 1000)
+                statuses[str(status)] += 1
+                if count is not None:
+                    queries.append(count)
+        wall = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'statuses': dict(sorted(statuses.items())),
+        'latency_ms': {
+            'mean': statistics.fmean(latencies), **_percentiles(latencies), 'max': max(latencies),
+        },
+        'throughput_rps': requests / wall if wall else None,
+        'queries': {'mean': statistics.fmean(queries), 'max': max(queries)} if queries else None,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=settings.BASE_DIR, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scenarios=None, requests=200, warmup=20, base_url=None, cold=False):
+    """Benchmark results as a JSON-ready dict."""
+    scenarios = list(scenarios or SCENARIOS)
+    if requests < 1:
+        raise ValueError('requests must be 1 or more')
+    if cold and base_url:
+        raise ValueError('cold runs need the in-process client to clear the cache')
+    fixtures = Fixtures(buyers_needed=warmup + requests)
+    target = HttpTarget(base_url) if base_url else ClientTarget()
+    return {
+        'meta': {
+            'commit': _commit(),
+            'created_at': timezone.now().isoformat(),
+            'target': base_url or 'test-client',
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'requests': requests,
+            'warmup': warmup,
+            'cold_cache': cold,
+            'dataset': dataset(),
+        },
+        'scenarios': {
+            name: run_scenario(target, name, fixtures, requests, warmup, cold) for name in scenarios
+        },
+    }
+
+
+def compare(baseline, current):
+    """Lines describing how `current` moved against `baseline`, per scenario."""
+    lines = []
+    for name, now in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        parts = []
+        for key in ('p50', 'p95', 'p99'):
+            old, new = before['latency_ms'][key], now['latency_ms'][key]
+            change = f' ({(new - old) / old:+.0%})' if old else ''
+            parts.append(f'{key} {old:.2f} -> {new:.2f} ms{change}')
+        if before.get('queries') and now.get('queries'):
+            parts.append(f"queries {before['queries']['mean']:g} -> {now['queries']['mean']:g}")
+        lines.append(f"{name}: {', '.join(parts)}")
+    return lines
@@ -0,0 +1,222 @@
+"""
+Versioned response cache for the public read endpoints.
+
+Cached payloads and pages are keyed by URL, host and the current version
+counter of every entity they depend on ('event', 'artist', 'performance',
+'stage', plus 'event:<id>' for single events and 'ticket:user:<id>' for
+one user's tickets). The receivers in
+festify.signals bump those counters on save/delete, which makes every
+dependent key unreachable at once; the stale entries simply age out of the
+cache (local memory, file or Redis - whatever the FESTIFY_RESPONSE_CACHE
+alias points at; local memory evicts least-recently-used entries past
+MAX_ENTRIES).
+
+Ticket purchases change counters with conditional UPDATEs and fire no
+signals, so cached event payloads get `tickets_sold`/`remaining_tickets`
+overlaid from a separate short-TTL inventory cache instead of being
+invalidated on every sale.
+"""
+import hashlib
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'COUNTS_TTL': 2,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[get_config()['ALIAS']]
+
+
+def is_shared(cache):
+    """False for backends that each worker process keeps to itself."""
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+# ============================================
+# VERSION COUNTERS
+# ============================================
+
+def _version_key(entity):
+    return f'festify:version:{entity}'
+
+
+def bump(*entities):
+    cache = get_cache()
+    for entity in entities:
+        key = _version_key(entity)
+        if not cache.add(key, 2, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Evicted between add() and incr(); any fresh value works
+                # as long as it differs from what keys were built with.
+                cache.set(key, 2, None)
+
+
+def ticket_version(user_id):
+    """The entity bumped when one user's tickets change."""
+    return f'ticket:user:{user_id}'
+
+
+def versions(*entities):
+    cache = get_cache()
+    keys = [_version_key(entity) for entity in entities]
+    found = cache.get_many(keys)
+    return [found.get(key, 1) for key in keys]
+
+
+def response_key(request, entities, prefix='festify:response'):
+    parts = [
+        request.get_host(),
+        request.path,
+        '&'.join(sorted(
+            f'{name}={value}' for name, values in request.GET.lists() for value in values
+        )),
+        date.today().isoformat(),
+        ','.join(f'{e}={v}' for e, v in zip(entities, versions(*entities))),
+    ]
+    digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+# ============================================
+# INVENTORY OVERLAY
+# ============================================
+
+def _counts_key(event_id):
+    return f'festify:counts:{event_id}'
+
+
+def inventory_counts(event_ids):
+    """{event_id: (capacity, sold)} from a short-TTL cache."""
+    from .models import Event
+
+    cache = get_cache()
+    keys = {event_id: _counts_key(event_id) for event_id in event_ids}
+    found = cache.get_many(list(keys.values()))
+    counts = {
+        event_id: found[key] for event_id, key in keys.items() if key in found
+    }
+
+    missing = [event_id for event_id in event_ids if event_id not in counts]
+    if missing:
+        fresh = {}
+        for event in Event.objects.filter(pk__in=missing).only('pk', 'capacity', 'tickets_sold', 'shard_count'):
+            fresh[event.pk] = (event.capacity, event.sold_count)
+        cache.set_many(
+            {_counts_key(event_id): value for event_id, value in fresh.items()},
+            get_config()['COUNTS_TTL'],
+        )
+        counts.update(fresh)
+    return counts
+
+
+def _has_counters(row):
+    return 'tickets_sold' in row or 'remaining_tickets' in row
+
+
+def overlay_inventory(rows):
+    """Refresh tickets_sold/remaining_tickets on serialized event dicts."""
+    rows = [row for row in rows if 'id' in row and _has_counters(row)]
+    if not rows:
+        return
+    counts = inventory_counts([row['id'] for row in rows])
+    for row in rows:
+        if row['id'] in counts:
+            capacity, sold = counts[row['id']]
+            if 'tickets_sold' in row:
+                row['tickets_sold'] = sold
+            if 'remaining_tickets' in row:
+                row['remaining_tickets'] = capacity - sold
+
+
+def overlayable(rows):
+    """False when counters were rendered without the id to refresh them by."""
+    return all('id' in row or not _has_counters(row) for row in rows)
+
+
+def _event_rows(data):
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return data['results']
+    if isinstance(data, list):
+        return data
+    return [data] if isinstance(data, dict) else []
+
+
+# ============================================
+# VIEW HELPERS
+# ============================================
+
+class CachedResponseMixin:
+    """
+    Cache list/retrieve payloads of a DRF viewset. `cache_dependencies`
+    maps the action to the entities it reads; `{pk}` is filled from the URL.
+    Set `overlay_inventory = True` for event payloads.
+    """
+    cache_dependencies = {}
+    overlay_inventory = False
+
+    def cached_response(self, request, action, render):
+        entities = self.cache_dependencies.get(action)
+        if entities is None:
+            return render()
+
+        entities = [entity.format(**self.kwargs) for entity in entities]
+        cache = get_cache()
+        key = response_key(request, entities)
+        data = cache.get(key)
+        if data is None:
+            response = render()
+            if response.status_code == 200 and (
+                not self.overlay_inventory or overlayable(_event_rows(response.data))
+            ):
+                cache.set(key, response.data, get_config()['TIMEOUT'])
+            return response
+
+        if self.overlay_inventory:
+            overlay_inventory(_event_rows(data))
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        parent = super().list
+        return self.cached_response(request, 'list', lambda: parent(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super().retrieve
+        return self.cached_response(request, 'retrieve', lambda: parent(request, *args, **kwargs))
+
+
+def cache_page_versioned(*entities):
+    """Cache a rendered HTML page until one of `entities` changes."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+            key = response_key(request, entities, prefix='festify:page')
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']), get_config()['TIMEOUT'])
+            return response
+        return wrapper
+    return decorator
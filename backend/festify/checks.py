@@ -0,0 +1,38 @@
+"""
+System checks for settings that only break once there are several workers.
+"""
+from django.core.checks import Warning, register
+
+from . import authentication, caching, revocation
+
+
+@register()
+def check_claims_cache(app_configs, **kwargs):
+    if authentication.get_config()['TRUST_CLAIMS'] is not True:
+        return []
+    if caching.is_shared(caching.get_cache()):
+        return []
+    return [Warning(
+        "FESTIFY_AUTH['TRUST_CLAIMS'] is True but the festify cache alias is "
+        "local to each process, so a worker keeps trusting the claims of a "
+        "user changed through another worker.",
+        hint="Point FESTIFY_RESPONSE_CACHE['ALIAS'] at a shared cache, or "
+             "use 'shared-cache' for TRUST_CLAIMS.",
+        id='festify.W001',
+    )]
+
+
+@register()
+def check_revocation_cache(app_configs, **kwargs):
+    if revocation.get_config()['USE_FILTER'] is not True:
+        return []
+    if caching.is_shared(caching.get_cache()):
+        return []
+    return [Warning(
+        "FESTIFY_REVOCATION['USE_FILTER'] is True but the festify cache alias "
+        "is local to each process, so a token revoked through one worker "
+        "keeps refreshing through the others.",
+        hint="Point FESTIFY_RESPONSE_CACHE['ALIAS'] at a shared cache, or "
+             "use 'shared-cache' for USE_FILTER.",
+        id='festify.W002',
+    )]
@@ -0,0 +1,274 @@
+"""
+Compiled read-only rendering for hot serializers.
+
+DRF's Serializer.to_representation walks `_readable_fields` for every row,
+and every field goes through the generic get_attribute machinery (source
+resolution, callable checks, PKOnlyObject wrapping). For list endpoints
+rendering dozens of events with nested artists that bookkeeping costs more
+than the data itself.
+
+`builder_for(serializer_class)` walks the declared fields once per process
+and returns a flat function turning one instance into the same dict:
+plain model attributes are read with operator.attrgetter, foreign keys
+behind PrimaryKeyRelatedField read their `<name>_id` column, nested
+serializers recurse into their own builders, and each value goes through
+the field's own to_representation so formatting is unchanged (datetimes
+and file URLs are formatted inline, resolving the active timezone once
+per render instead of once per value). Anything the
+fast path cannot mirror exactly (dotted sources, model methods, missing
+attributes) falls back to the field's get_attribute. Serializers using
+fields that depend on the request beyond FileField URLs (hyperlinks,
+SerializerMethodField) are not compiled and render the normal way.
+
+Serializers opt in with CompiledSerializerMixin; FESTIFY_COMPILED_SERIALIZERS
+switches the fast path off globally. Serializers restricted with
+`?fields=`/`?expand=` (festify.sparse_fields) get one builder per field spec.
+"""
+import datetime
+import operator
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.db import models
+from django.utils import timezone
+from rest_framework import ISO_8601, relations, serializers
+from rest_framework.fields import Field, SkipField
+from rest_framework.settings import api_settings
+
+from .instrumentation import TimedSerializerMixin
+from .sparse_fields import spec_kwargs
+
+# Fields whose output depends on more than the value itself.
+_UNSUPPORTED = (
+    relations.HyperlinkedRelatedField,
+    serializers.SerializerMethodField,
+    serializers.HiddenField,
+)
+
+
+def _model_attribute(model, name):
+    """attrgetter for a plain column/property of `model`, else None."""
+    if model is None:
+        return None
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        descriptor = getattr(model, name, None)
+        # Properties are safe to read directly; methods need DRF's
+        # callable handling.
+        return operator.attrgetter(name) if isinstance(descriptor, property) else None
+    if field.is_relation and (field.many_to_many or field.one_to_many):
+        return operator.attrgetter(name)
+    if field.is_relation and not field.concrete:
+        return None
+    return operator.attrgetter(name)
+
+
+class RenderState:
+    """Per-render inputs: the serializer context and the active timezone."""
+    __slots__ = ('context', '_timezone')
+
+    def __init__(self, context):
+        self.context = context
+        self._timezone = None
+
+    @property
+    def timezone(self):
+        # get_current_timezone() goes through asgiref's Local; look it up
+        # once per render rather than once per datetime value.
+        if self._timezone is None:
+            self._timezone = timezone.get_current_timezone()
+        return self._timezone
+
+
+def _file_representation(field):
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+    def represent(value, state):
+        # Mirrors FileField.to_representation with the render-time context.
+        if not value:
+            return None
+        if not use_url:
+            return value.name
+        try:
+            url = value.url
+        except AttributeError:
+            return None
+        request = state.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+    return represent
+
+
+def _datetime_representation(field):
+    """ISO 8601 output of aware datetimes in the active timezone."""
+    fallback = field.to_representation
+
+    def represent(value, state):
+        if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+            try:
+                value = value.astimezone(state.timezone).isoformat()
+            except OverflowError:
+                return fallback(value)
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return fallback(value)
+    return represent
+
+
+def _compiles_datetime(field):
+    return (
+        settings.USE_TZ
+        and type(field).to_representation is serializers.DateTimeField.to_representation
+        and type(field).enforce_timezone is serializers.DateTimeField.enforce_timezone
+        and not hasattr(field, 'timezone')
+        and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601
+    )
+
+
+def _pk_list(iterable):
+    # ManyRelatedField over a plain PrimaryKeyRelatedField.
+    return [item.pk for item in iterable]
+
+
+def _nested_list(build):
+    def represent(value, state):
+        iterable = value.all() if isinstance(value, models.manager.BaseManager) else value
+        return [build(item, state) for item in iterable]
+    return represent
+
+
+def _renders_generically(serializer_class):
+    """True unless the class customises to_representation itself."""
+    for klass in serializer_class.__mro__:
+        if klass in _PASS_THROUGH:
+            continue
+        if 'to_representation' in vars(klass):
+            return klass is serializers.Serializer
+    return False
+
+
+def _plan(serializer):
+    """[(name, getter, field, convert, takes_context)] or None."""
+    if not _renders_generically(type(serializer)):
+        return None
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    plan = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, _UNSUPPORTED):
+            return None
+
+        single_attr = len(field.source_attrs) == 1
+        getter = None
+        if single_attr and type(field).get_attribute is Field.get_attribute:
+            getter = _model_attribute(model, field.source)
+        convert, takes_context = field.to_representation, False
+
+        if isinstance(field, serializers.ListSerializer):
+            build = _build_for(field.child)
+            if build is None:
+                return None
+            convert, takes_context = _nested_list(build), True
+        elif isinstance(field, serializers.BaseSerializer):
+            build = _build_for(field)
+            if build is None:
+                return None
+            convert, takes_context = build, True
+        elif isinstance(field, relations.ManyRelatedField):
+            child = field.child_relation
+            if (type(child) is not relations.PrimaryKeyRelatedField or child.pk_field is not None
+                    or type(field).to_representation is not relations.ManyRelatedField.to_representation):
+                return None
+            getter, convert = None, _pk_list
+        elif isinstance(field, relations.RelatedField):
+            if not isinstance(field, relations.PrimaryKeyRelatedField) or field.pk_field is not None:
+                return None
+            try:
+                related = model._meta.get_field(field.source) if single_attr and model else None
+            except FieldDoesNotExist:
+                related = None
+            if related is None or not related.many_to_one:
+                return None
+            getter, convert = operator.attrgetter(related.attname), None
+        elif type(field).to_representation is serializers.FileField.to_representation:
+            convert, takes_context = _file_representation(field), True
+        elif _compiles_datetime(field):
+            convert, takes_context = _datetime_representation(field), True
+
+        plan.append((name, getter or field.get_attribute, field, convert, takes_context))
+    return plan
+
+
+def _build_for(serializer):
+    # The parent resolves `source`; the nested rendering only depends on
+    # the serializer class and its sparse-field spec.
+    spec = getattr(serializer, 'field_spec', None)
+    if spec is None:
+        return builder_for(type(serializer))
+    return _builder_for_spec(type(serializer), spec)
+
+
+@lru_cache(maxsize=None)
+def builder_for(serializer_class):
+    """Flat `build(instance, state) -> dict` for the class, or None."""
+    return _compile(serializer_class())
+
+
+@lru_cache(maxsize=256)
+def _builder_for_spec(serializer_class, field_spec):
+    # Specs come from query strings, hence the bounded cache.
+    return _compile(serializer_class(**spec_kwargs(*field_spec)))
+
+
+def _compile(serializer):
+    plan = _plan(serializer)
+    if plan is None:
+        return None
+    plan = tuple(plan)
+
+    def build(instance, state):
+        ret = {}
+        for name, getter, field, convert, takes_context in plan:
+            try:
+                value = getter(instance)
+            except SkipField:
+                continue
+            except (AttributeError, KeyError, ObjectDoesNotExist):
+                try:
+                    value = field.get_attribute(instance)
+                except SkipField:
+                    continue
+            if value is None or convert is None:
+                ret[name] = value
+            elif takes_context:
+                ret[name] = convert(value, state)
+            else:
+                ret[name] = convert(value)
+        return ret
+    return build
+
+
+def is_enabled():
+    return getattr(settings, 'FESTIFY_COMPILED_SERIALIZERS', True)
+
+
+class CompiledSerializerMixin:
+    """Render with the compiled builder when the serializer supports it."""
+
+    def to_representation(self, instance):
+        build = _build_for(self) if is_enabled() else None
+        if build is None:
+            return super().to_representation(instance)
+        # many=True renders every row through the same child instance, so
+        # the state is set up once per list.
+        state = self.__dict__.get('_render_state')
+        if state is None:
+            state = self._render_state = RenderState(self.context)
+        return build(instance, state)
+
+
+# Mixins that wrap to_representation without changing its output.
+_PASS_THROUGH = (CompiledSerializerMixin, TimedSerializerMixin)
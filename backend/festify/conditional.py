@@ -0,0 +1,164 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) for the event APIs.
+
+Validators are computed from one cheap aggregate query (MAX(updated_at),
+row counts, summed ticket counters) plus the response-cache version
+counters, which live in the cache rather than the database and also cover
+changes that leave updated_at alone, such as an event's lineup. When the
+client's If-None-Match still matches we answer 304 before running the real
+query or serializer.
+
+Last-Modified (MAX(updated_at)) is sent for information only: ticket sales
+change the payload without touching updated_at, so 304s are decided on the
+ETag alone.
+
+Sharded events (see festify.purchases) sell without touching tickets_sold
+and report a count cached for a couple of seconds, which no aggregate here
+can match, so responses that include one get no validators. A purchase or
+refund moves only its buyer's 'ticket:user:<id>' version; other users'
+ETags follow the sales through the summed counters.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Q, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import caching
+from .models import Event, Ticket
+
+
+def make_etag(request, parts):
+    raw = '|'.join(str(part) for part in [request.get_full_path(), *parts])
+    return f'"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def evaluate(request, parts, last_modified=None):
+    """Return (not_modified_response_or_None, etag, last_modified_ts)."""
+    etag = make_etag(request, parts)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    not_modified = get_conditional_response(request, etag=etag)
+    return not_modified, etag, timestamp
+
+
+def set_validators(response, etag, timestamp):
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+# ============================================
+# VALIDATORS
+# ============================================
+
+
+def events_validators(queryset):
+    stats = queryset.order_by().aggregate(
+        latest=Max('updated_at'), count=Count('pk'), sold=Sum('tickets_sold'),
+        sharded=Count('pk', filter=Q(shard_count__gt=0)),
+    )
+    if stats['sharded']:
+        return None
+    # Lineup changes (event.artists) touch no updated_at, only the version.
+    parts = [stats['latest'], stats['count'], stats['sold'],
+             *caching.versions('event', 'artist')]
+    return parts, stats['latest']
+
+
+def event_validators(pk):
+    row = Event.objects.filter(pk=pk).values_list('updated_at', 'tickets_sold', 'shard_count').first()
+    if row is None or row[2]:
+        return None
+    parts = [*row[:2], *caching.versions(f'event:{pk}', 'artist')]
+    return parts, row[0]
+
+
+def user_events_validators(user):
+    """Covers the user's tickets, the events behind them and hosted events."""
+    stats = Ticket.objects.filter(user=user).aggregate(
+        count=Count('pk'),
+        latest_purchase=Max('purchase_datetime'),
+        latest_event=Max('event__updated_at'),
+        sold=Sum('event__tickets_sold'),
+        sharded=Count('pk', filter=Q(event__shard_count__gt=0)),
+    )
+    if stats['sharded']:
+        return None
+    parts = [user.username, user.email, *stats.values(),
+             *caching.versions('event', 'artist', caching.ticket_version(user.pk))]
+    return parts, stats['latest_event']
+
+
+def profile_validators(user):
+    stats = User.objects.filter(pk=user.pk).aggregate(
+        organizer=Count('profile', filter=Q(profile__is_organizer=True)),
+        ticket_count=Count('tickets', distinct=True),
+        latest_purchase=Max('tickets__purchase_datetime'),
+        latest_ticket_event=Max('tickets__event__updated_at'),
+        ticket_sold=Sum('tickets__event__tickets_sold'),
+        hosted_count=Count('hosted_events', distinct=True),
+        latest_hosted=Max('hosted_events__updated_at'),
+        hosted_sold=Sum('hosted_events__tickets_sold'),
+        sharded=Count('tickets', filter=Q(tickets__event__shard_count__gt=0), distinct=True)
+        + Count('hosted_events', filter=Q(hosted_events__shard_count__gt=0), distinct=True),
+    )
+    if stats['sharded']:
+        return None
+    latest = max(
+        (value for value in (stats['latest_ticket_event'], stats['latest_hosted']) if value),
+        default=None,
+    )
+    parts = [user.username, user.email, *stats.values(),
+             *caching.versions('event', 'artist', caching.ticket_version(user.pk))]
+    return parts, latest
+
+
+# ============================================
+# VIEW HELPERS
+# ============================================
+
+class ConditionalGetMixin:
+    """
+    Answer 304 for unchanged list/retrieve responses. Viewsets implement
+    `get_validators(action)` returning (parts, last_modified) or None.
+    """
+
+    def get_validators(self, action):
+        return None
+
+    def conditional_response(self, request, action, render):
+        validators = self.get_validators(action)
+        if validators is None:
+            return render()
+        not_modified, etag, timestamp = evaluate(request, *validators)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(render(), etag, timestamp)
+
+    def list(self, request, *args, **kwargs):
+        parent = super().list
+        return self.conditional_response(request, 'list', lambda: parent(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super().retrieve
+        return self.conditional_response(request, 'retrieve', lambda: parent(request, *args, **kwargs))
+
+
+def conditional_get(get_validators):
+    """Function-view version; `get_validators(request, *args, **kwargs)`."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            validators = get_validators(request, *args, **kwargs)
+            if validators is None:
+                return view(request, *args, **kwargs)
+            not_modified, etag, timestamp = evaluate(request, *validators)
+            if not_modified is not None:
+                return not_modified
+            return set_validators(view(request, *args, **kwargs), etag, timestamp)
+        return wrapper
+    return decorator
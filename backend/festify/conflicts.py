@@ -0,0 +1,238 @@
+"""
+Schedule conflicts between performances: two sets on one stage at the same
+time, or one artist booked on two stages at once.
+
+A performance only has a time of day, and it happens on every day its event
+runs, so two sets can only clash if their events share a day (events
+without an end never close). Sets ending at or before their start time run
+past midnight. Times are seconds since midnight, and a late set's end is
+past 24h.
+
+Sets are grouped per stage and per artist into an `IntervalIndex`: the
+intervals sorted by start, with a running maximum of their ends. The sets
+overlapping [start, end) sit to the left of bisect(starts, end), and the
+walk back from there stops as soon as that running maximum is no later
+than `start`. So each lookup costs O(log n) plus the sets it has to look
+at, and a whole lineup is checked in O(n log n).
+
+`check()` validates unsaved slots (admin forms, inline formsets) against
+each other and against what is stored. The stored candidates are the sets
+on the same stages or of the same artists whose events overlap the slots'
+days, read with one query. `for_events()` reports every conflict of
+events' lineups, for the API and import_lineup.
+"""
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Performance
+
+DAY = 24 * 60 * 60
+REASONS = ('stage', 'artist')
+
+_FIELDS = (
+    'id', 'event_id', 'event__title', 'event__start_datetime', 'event__end_datetime',
+    'stage_id', 'stage__name', 'artist_id', 'artist__name', 'title', 'start_time', 'end_time',
+)
+
+
+class Slot(namedtuple('Slot', (
+    'id event_id event_title first_day last_day stage_id stage_name '
+    'artist_id artist_name title start_time end_time'
+))):
+    """One performance; `last_day` is None for events without an end."""
+
+    @property
+    def start(self):
+        return _seconds(self.start_time)
+
+    @property
+    def end(self):
+        end = _seconds(self.end_time)
+        return end + DAY if end <= self.start else end
+
+    @property
+    def label(self):
+        return self.title or self.artist_name
+
+    def plays_with(self, other, days=0):
+        """Whether `other` plays on some day `days` after one of this set's days."""
+        first = self.first_day + timedelta(days=days)
+        return (
+            (self.last_day is None or other.first_day <= self.last_day + timedelta(days=days))
+            and (other.last_day is None or first <= other.last_day)
+        )
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'event': self.event_id,
+            'title': self.label,
+            'stage': self.stage_id,
+            'artist': self.artist_id,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+        }
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _days(start, end):
+    tz = timezone.get_current_timezone()
+    first = start.astimezone(tz).date()
+    if end is None:
+        return first, None
+    return first, max(end.astimezone(tz).date(), first)
+
+
+def make_slot(pk, event, stage, artist, title, start_time, end_time):
+    """A Slot for an unsaved performance (pk None) from model instances."""
+    first_day, last_day = _days(event.start_datetime, event.end_datetime)
+    return Slot(
+        pk, event.pk, event.title, first_day, last_day, stage.pk, stage.name,
+        artist.pk, artist.name, title, start_time, end_time,
+    )
+
+
+def _slots(queryset):
+    for (pk, event_id, event_title, event_start, event_end, stage_id, stage_name,
+         artist_id, artist_name, title, start_time, end_time) in queryset.values_list(*_FIELDS):
+        first_day, last_day = _days(event_start, event_end)
+        yield Slot(pk, event_id, event_title, first_day, last_day, stage_id, stage_name,
+                   artist_id, artist_name, title, start_time, end_time)
+
+
+# ============================================
+# INTERVAL INDEX
+# ============================================
+
+class IntervalIndex:
+    """Half-open [start, end) intervals, each carrying a value."""
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.values = [value for _, _, value in intervals]
+        self.reach = []
+        furthest = None
+        for end in self.ends:
+            furthest = end if furthest is None else max(furthest, end)
+            self.reach.append(furthest)
+
+    def overlapping(self, start, end):
+        """Values of the intervals overlapping [start, end)."""
+        index = bisect_left(self.starts, end) - 1
+        while index >= 0 and self.reach[index] > start:
+            if self.ends[index] > start:
+                yield self.values[index]
+            index -= 1
+
+
+class ConflictIndex:
+    """IntervalIndexes of slots per stage and per artist."""
+
+    def __init__(self, slots):
+        grouped = {reason: {} for reason in REASONS}
+        for position, slot in enumerate(slots):
+            grouped['stage'].setdefault(slot.stage_id, []).append((slot.start, slot.end, position))
+            grouped['artist'].setdefault(slot.artist_id, []).append((slot.start, slot.end, position))
+        self.slots = slots
+        self.indexes = {
+            reason: {key: IntervalIndex(intervals) for key, intervals in groups.items()}
+            for reason, groups in grouped.items()
+        }
+
+    def clashes(self, position):
+        """(reason, position) of every slot clashing with slot `position`."""
+        slot = self.slots[position]
+        for reason in REASONS:
+            index = self.indexes[reason][getattr(slot, f'{reason}_id')]
+            # Sets repeat daily, so a late set also meets the next morning's:
+            # shifted back a day, this set is compared with the next day's.
+            for days in (-1, 0, 1):
+                shift = days * DAY
+                for other in index.overlapping(slot.start + shift, slot.end + shift):
+                    if other != position and slot.plays_with(self.slots[other], -days):
+                        yield reason, other
+
+
+def find(slots, others=()):
+    """Conflicts of `slots` with each other and with `others`."""
+    slots = list(slots)
+    index = ConflictIndex(slots + list(others))
+    seen = set()
+    conflicts = []
+    for position, slot in enumerate(slots):
+        for reason, other in index.clashes(position):
+            pair = (reason, min(position, other), max(position, other))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            conflicts.append({
+                'type': reason,
+                reason: getattr(slot, f'{reason}_id'),
+                'performances': [slot, index.slots[other]],
+            })
+    return conflicts
+
+
+# ============================================
+# STORED PERFORMANCES
+# ============================================
+
+def stored_candidates(slots, exclude=()):
+    """Stored performances that could clash with `slots`."""
+    if not slots:
+        return []
+    first = min(slot.first_day for slot in slots)
+    lasts = [slot.last_day for slot in slots]
+    queryset = (
+        Performance.objects
+        .filter(Q(stage_id__in={slot.stage_id for slot in slots})
+                | Q(artist_id__in={slot.artist_id for slot in slots}))
+        .exclude(pk__in={*exclude, *(slot.id for slot in slots if slot.id is not None)})
+        # Late sets spill into the morning after an event's last day.
+        .filter(Q(event__end_datetime__isnull=True)
+                | Q(event__end_datetime__gte=_midnight(first - timedelta(days=1))))
+    )
+    if None not in lasts:
+        queryset = queryset.filter(event__start_datetime__lt=_midnight(max(lasts) + timedelta(days=2)))
+    return list(_slots(queryset))
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def check(slots, exclude=()):
+    """Conflicts of unsaved `slots` with each other and with stored performances."""
+    slots = list(slots)
+    return find(slots, stored_candidates(slots, exclude))
+
+
+def for_events(event_ids):
+    """Every conflict of the performances of `event_ids`."""
+    slots = list(_slots(Performance.objects.filter(event_id__in=event_ids).order_by('id')))
+    return check(slots)
+
+
+def describe(conflict):
+    """A conflict with its performances as plain dicts, for JSON."""
+    return {**conflict, 'performances': [slot.describe() for slot in conflict['performances']]}
+
+
+def message(conflict):
+    """One line for a validation error or a command's output."""
+    slot, other = conflict['performances']
+    where = f'on {slot.stage_name}' if conflict['type'] == 'stage' else f'for {slot.artist_name}'
+    return (
+        f'{slot.label} ({slot.start_time:%H:%M}-{slot.end_time:%H:%M}) overlaps '
+        f'{other.label} ({other.start_time:%H:%M}-{other.end_time:%H:%M}, '
+        f'{other.event_title}) {where}'
+    )
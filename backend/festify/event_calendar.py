@@ -0,0 +1,145 @@
+"""
+Per-day event buckets for the calendar page and /api/calendar/.
+
+`days(first, last)` reads the events overlapping a window with one range
+query on the start_datetime index: everything starting inside the window,
+plus events starting earlier by at most the longest event's duration that
+are still running when it opens. The longest duration is one aggregate,
+cached until the 'event' version counter moves. Only id, title and the two
+timestamps are read, and each day gets its event count and its first
+DAY_LIMIT events by start time as {id, title}, so a month with thousands
+of events never builds model instances or full serializer rows.
+
+Summaries are cached per window under the same 'event' version counter
+(see festify.caching). The API's ETag is built from that counter, the
+resolved window and `window_stats()`, one aggregate over the same rows.
+"""
+import calendar
+from datetime import MAXYEAR, MINYEAR, date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, DurationField, ExpressionWrapper, F, FloatField, Func, Max, Q
+from django.utils import timezone
+
+from . import caching
+from .models import Event
+
+DEFAULTS = {
+    'DAY_LIMIT': 20,   # events listed per day; `count` covers the rest
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_CALENDAR', {})}
+
+
+def _check_year(year):
+    # _bounds() needs the day after the window, and time zone conversion a
+    # day either side of it, which the first and last years cannot give.
+    if not MINYEAR < year < MAXYEAR:
+        raise ValueError(f'year must be between {MINYEAR + 1} and {MAXYEAR - 1}')
+
+
+def month_window(year, month):
+    _check_year(year)
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def week_window(year, week):
+    """Monday to Sunday of ISO week `week` of `year`."""
+    _check_year(year)
+    monday = date.fromisocalendar(year, week, 1)
+    return monday, monday + timedelta(days=6)
+
+
+def _bounds(first, last):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(first, time.min), tz),
+        timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min), tz),
+    )
+
+
+def longest_event():
+    """The longest end - start of any event, cached per 'event' version."""
+    cache = caching.get_cache()
+    key = f"festify:calendar:span:{caching.versions('event')[0]}"
+    span = cache.get(key)
+    if span is None:
+        span = _longest_span()
+        cache.set(key, span, caching.get_config()['TIMEOUT'])
+    return span
+
+
+def _longest_span():
+    events = Event.objects.filter(end_datetime__isnull=False)
+    if connection.vendor == 'sqlite':
+        # Django subtracts datetimes on SQLite with a Python function per
+        # row; julianday() stays in SQL and is ~15x faster. The second of
+        # slack covers float rounding.
+        days = events.aggregate(days=Max(
+            Func(F('end_datetime'), function='JULIANDAY', output_field=FloatField())
+            - Func(F('start_datetime'), function='JULIANDAY', output_field=FloatField())
+        ))['days']
+        span = timedelta(days=days) + timedelta(seconds=1) if days is not None else None
+    else:
+        span = events.aggregate(span=Max(
+            ExpressionWrapper(F('end_datetime') - F('start_datetime'), output_field=DurationField())
+        ))['span']
+    return max(span or timedelta(0), timedelta(0))
+
+
+def overlapping(first, last):
+    """(id, title, start, end) of events on any day from `first` to `last`."""
+    start, end = _bounds(first, last)
+    events = Event.objects.filter(start_datetime__lt=end)
+    try:
+        events = events.filter(start_datetime__gte=start - longest_event())
+    except OverflowError:
+        pass   # an event longer than the years before the window; no lower bound
+    return (
+        events
+        .filter(Q(start_datetime__gte=start) | Q(end_datetime__gte=start))
+        .order_by('start_datetime', 'id')
+        .values_list('id', 'title', 'start_datetime', 'end_datetime')
+    )
+
+
+def window_stats(first, last):
+    """{'latest': MAX(updated_at), 'count'} of the events `days()` would bucket."""
+    return overlapping(first, last).order_by().aggregate(latest=Max('updated_at'), count=Count('pk'))
+
+
+def _bucket(first, last, limit):
+    length = (last - first).days + 1
+    counts = [0] * length
+    listed = [[] for _ in range(length)]
+    tz = timezone.get_current_timezone()
+    for pk, title, start, end in overlapping(first, last):
+        start_day = start.astimezone(tz).date()
+        end_day = max(end.astimezone(tz).date(), start_day) if end else start_day
+        for index in range(max((start_day - first).days, 0),
+                           min((end_day - first).days, length - 1) + 1):
+            counts[index] += 1
+            if len(listed[index]) < limit:
+                listed[index].append({'id': pk, 'title': title})
+    return [
+        {'date': first + timedelta(days=index), 'count': counts[index], 'events': listed[index]}
+        for index in range(length)
+    ]
+
+
+def days(first, last):
+    """[{'date', 'count', 'events': [{'id', 'title'}, ...]}] for each day."""
+    limit = get_config()['DAY_LIMIT']
+    cache = caching.get_cache()
+    key = (
+        f'festify:calendar:{first}:{last}:{limit}:{timezone.get_current_timezone_name()}:'
+        f"{caching.versions('event')[0]}"
+    )
+    summary = cache.get(key)
+    if summary is None:
+        summary = _bucket(first, last, limit)
+        cache.set(key, summary, caching.get_config()['TIMEOUT'])
+    return summary
@@ -0,0 +1,96 @@
+"""
+Grid index and distance queries for Event latitude/longitude.
+
+The globe is cut into CELL_DEGREES x CELL_DEGREES cells and every event
+stores the integer id of its cell in `Event.geo_cell` (kept up to date in
+Event.save). A radius query turns its bounding box into the set of covered
+cells, fetches only the coordinates of events in those cells through the
+geo_cell index, and ranks them by exact haversine distance. k-nearest
+queries grow the radius until k events are known to be closest.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+CELL_DEGREES = 0.1
+ROWS = int(round(180 / CELL_DEGREES))
+COLUMNS = int(round(360 / CELL_DEGREES))
+# Past this many cells a latitude/longitude range scan is cheaper.
+MAX_CELLS = 2500
+
+
+def cell_for(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    row = min(int((latitude + 90) // CELL_DEGREES), ROWS - 1)
+    column = int(((longitude + 180) % 360) // CELL_DEGREES)
+    return row * COLUMNS + column
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng); longitudes may leave [-180, 180]."""
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(latitude))
+    dlng = 180.0 if cos_lat < 1e-6 else min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    return (
+        max(latitude - dlat, -90.0), min(latitude + dlat, 90.0),
+        longitude - dlng, longitude + dlng,
+    )
+
+
+def cells_for_box(min_lat, max_lat, min_lng, max_lng):
+    """Cell ids covering the box, or None when there are too many to list."""
+    first_row = int((min_lat + 90) // CELL_DEGREES)
+    last_row = min(int((max_lat + 90) // CELL_DEGREES), ROWS - 1)
+    first_col = int((min_lng + 180) // CELL_DEGREES)
+    last_col = int((max_lng + 180) // CELL_DEGREES)
+    columns = min(last_col - first_col + 1, COLUMNS)
+    if (last_row - first_row + 1) * columns > MAX_CELLS:
+        return None
+    return [
+        row * COLUMNS + (first_col + offset) % COLUMNS
+        for row in range(first_row, last_row + 1)
+        for offset in range(columns)
+    ]
+
+
+def _candidates(queryset, latitude, longitude, radius_km):
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    cells = cells_for_box(min_lat, max_lat, min_lng, max_lng)
+    if cells is not None:
+        queryset = queryset.filter(geo_cell__in=cells)
+    else:
+        queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    return queryset.exclude(longitude=None).values_list('pk', 'latitude', 'longitude')
+
+
+def within(queryset, latitude, longitude, radius_km, limit=None):
+    """[(event_id, distance_km)] inside the radius, nearest first."""
+    hits = []
+    for pk, lat, lng in _candidates(queryset, latitude, longitude, radius_km):
+        distance = haversine_km(latitude, longitude, lat, lng)
+        if distance <= radius_km:
+            hits.append((pk, distance))
+    hits.sort(key=lambda hit: hit[1])
+    return hits[:limit] if limit else hits
+
+
+def nearest(queryset, latitude, longitude, k, max_radius_km):
+    """The k nearest [(event_id, distance_km)] no further than max_radius_km."""
+    radius = min(CELL_DEGREES * KM_PER_DEGREE, max_radius_km)
+    while True:
+        hits = within(queryset, latitude, longitude, radius)
+        # Everything inside `radius` has been seen, so once k hits are in
+        # it they are the true k nearest.
+        if len(hits) >= k or radius >= max_radius_km:
+            return hits[:k]
+        radius = min(radius * 2, max_radius_km)
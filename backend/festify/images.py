@@ -0,0 +1,201 @@
+"""
+Resized variants of event images, in WebP with a JPEG fallback.
+
+Every VARIANTS entry is a width; an image narrower than that is not
+enlarged, just re-encoded. Variants are stored under
+
+    <DIRECTORY>/<content hash>/<variant>-<width>.<webp|jpg>
+
+in the default storage. The hash is of the original file's bytes
+(Event.image_hash, set by Event.save() together with the original's size),
+so a URL always names the same bytes: a new upload gets new URLs, and a
+changed width changes the file name. Responses can be cached forever.
+
+After an event with a new image is saved, `schedule()` queues the variants
+on a thread pool of WORKERS threads once the transaction commits (Pillow
+releases the GIL while it resizes and encodes), so create and update only
+pay for hashing the upload. A variant that does not exist yet (the pool is
+still busy, the process restarted, the storage was wiped, or EAGER is off)
+is made on its first request by the `image_variant` view, which serves the
+MEDIA_URL path of the variants; put it behind the web server's media
+location as the fallback for missing files.
+
+`Event.image_variants` is what the serializers render: for each variant its
+size and URL per format, plus a `srcset` string per format. URLs are the
+storage's, so relative to MEDIA_URL unless that is absolute.
+"""
+import hashlib
+import io
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'VARIANTS': {'thumbnail': 160, 'card': 480, 'full': 1600},   # name -> width
+    'DIRECTORY': 'event_images/variants',
+    'WEBP_QUALITY': 80,
+    'JPEG_QUALITY': 82,
+    'WORKERS': 2,
+    'EAGER': True,   # make variants on upload, not only on first request
+}
+
+# Format -> (file extension, Pillow format)
+FORMATS = {'webp': ('webp', 'WEBP'), 'jpeg': ('jpg', 'JPEG')}
+EXTENSIONS = {extension: name for name, (extension, _) in FORMATS.items()}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_IMAGES', {})}
+
+
+def inspect(file):
+    """(content hash, width, height) of an image file, or None if it is not one."""
+    digest = hashlib.blake2b(digest_size=8)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    try:
+        # Only the header is read here.
+        with Image.open(file) as image:
+            width, height = image.size
+            if _rotated(image):
+                width, height = height, width
+    except (UnidentifiedImageError, OSError):
+        return None
+    finally:
+        file.seek(0)
+    return digest.hexdigest(), width, height
+
+
+def _rotated(image):
+    # EXIF orientations 5-8 turn the image a quarter, swapping its sides.
+    return image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+
+
+def _scaled(width, height, target):
+    if width <= target:
+        return width, height
+    return target, max(1, round(height * target / width))
+
+
+def variant_name(digest, variant, width, extension):
+    return f"{get_config()['DIRECTORY']}/{digest}/{variant}-{width}.{extension}"
+
+
+def variants_for(event):
+    """{'<variant>': {width, height, webp, jpeg}, 'srcset': {webp, jpeg}}, or None."""
+    if not event.image or not event.image_hash:
+        return None
+    variants = {}
+    srcset = {name: [] for name in FORMATS}
+    for variant, target in get_config()['VARIANTS'].items():
+        width, height = _scaled(event.image_width, event.image_height, target)
+        entry = variants[variant] = {'width': width, 'height': height}
+        for name, (extension, _) in FORMATS.items():
+            url = default_storage.url(variant_name(event.image_hash, variant, target, extension))
+            entry[name] = url
+            srcset[name].append(f'{url} {width}w')
+    variants['srcset'] = {name: ', '.join(urls) for name, urls in srcset.items()}
+    return variants
+
+
+# ============================================
+# GENERATION
+# ============================================
+
+def _encode(image, name):
+    pillow_format = FORMATS[name][1]
+    config = get_config()
+    buffer = io.BytesIO()
+    if pillow_format == 'JPEG':
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(buffer, 'JPEG', quality=config['JPEG_QUALITY'], optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=config['WEBP_QUALITY'], method=4)
+    return buffer.getvalue()
+
+
+def _store(name, content):
+    saved = default_storage.save(name, ContentFile(content))
+    if saved != name:
+        # Another worker wrote it first; the storage kept both under new names.
+        default_storage.delete(saved)
+
+
+def generate(digest, source, only=None):
+    """
+    Writes the missing variants of the image stored at `source`, or only
+    the (variant, format) pair `only`. Returns the names written.
+    """
+    config = get_config()
+    wanted = []
+    for variant, target in sorted(config['VARIANTS'].items(), key=lambda item: -item[1]):
+        for name, (extension, _) in FORMATS.items():
+            if only is not None and only != (variant, name):
+                continue
+            path = variant_name(digest, variant, target, extension)
+            if not default_storage.exists(path):
+                wanted.append((target, name, path))
+    if not wanted:
+        return []
+
+    with default_storage.open(source, 'rb') as file, Image.open(file) as original:
+        # JPEGs can decode at a half, quarter or eighth of their size, as
+        # long as that still covers the widest variant.
+        rotated = _rotated(original)
+        width, height = original.size[::-1] if rotated else original.size
+        needed = _scaled(width, height, wanted[0][0])
+        needed = (needed[0], math.ceil(needed[0] * height / width))
+        original.draft('RGB', needed[::-1] if rotated else needed)
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            # Palette and greyscale images would resize with nearest-neighbour.
+            transparent = 'transparency' in image.info or image.mode in ('LA', 'PA')
+            image = image.convert('RGBA' if transparent else 'RGB')
+        written = []
+        # Widest first, each resize starting from the previous (smaller) one.
+        for target, name, path in wanted:
+            size = _scaled(image.width, image.height, target)
+            if size != image.size:
+                image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+            _store(path, _encode(image, name))
+            written.append(path)
+    return written
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=get_config()['WORKERS'], thread_name_prefix='festify-images')
+        return _pool
+
+
+def _generate_in_worker(digest, source):
+    try:
+        generate(digest, source)
+    except Exception:
+        # The first request for a variant tries again.
+        logger.exception('Could not make the variants of %s', source)
+
+
+def schedule(event):
+    """Queue the variants of `event`'s image once the current transaction commits."""
+    if not get_config()['EAGER'] or not event.image or not event.image_hash:
+        return
+    digest, source = event.image_hash, event.image.name
+    transaction.on_commit(lambda: _get_pool().submit(_generate_in_worker, digest, source))
@@ -0,0 +1,412 @@
+"""
+Bulk lineup import behind `manage.py import_lineup`.
+
+Input is a stream of records tagged with a `type` (artist, stage, event or
+performance) read row by row from CSV (one column per field plus `type`;
+blank cells are ignored) or JSON Lines files; a `.json` file holding one
+array is loaded whole. Records are matched on natural keys, so running the
+same import twice updates rows in place and creates nothing new:
+
+    artist       name
+    stage        name
+    event        title + start_datetime
+    performance  event (title) + event_start + stage + artist + start_time
+
+Records are buffered per type, de-duplicated by key (later values win) and
+written a batch at a time in one transaction with bulk_create/bulk_update;
+only rows whose values changed are updated. Artist, stage and event ids
+are remembered by key for the rest of the run, and names referenced but
+never defined (an event's `artists`, a performance's `stage`) are created
+bare. Every performing artist is also added to its event's lineup; lineup
+links go straight into the through table and are only ever added.
+
+Bulk writes fire no model signals, so each batch does their work itself:
+geo cells, search documents, sync change log and cache version counters.
+
+Overlapping sets are not rejected, since the rows are already written
+batch by batch; finish() lists the stage and artist conflicts of every
+event whose performances changed (see festify.conflicts) in `conflicts`.
+"""
+import csv
+import json
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import caching, conflicts, geo, search, sync
+from .models import Artist, Event, Performance, Stage
+from .purchases import rebalance_shards
+
+# Dependency order: a batch of any type flushes the types before it first.
+TYPES = ('artist', 'stage', 'event', 'performance')
+MODELS = {'artist': Artist, 'stage': Stage, 'event': Event, 'performance': Performance}
+
+# Columns a record may set besides its key.
+FIELDS = {
+    'artist': ('genre', 'description', 'image_url'),
+    'stage': ('location', 'order'),
+    'event': (
+        'description', 'end_datetime', 'location_name', 'address',
+        'latitude', 'longitude', 'ticket_price', 'capacity',
+    ),
+    'performance': ('title', 'end_time', 'description'),
+}
+# Columns a new row cannot do without.
+REQUIRED = {
+    'event': ('host_id', 'description', 'location_name', 'address', 'ticket_price', 'capacity'),
+    'performance': ('end_time',),
+}
+
+LIST_SEPARATOR = '|'
+
+
+class LineupError(Exception):
+    """A record that cannot be imported; the message says where it is."""
+
+
+# ============================================
+# INPUT
+# ============================================
+
+def read_records(path):
+    """(location, record) pairs from a CSV, JSON Lines or JSON array file."""
+    with open(path, newline='', encoding='utf-8') as handle:
+        if path.endswith('.csv'):
+            reader = csv.DictReader(handle)
+            for row in reader:
+                record = {name: value for name, value in row.items()
+                          if name is not None and value not in (None, '')}
+                yield f'{path}:{reader.line_num}', record
+        elif path.endswith('.json'):
+            for number, record in enumerate(json.load(handle), start=1):
+                yield f'{path}[{number}]', record
+        elif path.endswith(('.jsonl', '.ndjson')):
+            for number, line in enumerate(handle, start=1):
+                if line.strip():
+                    yield f'{path}:{number}', json.loads(line)
+        else:
+            raise LineupError(f'{path}: expected a .csv, .json, .jsonl or .ndjson file')
+
+
+def _coerce(model, name, value, where):
+    field = model._meta.get_field(name)
+    if value is None:
+        return '' if field.empty_strings_allowed and not field.null else None
+    try:
+        value = field.to_python(value)
+    except ValidationError as exc:
+        raise LineupError(f'{where}: {name}: {" ".join(exc.messages)}')
+    if isinstance(field, models.DateTimeField) and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def _required(record, name, where):
+    value = record.get(name)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise LineupError(f'{where}: missing {name}')
+    return value.strip() if isinstance(value, str) else value
+
+
+def _names(value):
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    return [name.strip() for name in value if name.strip()]
+
+
+# ============================================
+# IMPORTER
+# ============================================
+
+class LineupImporter:
+    """Feed records with add(), then call finish(); see the module docstring."""
+
+    def __init__(self, default_host=None, batch_size=1000):
+        self.batch_size = batch_size
+        self.stats = {label: Counter() for label in (*TYPES, 'lineup')}
+        self._pending = {label: {} for label in TYPES}
+        self._ids = {label: {} for label in ('artist', 'stage', 'event')}
+        self._hosts = {}
+        self._lineup = {}            # (event key, artist name) -> location
+        self._touched_events = set()
+        self._scheduled_events = set()  # events whose performances were written
+        self._dirty = set()          # cache version counters to bump
+        self._default_host = self._host_id(default_host, '--host') if default_host else None
+        self.conflicts = []
+
+    def add(self, where, record, record_type=None):
+        label = str(record.get('type') or record_type or '').strip().lower()
+        if label not in TYPES:
+            raise LineupError(f'{where}: unknown record type {label!r}')
+        model = MODELS[label]
+        values = {name: _coerce(model, name, record[name], where)
+                  for name in FIELDS[label] if name in record}
+        key = getattr(self, f'_{label}_key')(record, values, where)
+
+        pending = self._pending[label]
+        if key in pending:
+            pending[key][0].update(values)
+        else:
+            pending[key] = (values, where)
+        if len(pending) >= self.batch_size:
+            self.flush(label)
+
+    def finish(self):
+        self.flush(TYPES[-1])
+        if self._scheduled_events:
+            self.conflicts = conflicts.for_events(sorted(self._scheduled_events))
+        return self.stats
+
+    def flush(self, label):
+        """Write pending records of `label` and of every type it depends on."""
+        with transaction.atomic():
+            for step in TYPES[:TYPES.index(label) + 1]:
+                getattr(self, f'_flush_{step}')()
+            if self._touched_events:
+                event_ids = sorted(self._touched_events)
+                self._touched_events = set()
+                search.index_events(event_ids)
+                sync.record('event', event_ids)
+                self._dirty.update(f'event:{pk}' for pk in event_ids)
+                self._dirty.add('event')
+        if self._dirty:
+            caching.bump(*sorted(self._dirty))
+            self._dirty = set()
+
+    # -- keys --------------------------------------------------------------
+
+    def _artist_key(self, record, values, where):
+        return _required(record, 'name', where)
+
+    _stage_key = _artist_key
+
+    def _event_key(self, record, values, where):
+        title = _required(record, 'title', where)
+        start = _coerce(Event, 'start_datetime', _required(record, 'start_datetime', where), where)
+        if record.get('host'):
+            values['host_id'] = self._host_id(record['host'], where)
+        for name in _names(record.get('artists') or ()):
+            self._lineup.setdefault(((title, start), name), where)
+        return title, start
+
+    def _performance_key(self, record, values, where):
+        event = (
+            _required(record, 'event', where),
+            _coerce(Event, 'start_datetime', _required(record, 'event_start', where), where),
+        )
+        artist = _required(record, 'artist', where)
+        self._lineup.setdefault((event, artist), where)
+        return (
+            event,
+            _required(record, 'stage', where),
+            artist,
+            _coerce(Performance, 'start_time', _required(record, 'start_time', where), where),
+        )
+
+    def _host_id(self, username, where):
+        if username not in self._hosts:
+            host_id = User.objects.filter(username=username).values_list('pk', flat=True).first()
+            if host_id is None:
+                raise LineupError(f'{where}: no user named {username!r}')
+            self._hosts[username] = host_id
+        return self._hosts[username]
+
+    # -- lookups -----------------------------------------------------------
+
+    def _named_ids(self, label, names):
+        """name -> pk for `names`, creating bare rows for unknown ones."""
+        model, ids = MODELS[label], self._ids[label]
+        missing = set(names) - ids.keys()
+        if missing:
+            # Duplicate names in the table resolve to the oldest row.
+            found = model.objects.filter(name__in=missing).order_by('-pk').values_list('pk', 'name')
+            ids.update((name, pk) for pk, name in found)
+            new = [model(name=name) for name in sorted(missing - ids.keys())]
+            if new:
+                model.objects.bulk_create(new, batch_size=self.batch_size)
+                ids.update((obj.name, obj.pk) for obj in new)
+                self._written(label, new)
+                self.stats[label]['created'] += len(new)
+        return ids
+
+    def _event_ids(self, refs):
+        """(title, start) -> pk for every key of `refs` (key -> location)."""
+        ids = self._ids['event']
+        missing = [key for key in refs if key not in ids]
+        if missing:
+            found = (
+                Event.objects
+                .filter(title__in={title for title, _ in missing},
+                        start_datetime__in={start for _, start in missing})
+                .order_by('-pk')
+                .values_list('pk', 'title', 'start_datetime')
+            )
+            ids.update(((title, start), pk) for pk, title, start in found)
+        for key in missing:
+            if key not in ids:
+                raise LineupError(f'{refs[key]}: no event {key[0]!r} starting {key[1].isoformat()}')
+        return ids
+
+    # -- writes ------------------------------------------------------------
+
+    def _take(self, label):
+        pending, self._pending[label] = self._pending[label], {}
+        return pending
+
+    def _diff(self, label, pending, existing, key_fields):
+        """Split pending records into new objects and changed existing ones."""
+        model = MODELS[label]
+        new, changed, fields = [], [], set()
+        for key, (values, where) in pending.items():
+            obj = existing.get(key)
+            if obj is None:
+                if label == 'event' and 'host_id' not in values and self._default_host:
+                    values['host_id'] = self._default_host
+                missing = [name for name in REQUIRED.get(label, ()) if values.get(name) is None]
+                if missing:
+                    missing = ', '.join(name.removesuffix('_id') for name in missing)
+                    raise LineupError(f'{where}: a new {label} needs {missing}')
+                new.append(model(**key_fields(key), **values))
+                continue
+            diff = {name: value for name, value in values.items() if getattr(obj, name) != value}
+            if diff:
+                for name, value in diff.items():
+                    setattr(obj, name, value)
+                fields.update(diff)
+                changed.append(obj)
+        self.stats[label]['unchanged'] += len(pending) - len(new) - len(changed)
+        return new, changed, fields
+
+    def _write(self, label, new, changed, fields):
+        model = MODELS[label]
+        model.objects.bulk_create(new, batch_size=self.batch_size)
+        if changed:
+            model.objects.bulk_update(changed, sorted(fields), batch_size=self.batch_size)
+        self.stats[label]['created'] += len(new)
+        self.stats[label]['updated'] += len(changed)
+        self._written(label, new + changed)
+
+    def _written(self, label, objects):
+        if not objects:
+            return
+        if label == 'event':
+            self._touched_events.update(obj.pk for obj in objects)
+        else:
+            sync.record(label, [obj.pk for obj in objects])
+            self._dirty.add(label)
+
+    def _flush_named(self, label):
+        pending = self._take(label)
+        if not pending:
+            return
+        existing = {}
+        for obj in MODELS[label].objects.filter(name__in=pending).order_by('-pk'):
+            existing[obj.name] = obj
+        new, changed, fields = self._diff(label, pending, existing, lambda name: {'name': name})
+        self._write(label, new, changed, fields)
+        self._ids[label].update((obj.name, obj.pk) for obj in (*existing.values(), *new))
+        return changed
+
+    def _flush_artist(self):
+        changed = self._flush_named('artist')
+        if changed:
+            # Event search documents and sync rows embed artist details.
+            self._touched_events.update(
+                Event.artists.through.objects
+                .filter(artist_id__in=[artist.pk for artist in changed])
+                .values_list('event_id', flat=True)
+            )
+
+    def _flush_stage(self):
+        self._flush_named('stage')
+
+    def _flush_event(self):
+        pending = self._take('event')
+        if pending:
+            existing = {}
+            events = (
+                Event.objects
+                .filter(title__in={title for title, _ in pending},
+                        start_datetime__in={start for _, start in pending})
+                .order_by('-pk')
+            )
+            for event in events:
+                existing[(event.title, event.start_datetime)] = event
+            new, changed, fields = self._diff(
+                'event', pending, existing,
+                lambda key: {'title': key[0], 'start_datetime': key[1]},
+            )
+            now = timezone.now()
+            for event in (*new, *changed):
+                event.geo_cell = geo.cell_for(event.latitude, event.longitude)
+            for event in changed:
+                event.updated_at = now
+            if changed:
+                fields.update(('geo_cell', 'updated_at'))
+            self._write('event', new, changed, fields)
+            if 'capacity' in fields:
+                for event in changed:
+                    if event.shard_count:
+                        rebalance_shards(event)
+            self._ids['event'].update(
+                ((event.title, event.start_datetime), event.pk)
+                for event in (*existing.values(), *new)
+            )
+        self._link_lineup()
+
+    def _link_lineup(self):
+        pairs, self._lineup = self._lineup, {}
+        if not pairs:
+            return
+        event_ids = self._event_ids({event: where for (event, _), where in pairs.items()})
+        artist_ids = self._named_ids('artist', {name for _, name in pairs})
+        wanted = {(event_ids[event], artist_ids[name]) for event, name in pairs}
+
+        through = Event.artists.through
+        linked = set(
+            through.objects
+            .filter(event_id__in={event_id for event_id, _ in wanted})
+            .values_list('event_id', 'artist_id')
+        )
+        links = sorted(wanted - linked)
+        through.objects.bulk_create(
+            [through(event_id=event_id, artist_id=artist_id) for event_id, artist_id in links],
+            batch_size=self.batch_size, ignore_conflicts=True,
+        )
+        self.stats['lineup']['created'] += len(links)
+        self._touched_events.update(event_id for event_id, _ in links)
+
+    def _flush_performance(self):
+        pending = self._take('performance')
+        if not pending:
+            return
+        event_ids = self._event_ids({key[0]: where for key, (_, where) in pending.items()})
+        stage_ids = self._named_ids('stage', {key[1] for key in pending})
+        artist_ids = self._named_ids('artist', {key[2] for key in pending})
+        resolved = {
+            (event_ids[event], stage_ids[stage], artist_ids[artist], start): item
+            for (event, stage, artist, start), item in pending.items()
+        }
+
+        existing = {}
+        performances = (
+            Performance.objects
+            .filter(event_id__in={key[0] for key in resolved},
+                    stage_id__in={key[1] for key in resolved},
+                    artist_id__in={key[2] for key in resolved},
+                    start_time__in={key[3] for key in resolved})
+            .order_by('-pk')
+        )
+        for performance in performances:
+            key = (performance.event_id, performance.stage_id, performance.artist_id,
+                   performance.start_time)
+            existing[key] = performance
+        new, changed, fields = self._diff(
+            'performance', resolved, existing,
+            lambda key: dict(zip(('event_id', 'stage_id', 'artist_id', 'start_time'), key)),
+        )
+        self._write('performance', new, changed, fields)
+        self._scheduled_events.update(performance.event_id for performance in (*new, *changed))
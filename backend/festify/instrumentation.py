@@ -0,0 +1,202 @@
+"""
+Per-request query, DB time, serializer time and latency instrumentation.
+
+`InstrumentationMiddleware` wraps every request in a connection execute
+wrapper, records the numbers into per-route histograms (served on the
+admin-only stats endpoint) and, with DEBUG on, adds them as X-* response
+headers. Views can declare query budgets: exceeding one raises
+`QueryBudgetExceeded` when FESTIFY_ENFORCE_QUERY_BUDGETS is set (so tests
+fail) and logs a warning otherwise.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds (or queries); the last bucket is open-ended.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+METRICS = ('latency_ms', 'db_ms', 'serializer_ms', 'queries')
+
+_current = contextvars.ContextVar('festify_request_stats', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given percentile."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS[index] if index < len(BUCKETS) else None
+        return None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip([str(b) for b in BUCKETS] + ['inf'], self.counts)),
+        }
+
+
+class RouteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, values):
+        with self._lock:
+            histograms = self._routes.setdefault(route, {m: Histogram() for m in METRICS})
+            for metric, value in values.items():
+                histograms[metric].add(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: {metric: h.as_dict() for metric, h in histograms.items()}
+                for route, histograms in self._routes.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_stats = RouteStats()
+
+
+# ============================================
+# SERIALIZER TIMING
+# ============================================
+
+class TimedSerializerMixin:
+    """Adds time spent in the outermost to_representation to the request stats."""
+
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None:
+            return super().to_representation(instance)
+
+        outermost = not stats.serializer_depth
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            if outermost:
+                stats.serializer_time += time.perf_counter() - start
+
+
+# ============================================
+# QUERY BUDGETS
+# ============================================
+
+def query_budget(limit):
+    """Declare the most queries a function view may run per request."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def _budget_for(view_func, method):
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is not None:
+        return budget
+    # DRF viewsets: `query_budgets = {'list': 3, ...}` keyed by action name.
+    view_class = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower())
+    if view_class is not None and action:
+        return getattr(view_class, 'query_budgets', {}).get(action)
+    return None
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        latency = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+
+        route = match.route or match.view_name
+        route_stats.record(route, {
+            'latency_ms': latency * 1000,
+            'db_ms': stats.db_time * 1000,
+            'serializer_ms': stats.serializer_time * 1000,
+            'queries': stats.queries,
+        })
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(stats.queries)
+            response['X-DB-Time-ms'] = f'{stats.db_time * 1000:.2f}'
+            response['X-Serializer-Time-ms'] = f'{stats.serializer_time * 1000:.2f}'
+            response['X-Response-Time-ms'] = f'{latency * 1000:.2f}'
+
+        budget = _budget_for(match.func, request.method)
+        if budget is not None and stats.queries > budget:
+            message = f'{request.method} {route} ran {stats.queries} queries (budget {budget})'
+            if getattr(settings, 'FESTIFY_ENFORCE_QUERY_BUDGETS', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
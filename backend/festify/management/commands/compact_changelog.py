@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from festify.sync import compact
+
+class Command(BaseCommand):
+    help = 'Drops superseded sync change-log entries and expires old tombstones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tombstone-days', type=int, default=None,
+                            help='Expire tombstones older than this (default: FESTIFY_SYNC TOMBSTONE_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        superseded, expired = compact(
+            tombstone_days=options['tombstone_days'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {superseded} superseded entries and {expired} expired tombstones'
+        ))
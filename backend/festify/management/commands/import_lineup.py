@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from festify.conflicts import message
+from festify.imports import TYPES, LineupError, LineupImporter, read_records
+
+class Command(BaseCommand):
+    help = 'Imports artists, stages, events and performances from CSV or JSON files (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', metavar='path')
+        parser.add_argument('--type', choices=TYPES, default=None,
+                            help='Record type for rows without a "type" column')
+        parser.add_argument('--host', default=None,
+                            help='Username hosting new events that name no host')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be 1 or more')
+
+        started = time.perf_counter()
+        count = 0
+        try:
+            importer = LineupImporter(default_host=options['host'], batch_size=options['batch_size'])
+            for path in options['paths']:
+                for where, record in read_records(path):
+                    importer.add(where, record, options['type'])
+                    count += 1
+            stats = importer.finish()
+        except (LineupError, OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        for label, counts in stats.items():
+            if label == 'lineup':
+                self.stdout.write(f"lineup: {counts['created']} links added")
+            elif counts:
+                self.stdout.write(
+                    f"{label}: {counts['created']} created, {counts['updated']} updated, "
+                    f"{counts['unchanged']} unchanged"
+                )
+        if importer.conflicts:
+            self.stdout.write(self.style.WARNING(f'{len(importer.conflicts)} schedule conflicts:'))
+            for conflict in importer.conflicts:
+                self.stdout.write(f'  {message(conflict)}')
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {count} records in {elapsed:.1f}s ({rate:,.0f} rows/s)'
+        ))
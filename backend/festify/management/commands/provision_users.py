@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from festify.accounts import AccountError, Provisioner, get_config
+from festify.imports import LineupError, read_records
+
+class Command(BaseCommand):
+    help = 'Creates accounts for ticket holders from CSV or JSON files of email, username and password (safe to re-run)'
+
+    def add_arguments(self, parser):
+        config = get_config()
+        parser.add_argument('paths', nargs='+', metavar='path')
+        parser.add_argument('--iterations', type=int, default=config['PASSWORD_ITERATIONS'],
+                            help='PBKDF2 rounds for imported passwords; raised to the default on first login')
+        parser.add_argument('--workers', type=int, default=config['WORKERS'],
+                            help='Threads hashing passwords')
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'])
+
+    def handle(self, *args, **options):
+        for name in ('iterations', 'workers', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be 1 or more")
+
+        started = time.perf_counter()
+        count = 0
+        provisioner = Provisioner(
+            iterations=options['iterations'], workers=options['workers'], batch_size=options['batch_size'],
+        )
+        try:
+            for path in options['paths']:
+                for where, record in read_records(path):
+                    provisioner.add(where, record)
+                    count += 1
+            stats = provisioner.finish()
+        except (AccountError, LineupError, OSError, ValueError) as exc:
+            provisioner.pool.shutdown()
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {stats['created']} accounts, skipped {stats['skipped']} existing, "
+            f"from {count} records in {elapsed:.1f}s ({rate:,.0f} rows/s)"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from festify.revocation import prune
+
+class Command(BaseCommand):
+    help = 'Deletes expired outstanding and blacklisted JWT refresh tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be 1 or more')
+        outstanding = blacklisted = 0
+        for removed, revoked in prune(batch_size=options['batch_size']):
+            outstanding += removed
+            blacklisted += revoked
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {outstanding} expired tokens, {blacklisted} of them blacklisted'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from festify import search
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index for all events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('This database has no search index; nothing to do'))
+            return
+
+        started = time.perf_counter()
+        indexed = search.rebuild_index(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} events in {elapsed:.1f}s'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from festify.purchases import release_expired_holds
+
+class Command(BaseCommand):
+    help = 'Releases expired ticket holds and returns their seats to inventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired holds'))
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from festify import benchmarks
+
+class Command(BaseCommand):
+    help = 'Benchmarks the hot endpoints against seeded data and writes the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(benchmarks.SCENARIOS),
+                            help='Run only this scenario (repeatable; default: all)')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--url', default=None,
+                            help='Benchmark a running server (e.g. http://127.0.0.1:8000) instead of the test client')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the response cache before every request')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--compare', default=None, metavar='RESULTS_JSON',
+                            help='Print changes against an earlier results file')
+
+    def handle(self, *args, **options):
+        try:
+            results = benchmarks.run(
+                scenarios=options['scenario'], requests=options['requests'],
+                warmup=options['warmup'], base_url=options['url'], cold=options['cold'],
+            )
+        except (ValueError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        for name, result in results['scenarios'].items():
+            latency, queries = result['latency_ms'], result['queries']
+            self.stdout.write(
+                f"{name:16} p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms  "
+                f"p99 {latency['p99']:8.2f} ms  {result['throughput_rps']:8.1f} req/s  "
+                f"queries {queries['mean'] if queries else '-':>4}  {result['statuses']}"
+            )
+
+        with open(options['output'], 'w') as handle:
+            json.dump(results, handle, indent=2)
+            handle.write('\n')
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+            self.stdout.write(f"Against {options['compare']} ({baseline['meta'].get('commit')}):")
+            for line in benchmarks.compare(baseline, results):
+                self.stdout.write(f'  {line}')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from festify import benchmarks
+
+class Command(BaseCommand):
+    help = 'Generates skewed synthetic users, events, artists, stages, performances and tickets for benchmarks'
+
+    def add_arguments(self, parser):
+        for name, default in benchmarks.DEFAULTS.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously seeded benchmark data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            benchmarks.clear()
+        elif benchmarks.is_seeded():
+            raise CommandError('Benchmark data already exists; pass --clear to replace it')
+        if min(options[name] for name in ('users', 'events', 'artists', 'stages')) < 1:
+            raise CommandError('--users, --events, --artists and --stages must be 1 or more')
+
+        started = time.perf_counter()
+        counts = benchmarks.seed(**{name: options[name] for name in benchmarks.DEFAULTS})
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary} in {elapsed:.1f}s'))
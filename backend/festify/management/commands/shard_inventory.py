@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from festify.models import Event
+from festify.purchases import set_shard_count
+
+class Command(BaseCommand):
+    help = 'Splits an event\'s ticket inventory across N counter rows (0 turns sharding off)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument('--shards', type=int, default=8)
+
+    def handle(self, *args, **options):
+        if options['shards'] < 0:
+            raise CommandError('--shards must be 0 or more')
+
+        try:
+            event = Event.objects.get(pk=options['event_id'])
+        except Event.DoesNotExist:
+            raise CommandError(f"Event {options['event_id']} does not exist")
+
+        event = set_shard_count(event, options['shards'])
+        if event.shard_count:
+            self.stdout.write(self.style.SUCCESS(
+                f'{event.title}: inventory split across {event.shard_count} shards'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{event.title}: sharding disabled'))
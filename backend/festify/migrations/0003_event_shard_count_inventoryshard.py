@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('festify', '0002_stage_artist_image_url_performance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='InventoryShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('capacity', models.IntegerField(default=0)),
+                ('sold', models.IntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_shards', to='festify.event')),
+            ],
+            options={
+                'unique_together': {('event', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE festify_event_search USING fts5("
+            "title, artists, location, description, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        schema_editor.execute(
+            "INSERT INTO festify_event_search (rowid, title, artists, location, description) "
+            "SELECT e.id, e.title, "
+            "COALESCE((SELECT group_concat(a.name || ' ' || a.genre, ' ') "
+            "FROM festify_event_artists ea JOIN festify_artist a ON a.id = ea.artist_id "
+            "WHERE ea.event_id = e.id), ''), "
+            "e.location_name || ' ' || e.address, e.description "
+            "FROM festify_event e"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE festify_event_search ("
+            "event_id bigint PRIMARY KEY REFERENCES festify_event (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX festify_event_search_document ON festify_event_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO festify_event_search (event_id, document) "
+            "SELECT e.id, "
+            "setweight(to_tsvector('simple', e.title), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE((SELECT string_agg(a.name || ' ' || a.genre, ' ') "
+            "FROM festify_event_artists ea JOIN festify_artist a ON a.id = ea.artist_id "
+            "WHERE ea.event_id = e.id), '')), 'B') || "
+            "setweight(to_tsvector('simple', e.location_name || ' ' || e.address), 'C') || "
+            "setweight(to_tsvector('simple', e.description), 'D') "
+            "FROM festify_event e"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS festify_event_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('festify', '0004_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:04
+
+from django.db import migrations, models
+
+from festify.geo import cell_for
+
+
+def fill_geo_cells(apps, schema_editor):
+    Event = apps.get_model('festify', 'Event')
+    events = list(Event.objects.exclude(latitude=None).exclude(longitude=None))
+    for event in events:
+        event.geo_cell = cell_for(event.latitude, event.longitude)
+    Event.objects.bulk_update(events, ['geo_cell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('festify', '0005_event_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_geo_cells, migrations.RunPython.noop),
+    ]
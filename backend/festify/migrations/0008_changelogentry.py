@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-17 06:16
+
+from django.db import migrations, models
+
+
+def seed_changelog(apps, schema_editor):
+    # Existing rows predate the signal receivers; log them so that cursor 0
+    # replays the whole catalogue.
+    ChangeLogEntry = apps.get_model('festify', 'ChangeLogEntry')
+    for label, model_name in (('event', 'Event'), ('artist', 'Artist'),
+                              ('stage', 'Stage'), ('performance', 'Performance')):
+        ids = apps.get_model('festify', model_name).objects.order_by('pk').values_list('pk', flat=True)
+        ChangeLogEntry.objects.bulk_create(
+            [ChangeLogEntry(model=label, object_id=pk, action='upsert') for pk in ids.iterator()],
+            batch_size=1000,
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('festify', '0007_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted'), ('compact', 'Compacted')], max_length=7)),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id', 'id'], name='changelog_object_idx'), models.Index(fields=['action', 'object_id'], name='changelog_action_idx')],
+            },
+        ),
+        migrations.RunPython(seed_changelog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicates(apps, schema_editor):
+    # The index below cannot be built over emails that differ only in case;
+    # name them rather than fail on a bare IntegrityError.
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    duplicates = list(
+        User.objects.exclude(email='')
+        .values(email_key=Lower('email'))
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('email_key', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Merge or change these accounts before migrating, their emails differ only in case: '
+            + ', '.join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('festify', '0008_changelogentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        # Same SQL on SQLite and PostgreSQL. Accounts without an email get
+        # their id as the second column so they never collide. It is not a
+        # partial index because SQLite only uses those when the query
+        # repeats the WHERE clause with literals, and festify.accounts
+        # filters on LOWER(email) alone.
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_lower_uniq ON auth_user "
+            "(LOWER(email), (CASE WHEN email = '' THEN id ELSE 0 END))",
+            'DROP INDEX auth_user_email_lower_uniq',
+        ),
+    ]
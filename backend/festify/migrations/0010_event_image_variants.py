@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:59
+
+from django.db import migrations, models
+
+from festify.images import inspect
+
+
+def fill_image_hashes(apps, schema_editor):
+    Event = apps.get_model('festify', 'Event')
+    events = []
+    for event in Event.objects.exclude(image='').exclude(image=None):
+        try:
+            with event.image.open('rb'):
+                found = inspect(event.image)
+        except OSError:
+            # Missing from storage; the next save of the event retries.
+            continue
+        if found:
+            event.image_hash, event.image_width, event.image_height = found
+            events.append(event)
+    Event.objects.bulk_update(events, ['image_hash', 'image_width', 'image_height'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('festify', '0009_user_email_lower_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_image_hashes, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from . import geo, images
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -18,6 +20,12 @@ class Artist(models.Model):
     # + add optional image_url so it also works with the other code
     image_url = models.URLField(blank=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination order for ArtistViewSet
+            models.Index(fields=['name', 'id'], name='artist_name_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -32,20 +40,96 @@ class Event(models.Model):
     address = models.CharField(max_length=300)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # Grid cell of (latitude, longitude) for "near me" lookups; see festify.geo.
+    geo_cell = models.IntegerField(null=True, blank=True, editable=False, db_index=True)
     image = models.ImageField(upload_to='event_images/', blank=True, null=True)
+    # Content hash and size of `image`, naming its resized variants; see festify.images.
+    image_hash = models.CharField(max_length=16, blank=True, editable=False, db_index=True)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
     artists = models.ManyToManyField(Artist, blank=True, related_name='events')
     ticket_price = models.DecimalField(max_digits=10, decimal_places=2)
     capacity = models.IntegerField()
     tickets_sold = models.IntegerField(default=0)
+    # 0 keeps inventory on the tickets_sold column; N > 0 spreads it over
+    # N InventoryShard rows so hot events don't serialize on a single row.
+    shard_count = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Columns read by the computed attributes below, so query_plans can
+    # restrict rows with .only() without deferring them.
+    property_columns = {
+        'sold_count': ('tickets_sold', 'shard_count'),
+        'remaining_tickets': ('capacity', 'tickets_sold', 'shard_count'),
+        'image_variants': ('image', 'image_hash', 'image_width', 'image_height'),
+    }
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order for EventViewSet
+            models.Index(fields=['start_datetime', 'id'], name='event_start_id_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.geo_cell = geo.cell_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & {*update_fields}:
+            update_fields = kwargs['update_fields'] = {*update_fields, 'geo_cell'}
+        checks_image = update_fields is None or 'image' in update_fields
+        if update_fields is not None and checks_image:
+            kwargs['update_fields'] = {*update_fields, 'image_hash', 'image_width', 'image_height'}
+        new_image = checks_image and bool(self.image) and (not self.image._committed or not self.image_hash)
+        if new_image:
+            self._inspect_image()
+        elif checks_image and not self.image:
+            self.image_hash, self.image_width, self.image_height = '', None, None
+        super().save(*args, **kwargs)
+        if new_image:
+            images.schedule(self)
+
+    def _inspect_image(self):
+        try:
+            found = images.inspect(self.image)
+        except OSError:
+            # Named but missing from storage.
+            found = None
+        finally:
+            if self.image._committed:
+                self.image.close()
+        self.image_hash, self.image_width, self.image_height = found or ('', None, None)
+
+    @property
+    def image_variants(self):
+        return images.variants_for(self)
+
+    @property
+    def sold_count(self):
+        if self.shard_count:
+            from .purchases import sharded_sold_count
+            return sharded_sold_count(self.pk)
+        return self.tickets_sold
+
     @property
     def remaining_tickets(self):
-        return self.capacity - self.tickets_sold
+        return self.capacity - self.sold_count
+
+
+class InventoryShard(models.Model):
+    """One slice of a sharded event's capacity; see festify.purchases."""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='inventory_shards')
+    index = models.PositiveSmallIntegerField()
+    capacity = models.IntegerField(default=0)
+    sold = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('event', 'index')
+
+    def __str__(self):
+        return f"{self.event.title} shard {self.index}: {self.sold}/{self.capacity}"
 
 
 class Ticket(models.Model):
@@ -60,6 +144,20 @@ class Ticket(models.Model):
         return f"{self.user.username} - {self.event.title}"
 
 
+class Reservation(models.Model):
+    """A seat held for a user until `expires_at` while they check out."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='reservations')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'event')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.event.title} (until {self.expires_at})"
+
+
 # === ADDED FROM THE OTHER FILE ===
 
 class Stage(models.Model):
@@ -90,3 +188,29 @@ class Performance(models.Model):
         # Your Event uses start_datetime instead of start_date
         date_str = self.event.start_datetime.date() if self.event.start_datetime else "?"
         return f"{label} - {self.stage} ({date_str} {self.start_time})"
+
+
+class ChangeLogEntry(models.Model):
+    """
+    One create/update/delete of a synced model, written by festify.signals.
+    The auto-increment id is the cursor clients pass to /api/sync/.
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    # Marker left by compaction: clients older than object_id must resync.
+    COMPACT = 'compact'
+    ACTION_CHOICES = [(UPSERT, 'Created or updated'), (DELETE, 'Deleted'), (COMPACT, 'Compacted')]
+
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=7, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'id'], name='changelog_object_idx'),
+            models.Index(fields=['action', 'object_id'], name='changelog_action_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model} {self.object_id}"
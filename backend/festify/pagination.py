@@ -0,0 +1,121 @@
+"""
+Keyset (cursor) pagination, selectable per request.
+
+`?paginate=cursor` (or any `?cursor=`) switches a list endpoint from
+PageNumberPagination to KeysetPagination. Pages are fetched with
+`WHERE (a, b) > (last_a, last_b) ORDER BY a, b LIMIT n + 1` over the view's
+`keyset_ordering`, which a composite index covers, so page 1000 costs the
+same as page 1. The total count is skipped unless the client asks for it
+with `?count=1`.
+
+Keyset pages can only follow `keyset_ordering`. Query parameters that
+order results their own way (a view's `ranked_query_params`, such as the
+event search's relevance order) are rejected with a 400 rather than
+silently re-sorted.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_size = api_settings.PAGE_SIZE
+
+    def encode_cursor(self, values):
+        raw = json.dumps([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor, model, ordering):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(ordering, values)
+            ]
+        except (ValueError, TypeError, DjangoValidationError):
+            # Bad base64 or JSON (both ValueErrors), a non-list, or values
+            # the fields can't parse.
+            raise NotFound('Invalid cursor')
+
+    def after(self, ordering, values):
+        """Q for rows strictly after `values` in ascending `ordering`."""
+        condition = Q()
+        for index in reversed(range(len(ordering))):
+            equal = {name: value for name, value in zip(ordering[:index], values[:index])}
+            condition = Q(**equal, **{f'{ordering[index]}__gt': values[index]}) | condition
+        # The redundant leading bound lets the database range-scan the index
+        # instead of evaluating the OR for every row.
+        return Q(**{f'{ordering[0]}__gte': values[0]}) & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        for param in getattr(view, 'ranked_query_params', ()):
+            if request.query_params.get(param):
+                raise ValidationError({param: 'Results ordered this way cannot be paged with a cursor.'})
+        self.ordering = list(view.keyset_ordering)
+        queryset = queryset.order_by(*self.ordering)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param):
+            self.count = queryset.count()
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.decode_cursor(cursor, queryset.model, self.ordering)
+            queryset = queryset.filter(self.after(self.ordering, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor([getattr(last, name) for name in self.ordering])
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+
+class SelectablePaginationMixin:
+    """Page-number pagination by default, keyset when the client opts in."""
+    keyset_pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
+    ranked_query_params = ()
+
+    def wants_keyset(self):
+        params = self.request.query_params
+        return params.get('paginate') == 'cursor' or 'cursor' in params
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.wants_keyset():
+                self._paginator = self.keyset_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
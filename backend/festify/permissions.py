@@ -1,12 +1,22 @@
 from rest_framework import permissions
 
+from .authentication import is_organizer
+
 class IsOrganizerAndOwner(permissions.BasePermission):
+    """
+    Organizers may create events; only the host may change them. Views can
+    list read-only actions that are host-only too in `owner_only_actions`.
+    """
+
+    def is_owner_only(self, view):
+        return getattr(view, 'action', None) in getattr(view, 'owner_only_actions', ())
+
     def has_permission(self, request, view):
-        if request.method == 'POST':
-            return request.user.is_authenticated and hasattr(request.user, 'profile') and request.user.profile.is_organizer
+        if request.method == 'POST' or self.is_owner_only(view):
+            return request.user.is_authenticated and is_organizer(request.user)
         return True
 
     def has_object_permission(self, request, view, obj):
-        if request.method in ['PUT', 'PATCH', 'DELETE']:
-            return obj.host == request.user
+        if request.method in ['PUT', 'PATCH', 'DELETE'] or self.is_owner_only(view):
+            return obj.host_id == request.user.pk
         return True
@@ -0,0 +1,299 @@
+"""
+Ticket purchase engine.
+
+Inventory is claimed with a single conditional UPDATE so concurrent buyers
+can never push `tickets_sold` past `capacity`, and the claim and the Ticket
+insert share one transaction so a failed insert gives the seat back.
+
+Hot events can opt into sharded inventory (`Event.shard_count > 0`): the
+capacity is split across InventoryShard rows, buyers pick one at random, and
+the remaining capacity is rebalanced across shards when one runs dry.
+
+Reservations hold a seat for a limited time: `reserve` claims inventory just
+like a purchase, `confirm` turns the hold into a Ticket without touching the
+counters again, and `release` (or the expiry sweeper) hands the seat back.
+Buying outright while holding a seat uses the held seat the same way.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Event, InventoryShard, Reservation, Ticket
+
+
+class PurchaseError(Exception):
+    """Base class for purchase failures that map to a 400 response."""
+    message = 'Ticket purchase failed'
+
+    def __str__(self):
+        return self.message
+
+
+class SoldOut(PurchaseError):
+    message = 'Event is sold out'
+
+
+class AlreadyHasTicket(PurchaseError):
+    message = 'You already have a ticket for this event'
+
+
+class NoTicket(PurchaseError):
+    message = 'You do not have a ticket for this event'
+
+
+class AlreadyReserved(PurchaseError):
+    message = 'You already have a hold on this event'
+
+
+class NoReservation(PurchaseError):
+    message = 'You do not have an active hold on this event'
+
+
+def claim_seat(event):
+    """Atomically take one seat; returns False when the event is full."""
+    if event.shard_count:
+        return _claim_sharded_seat(event)
+    claimed = Event.objects.filter(
+        pk=event.pk,
+        tickets_sold__lt=F('capacity'),
+    ).update(tickets_sold=F('tickets_sold') + 1)
+    return claimed == 1
+
+
+def release_seat(event, count=1):
+    """Atomically give seats back, never dropping below zero."""
+    if event.shard_count:
+        for _ in range(count):
+            _release_sharded_seat(event)
+        return
+    Event.objects.filter(
+        pk=event.pk,
+        tickets_sold__gt=0,
+    ).update(tickets_sold=Greatest(F('tickets_sold') - count, 0))
+
+
+# ============================================
+# SHARDED INVENTORY
+# ============================================
+
+def _inventory_cache_key(event_id):
+    return f'festify:inventory:{event_id}'
+
+
+def _claim_shard(event_id, index):
+    return InventoryShard.objects.filter(
+        event_id=event_id,
+        index=index,
+        sold__lt=F('capacity'),
+    ).update(sold=F('sold') + 1) == 1
+
+
+def _claim_sharded_seat(event):
+    if _claim_shard(event.pk, random.randrange(event.shard_count)):
+        return True
+
+    # The shard we landed on is dry: spread what is left evenly again and
+    # walk the shards that still have room.
+    rebalance_shards(event)
+    open_shards = list(
+        InventoryShard.objects
+        .filter(event_id=event.pk, sold__lt=F('capacity'))
+        .values_list('index', flat=True)
+    )
+    random.shuffle(open_shards)
+    return any(_claim_shard(event.pk, index) for index in open_shards)
+
+
+def _release_sharded_seat(event):
+    index = random.randrange(event.shard_count)
+    shards = InventoryShard.objects.filter(event_id=event.pk, sold__gt=0)
+    if shards.filter(index=index).update(sold=F('sold') - 1):
+        return
+    index = shards.values_list('index', flat=True).first()
+    if index is not None:
+        shards.filter(index=index).update(sold=F('sold') - 1)
+
+
+def sharded_sold_count(event_id):
+    """Aggregated sold count across shards, cached for a short TTL."""
+    key = _inventory_cache_key(event_id)
+    sold = cache.get(key)
+    if sold is None:
+        sold = InventoryShard.objects.filter(event_id=event_id).aggregate(
+            total=Sum('sold')
+        )['total'] or 0
+        cache.set(key, sold, getattr(settings, 'FESTIFY_INVENTORY_CACHE_TTL', 2))
+    return sold
+
+
+def rebalance_shards(event):
+    """Redistribute the event's unsold capacity evenly across its shards."""
+    with transaction.atomic():
+        capacity = Event.objects.select_for_update().values_list(
+            'capacity', flat=True
+        ).get(pk=event.pk)
+        shards = list(
+            InventoryShard.objects.select_for_update()
+            .filter(event_id=event.pk)
+            .order_by('index')
+        )
+        if not shards:
+            return
+        remaining = max(capacity - sum(shard.sold for shard in shards), 0)
+        share, extra = divmod(remaining, len(shards))
+        for shard in shards:
+            shard.capacity = shard.sold + share + (1 if shard.index < extra else 0)
+        InventoryShard.objects.bulk_update(shards, ['capacity'])
+
+
+def set_shard_count(event, shard_count):
+    """Switch an event between single-row (0) and sharded (N) inventory."""
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(pk=event.pk)
+        if event.shard_count:
+            sold = InventoryShard.objects.filter(event=event).aggregate(
+                total=Sum('sold')
+            )['total'] or 0
+        else:
+            sold = event.tickets_sold
+
+        InventoryShard.objects.filter(event=event).delete()
+        if shard_count:
+            # Everything sold so far lives on shard 0; the rebalance below
+            # hands out the unsold capacity.
+            InventoryShard.objects.bulk_create(
+                InventoryShard(event=event, index=index, sold=sold if index == 0 else 0)
+                for index in range(shard_count)
+            )
+        event.shard_count = shard_count
+        event.tickets_sold = sold
+        event.save(update_fields=['shard_count', 'tickets_sold'])
+        if shard_count:
+            rebalance_shards(event)
+
+    cache.delete(_inventory_cache_key(event.pk))
+    return event
+
+
+def purchase_ticket(user, event):
+    # Cheap pre-check so repeat buyers don't take a seat lock at all;
+    # the unique (user, event) constraint below is what actually enforces it.
+    if Ticket.objects.filter(user=user, event=event).exists():
+        raise AlreadyHasTicket()
+
+    try:
+        with transaction.atomic():
+            # The buyer's own hold already counts a seat: turn it into the
+            # ticket instead of claiming a second one. An expired hold the
+            # sweeper hasn't reached still counts, so it is used too.
+            held, _ = Reservation.objects.filter(user=user, event=event).delete()
+            if not held and not claim_seat(event):
+                raise SoldOut()
+            ticket = Ticket.objects.create(user=user, event=event)
+    except IntegrityError:
+        raise AlreadyHasTicket()
+
+    return ticket
+
+
+def refund_ticket(user, event):
+    with transaction.atomic():
+        deleted, _ = Ticket.objects.filter(user=user, event=event).delete()
+        if not deleted:
+            raise NoTicket()
+        release_seat(event)
+
+
+# ============================================
+# RESERVATIONS (HOLD -> CONFIRM)
+# ============================================
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, 'FESTIFY_HOLD_TTL', 600))
+
+
+def reserve_ticket(user, event):
+    if Ticket.objects.filter(user=user, event=event).exists():
+        raise AlreadyHasTicket()
+
+    # A stale hold the sweeper hasn't reached yet shouldn't block a retry.
+    release_expired_holds(Reservation.objects.filter(user=user, event=event))
+
+    try:
+        with transaction.atomic():
+            if not claim_seat(event):
+                raise SoldOut()
+            reservation = Reservation.objects.create(
+                user=user, event=event, expires_at=timezone.now() + hold_ttl()
+            )
+    except IntegrityError:
+        raise AlreadyReserved()
+
+    return reservation
+
+
+def confirm_reservation(user, event):
+    try:
+        with transaction.atomic():
+            deleted, _ = Reservation.objects.filter(
+                user=user, event=event, expires_at__gt=timezone.now()
+            ).delete()
+            if not deleted:
+                raise NoReservation()
+            # The seat was already claimed when the hold was placed.
+            ticket = Ticket.objects.create(user=user, event=event)
+    except IntegrityError:
+        raise AlreadyHasTicket()
+
+    return ticket
+
+
+def release_reservation(user, event):
+    with transaction.atomic():
+        deleted, _ = Reservation.objects.filter(user=user, event=event).delete()
+        if not deleted:
+            raise NoReservation()
+        release_seat(event)
+
+
+def release_expired_holds(queryset=None, batch_size=1000, now=None):
+    """
+    Delete expired holds in batches walking the expires_at index and give
+    their seats back with one counter update per event. Returns the number
+    of holds released.
+    """
+    now = now or timezone.now()
+    queryset = Reservation.objects.all() if queryset is None else queryset
+    expired = queryset.filter(expires_at__lte=now).order_by('expires_at')
+
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                expired.select_for_update(skip_locked=True)
+                .values_list('pk', 'event_id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            per_event = {}
+            for pk, event_id in batch:
+                per_event.setdefault(event_id, []).append(pk)
+            for event in Event.objects.filter(pk__in=per_event).only('pk', 'shard_count'):
+                # Only release what we actually deleted, in case the holder
+                # released or confirmed in the meantime.
+                deleted, _ = Reservation.objects.filter(pk__in=per_event[event.pk]).delete()
+                if deleted:
+                    release_seat(event, deleted)
+
+        released += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    return released
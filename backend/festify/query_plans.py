@@ -0,0 +1,176 @@
+"""
+Derive select_related / prefetch_related from a serializer's fields.
+
+Walking the declared fields tells us which relations a serializer will touch
+while rendering: nested single serializers and dotted sources such as
+`host.username` become joins, and nested `many=True` serializers become
+prefetches whose own querysets are planned the same way. Applying the plan
+keeps list endpoints at a constant number of queries whatever the page size.
+
+Serializers pruned with `?fields=`/`?expand=` also get `.only()` for the
+columns their remaining fields read, so dropped fields are never fetched.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from .sparse_fields import spec_kwargs
+
+
+def _related_field(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _source_joins(model, source_attrs):
+    """Yield the FK/one-to-one hops a dotted source walks through."""
+    path = []
+    for attr in source_attrs[:-1]:
+        field = _related_field(model, attr)
+        if field is None or field.many_to_many or field.one_to_many:
+            return
+        path.append(attr)
+        model = field.related_model
+        yield '__'.join(path)
+
+
+def _columns(model, source_attrs, prefix):
+    """
+    `.only()` paths a plain field reads, [] for relations stored elsewhere,
+    or None when they can't be known (methods, undeclared properties).
+    """
+    path = []
+    for attr in source_attrs[:-1]:
+        field = _related_field(model, attr)
+        if field is None or not field.concrete or field.many_to_many:
+            return None
+        path.append(attr)
+        model = field.related_model
+    name = source_attrs[-1]
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # Models list the columns behind their computed attributes.
+        depends_on = getattr(model, 'property_columns', {}).get(name)
+        if depends_on is None or path:
+            return None
+        return [prefix + column for column in depends_on]
+    if not field.concrete:
+        return [] if not path else None
+    hops = ['__'.join(path[:index + 1]) for index in range(len(path))]
+    return [prefix + column for column in hops + ['__'.join(path + [name])]]
+
+
+def build_plan(serializer, prefix='', restrict=None):
+    """
+    Returns (select_related paths, prefetch objects, only() paths) for a
+    serializer instance rendering rows of `serializer.Meta.model`.
+
+    Column restriction is planned for serializers pruned with
+    festify.sparse_fields (`field_spec`) and their nested serializers;
+    the only() paths are None otherwise, or when a field's columns can't
+    be determined.
+    """
+    if restrict is None:
+        restrict = getattr(serializer, 'field_spec', None) is not None
+    model = serializer.Meta.model
+    select, prefetch = [], []
+    columns = [] if restrict else None
+
+    def need(paths):
+        nonlocal columns
+        if columns is not None:
+            columns = None if paths is None else columns + paths
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            need(None)
+            continue
+        source_attrs = field.source_attrs
+
+        if isinstance(field, serializers.ListSerializer):
+            related = _related_field(model, field.source)
+            if related is not None and isinstance(field.child, serializers.ModelSerializer):
+                child = field.child
+                child_plan = build_plan(child, restrict=restrict)
+                if child_plan[2] is not None and related.one_to_many:
+                    # Prefetching matches rows on the child's FK column.
+                    child_plan = (*child_plan[:2], child_plan[2] + [related.field.name])
+                prefetch.append(Prefetch(
+                    prefix + field.source,
+                    queryset=apply_plan(child.Meta.model.objects.all(), child_plan),
+                ))
+            else:
+                need(None)
+        elif isinstance(field, serializers.ModelSerializer):
+            related = _related_field(model, field.source)
+            if related is not None and not (related.many_to_many or related.one_to_many):
+                select.append(prefix + field.source)
+                child_select, child_prefetch, child_columns = build_plan(
+                    field, prefix + field.source + '__', restrict=restrict
+                )
+                select.extend(child_select)
+                prefetch.extend(child_prefetch)
+                need([prefix + field.source] + (child_columns or []))
+            else:
+                need(None)
+        elif isinstance(field, serializers.ManyRelatedField):
+            related = _related_field(model, field.source)
+            if related is not None:
+                if restrict:
+                    # Only the keys are rendered.
+                    prefetch.append(Prefetch(
+                        prefix + field.source, queryset=related.related_model.objects.only('pk'),
+                    ))
+                else:
+                    prefetch.append(prefix + field.source)
+        else:
+            if len(source_attrs) > 1:
+                select.extend(prefix + path for path in _source_joins(model, source_attrs))
+            need(_columns(model, source_attrs, prefix))
+
+    return select, prefetch, columns
+
+
+@lru_cache(maxsize=None)
+def plan_for_class(serializer_class):
+    return build_plan(serializer_class())
+
+
+@lru_cache(maxsize=256)
+def plan_for_spec(serializer_class, field_spec):
+    # Specs come from query strings, hence the bounded cache.
+    return build_plan(serializer_class(**spec_kwargs(*field_spec)))
+
+
+def apply_plan(queryset, plan, keep=()):
+    select, prefetch, columns = plan
+    if select:
+        queryset = queryset.select_related(*dict.fromkeys(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if columns is not None:
+        queryset = queryset.only(*dict.fromkeys([*columns, *keep]))
+    return queryset
+
+
+def optimize_for_serializer(queryset, serializer, keep=()):
+    """
+    Apply the joins, prefetches and column restriction `serializer` (a
+    class or instance) needs. `keep` lists extra columns the caller reads
+    from restricted rows, e.g. pagination keys.
+    """
+    if isinstance(serializer, type):
+        plan = plan_for_class(serializer)
+    elif getattr(serializer, 'field_spec', None) is not None:
+        plan = plan_for_spec(type(serializer), serializer.field_spec)
+    else:
+        plan = build_plan(serializer)
+    return apply_plan(queryset, plan, keep)
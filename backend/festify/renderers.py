@@ -0,0 +1,54 @@
+"""
+JSON renderer backed by orjson, byte-for-byte compatible with DRF's.
+
+Select it through REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']. orjson is an
+optional dependency: without it, or for anything orjson would format
+differently from DRF's JSONRenderer, rendering falls back to the stock
+json.dumps path. Differences are limited to floats (orjson and repr()
+disagree on when to switch to exponent notation, so any output containing
+an exponent or a float below 1e-4 is redone), non-string dict keys, ints
+beyond 64 bits and lone surrogates (orjson refuses those), indented output
+and non-default UNICODE_JSON / COMPACT_JSON settings.
+
+One difference is kept: orjson writes NaN and Infinity as null, where
+JSONRenderer raises ValueError under STRICT_JSON. Finding them would mean
+walking the data, which costs as much as the stock renderer itself, so the
+API keeps them out instead: event coordinates are validated on the way in
+and /near/ rejects non-finite lat/lng.
+"""
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Float spellings that may differ from repr(): exponents and tiny decimals.
+# Matches inside strings only cost a fallback. Two patterns with literal
+# prefixes scan far faster than one alternation.
+_EXPONENT = re.compile(rb'e[-0-9]')
+_TINY_DECIMAL = re.compile(rb'0\.0000')
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if _EXPONENT.search(ret) or _TINY_DECIMAL.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same \u2028/\u2029 escaping as JSONRenderer.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
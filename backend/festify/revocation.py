@@ -0,0 +1,236 @@
+"""
+Refresh-token revocation with a Bloom filter in front of the blacklist.
+
+simplejwt checks the token_blacklist tables on every refresh and logout.
+`RevocableRefreshToken` asks an in-memory Bloom filter of the blacklisted
+JTIs first: a JTI the filter has never seen is certainly not revoked, so
+only the few tokens it reports (the revoked ones, plus ERROR_RATE of the
+rest) are looked up in the database.
+
+The filter is built from the unexpired blacklist, sized for CAPACITY tokens
+or twice what is there, whichever is more, and stored in the shared cache
+(see festify.caching for the alias), so other processes start from that
+copy and only read the rows added since. Revoking a token adds it to the
+local filter and, once committed, writes a new random stamp to the shared
+cache. Every check reads the stamps with one cache lookup, and a process
+whose stamp differs reads the blacklist rows past the last id it has seen,
+plus the SYNC_OVERLAP ids before it: ids are handed out when rows are
+inserted, not when they commit, so a row can appear below ids already read.
+`prune()` (the prune_tokens command) deletes expired outstanding and
+blacklisted tokens a batch at a time and changes a second stamp, which
+makes the next check rebuild the filter without the pruned JTIs. A cache
+flush loses the stamps, which also reads as a change, so the worst case is
+an extra sync.
+
+The stamps only tell processes apart when they share the cache. With
+USE_FILTER left at 'shared-cache', a per-process alias (local memory,
+dummy) skips the filter and checks the blacklist table on every refresh,
+as simplejwt does; set it to True only for a single process.
+"""
+import hashlib
+import math
+import struct
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import caching
+
+DEFAULTS = {
+    'CAPACITY': 1_000_000,   # revoked tokens the filter is sized for
+    'ERROR_RATE': 0.01,      # share of unrevoked tokens still checked in the DB
+    'SYNC_OVERLAP': 1000,    # ids below the last one seen that a sync reads again
+    'USE_FILTER': 'shared-cache',   # True, False or 'shared-cache'
+}
+
+CHANGED_KEY = 'festify:revocation:changed'
+PRUNED_KEY = 'festify:revocation:pruned'
+SNAPSHOT_KEY = 'festify:revocation:filter'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_REVOCATION', {})}
+
+
+class BloomFilter:
+    """A set of strings that answers "maybe" or "certainly not"."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        # One 64-byte blake2b digest gives up to 8 positions; more hashes
+        # would barely lower the error rate.
+        self.hashes = min(8, max(1, round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.hashes).digest()
+        return [value % self.size for value in struct.unpack(f'<{self.hashes}Q', digest)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+# ============================================
+# PER-PROCESS FILTER
+# ============================================
+
+class _Revoked:
+    def __init__(self, stamps):
+        self.stamps = stamps
+        self.last_id = 0
+        self.filter = None
+
+    def load(self):
+        """Start from the shared copy of the filter, or build and share one."""
+        snapshot = caching.get_cache().get(SNAPSHOT_KEY)
+        if snapshot is not None and self.stamps[1] is not None and snapshot[0] == self.stamps[1]:
+            _, self.last_id, self.filter = snapshot
+            self.sync()
+            return
+        self.build()
+        # A cache that refuses values this large just means every process builds.
+        caching.get_cache().set(SNAPSHOT_KEY, (self.stamps[1], self.last_id, self.filter), None)
+
+    def build(self):
+        """Fill a new filter from the unexpired blacklist."""
+        unexpired = Q(token__expires_at__gt=timezone.now())
+        totals = BlacklistedToken.objects.aggregate(count=Count('id', filter=unexpired), last=Max('id'))
+        config = get_config()
+        self.filter = BloomFilter(max(config['CAPACITY'], 2 * totals['count']), config['ERROR_RATE'])
+        self.last_id = totals['last'] or 0
+        jtis = (
+            BlacklistedToken.objects
+            .filter(unexpired, id__lte=self.last_id)
+            .values_list('token__jti', flat=True)
+            .iterator(chunk_size=10_000)
+        )
+        for jti in jtis:
+            self.filter.add(jti)
+
+    def sync(self):
+        """Add blacklist rows committed since the last load or sync."""
+        since = self.last_id - get_config()['SYNC_OVERLAP']
+        rows = BlacklistedToken.objects.filter(id__gt=since).values_list('id', 'token__jti')
+        for pk, jti in rows.order_by('id'):
+            # Rows read before are already in; only count the new ones.
+            if pk > self.last_id or jti not in self.filter:
+                self.filter.add(jti)
+            self.last_id = max(self.last_id, pk)
+        if self.filter.count > self.filter.capacity:
+            self.build()
+
+
+_revoked = None
+_lock = threading.Lock()
+
+
+def _stamps():
+    found = caching.get_cache().get_many([CHANGED_KEY, PRUNED_KEY])
+    return found.get(CHANGED_KEY), found.get(PRUNED_KEY)
+
+
+def revoked_filter():
+    """This process's filter, brought up to date with the shared stamps."""
+    global _revoked
+    stamps = _stamps()
+    with _lock:
+        if _revoked is None or _revoked.stamps[1] != stamps[1]:
+            # Stamps are read before the rows, so a revocation that lands
+            # in between changes them again and is picked up next time.
+            if stamps[1] is None:
+                # No stamp to tie a shared copy to (first run or flushed cache).
+                caching.get_cache().add(PRUNED_KEY, uuid.uuid4().hex, None)
+                stamps = _stamps()
+            revoked = _Revoked(stamps)
+            revoked.load()
+            _revoked = revoked
+        elif _revoked.stamps != stamps:
+            _revoked.sync()
+            _revoked.stamps = stamps
+        return _revoked.filter
+
+
+def reset():
+    global _revoked
+    with _lock:
+        _revoked = None
+
+
+def uses_filter():
+    use = get_config()['USE_FILTER']
+    if use == 'shared-cache':
+        return caching.is_shared(caching.get_cache())
+    return bool(use)
+
+
+def is_revoked(jti):
+    if uses_filter() and jti not in revoked_filter():
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def _changed(key):
+    caching.get_cache().set(key, uuid.uuid4().hex, None)
+
+
+def invalidate():
+    """Make every process rebuild its filter, e.g. after bulk blacklist writes."""
+    _changed(PRUNED_KEY)
+
+
+# ============================================
+# TOKENS
+# ============================================
+
+class RevocableRefreshToken(RefreshToken):
+    """A RefreshToken whose blacklist check goes through the Bloom filter."""
+
+    def check_blacklist(self):
+        if is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        jti = self.payload[api_settings.JTI_CLAIM]
+        with _lock:
+            if _revoked is not None:
+                _revoked.filter.add(jti)
+        # Other processes sync once the row is visible to them.
+        transaction.on_commit(lambda: _changed(CHANGED_KEY))
+        return blacklisted
+
+
+def prune(batch_size=10_000):
+    """Delete expired tokens and their blacklist rows; yields (outstanding, blacklisted) per batch."""
+    now = timezone.now()
+    last = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects
+            .filter(pk__gt=last, expires_at__lte=now)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            blacklisted, _ = BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            outstanding, _ = OutstandingToken.objects.filter(pk__in=ids).delete()
+        last = ids[-1]
+        yield outstanding, blacklisted
+    _changed(PRUNED_KEY)
@@ -0,0 +1,164 @@
+"""
+"Now playing / next up" per stage, for the home page and /api/schedule/now/.
+
+The performances of one day are read once (one query for the slots, one for
+the stages) into a `DaySchedule`: per stage, the slots sorted by start time
+with a parallel list of start offsets in seconds, so the set playing at a
+moment and the one after it are a bisect away. Sets that run past midnight
+(end_time <= start_time) count until the end of their day and again from
+00:00 on the next one.
+
+Built days are kept in process memory, a few at a time, tagged with the
+'event', 'performance', 'stage' and 'artist' version counters (see
+festify.caching) that the signal receivers bump on save/delete. A request
+reads those counters with one cache round trip and rebuilds the day when
+they have moved. The counters restart at 1 when the shared cache is
+flushed, so the tag also carries an epoch stored next to them; a flush
+drops the epoch and with it every day built before.
+"""
+import threading
+import uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching
+from .models import Performance, Stage
+
+ENTITIES = ('event', 'performance', 'stage', 'artist')
+MAX_DAYS = 4
+DAY_SECONDS = 24 * 60 * 60
+EPOCH_KEY = 'festify:schedule:epoch'
+
+_days = OrderedDict()
+_lock = threading.Lock()
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+class DaySchedule:
+    def __init__(self, day, stages, slots):
+        """`stages`: stage dicts by order; `slots`: (start, end, slot) per stage id."""
+        self.day = day
+        self.stages = []
+        for stage in stages:
+            rows = sorted(slots.get(stage['id'], ()), key=lambda row: (row[0], row[1]))
+            self.stages.append((
+                stage,
+                [start for start, _, _ in rows],
+                [end for _, end, _ in rows],
+                [slot for _, _, slot in rows],
+            ))
+
+    def at(self, moment):
+        """[{'stage', 'now', 'next'}] for a time of day, in stage order."""
+        offset = _seconds(moment)
+        cards = []
+        for stage, starts, ends, slots in self.stages:
+            index = bisect_right(starts, offset)
+            playing = index and ends[index - 1] > offset
+            cards.append({
+                'stage': stage,
+                'now': slots[index - 1] if playing else None,
+                'next': slots[index] if index < len(slots) else None,
+            })
+        return cards
+
+    def seconds_until_change(self, moment):
+        """Seconds from `moment` until a set starts or ends; None if none will today."""
+        offset = _seconds(moment)
+        upcoming = []
+        for _, starts, ends, _ in self.stages:
+            index = bisect_right(starts, offset)
+            if index < len(starts):
+                upcoming.append(starts[index])
+            if index and offset < ends[index - 1] < DAY_SECONDS:
+                upcoming.append(ends[index - 1])
+        return min(upcoming) - offset if upcoming else None
+
+
+def _runs_on(start, end, day, tz):
+    """Whether an event runs on `day`; events without an end never close."""
+    return start.astimezone(tz).date() <= day and (end is None or end.astimezone(tz).date() >= day)
+
+
+def build(day):
+    """Read `day`'s performances (and the previous day's late sets) into a DaySchedule."""
+    tz = timezone.get_current_timezone()
+    opens = timezone.make_aware(datetime.combine(day - timedelta(days=1), time.min), tz)
+    closes = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+    rows = (
+        Performance.objects
+        .filter(event__start_datetime__lt=closes)
+        .filter(Q(event__end_datetime__gte=opens) | Q(event__end_datetime__isnull=True))
+        .values_list(
+            'id', 'title', 'start_time', 'end_time', 'stage_id',
+            'artist_id', 'artist__name', 'artist__image_url',
+            'event_id', 'event__title', 'event__start_datetime', 'event__end_datetime',
+        )
+    )
+    slots = {}
+    for (pk, title, start_time, end_time, stage_id, artist_id, artist_name, image_url,
+         event_id, event_title, event_start, event_end) in rows:
+        slot = {
+            'id': pk,
+            'title': title or artist_name,
+            'start_time': start_time,
+            'end_time': end_time,
+            'artist': {'id': artist_id, 'name': artist_name, 'image_url': image_url},
+            'event': {'id': event_id, 'title': event_title},
+        }
+        start, end = _seconds(start_time), _seconds(end_time)
+        overnight = end <= start
+        if _runs_on(event_start, event_end, day, tz):
+            slots.setdefault(stage_id, []).append((start, DAY_SECONDS if overnight else end, slot))
+        if overnight and end and _runs_on(event_start, event_end, day - timedelta(days=1), tz):
+            slots.setdefault(stage_id, []).append((0, end, slot))
+    stages = list(Stage.objects.order_by('order', 'id').values('id', 'name', 'order'))
+    return DaySchedule(day, stages, slots)
+
+
+def _tag():
+    cache = caching.get_cache()
+    keys = [caching._version_key(entity) for entity in ENTITIES]
+    found = cache.get_many([EPOCH_KEY, *keys])
+    epoch = found.get(EPOCH_KEY)
+    if epoch is None:
+        cache.add(EPOCH_KEY, uuid.uuid4().hex, None)
+        epoch = cache.get(EPOCH_KEY)
+    return (epoch, *(found.get(key, 1) for key in keys))
+
+
+def for_day(day):
+    """The DaySchedule for `day`, rebuilt only after a relevant change."""
+    key = (day, timezone.get_current_timezone_name())
+    tag = _tag()
+    with _lock:
+        entry = _days.get(key)
+        if entry is not None and entry[0] == tag:
+            _days.move_to_end(key)
+            return entry[1]
+    schedule = build(day)
+    with _lock:
+        _days[key] = (tag, schedule)
+        _days.move_to_end(key)
+        while len(_days) > MAX_DAYS:
+            _days.popitem(last=False)
+    return schedule
+
+
+def clear():
+    with _lock:
+        _days.clear()
+
+
+def now_playing(moment=None):
+    """(schedule, local moment, cards) for an aware datetime, default now."""
+    moment = timezone.localtime(moment)
+    schedule = for_day(moment.date())
+    return schedule, moment, schedule.at(moment.time())
@@ -0,0 +1,138 @@
+"""
+Full-text search over events, their artists and location.
+
+SQLite uses an FTS5 virtual table keyed by event id (rowid); PostgreSQL uses
+a table of weighted tsvectors with a GIN index. Both are created by
+migration 0005 and kept in sync by the receivers in festify.signals. Other
+databases get `None` from `search_event_ids` and callers fall back to
+icontains filtering.
+
+Queries are split into words and every word is prefix-matched, so "jaz
+ams" finds "Jazz in Amsterdam". Results are ranked with bm25 (SQLite) or
+ts_rank_cd (PostgreSQL), title hits weighing most. Only the best
+FESTIFY_SEARCH_LIMIT (500) are returned; the event list reports when a
+search had more matches than that.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Event
+
+TABLE = 'festify_event_search'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _documents(event_ids):
+    events = (
+        Event.objects
+        .filter(pk__in=event_ids)
+        .only('id', 'title', 'description', 'location_name', 'address')
+        .prefetch_related('artists')
+    )
+    for event in events:
+        artists = ' '.join(
+            f'{artist.name} {artist.genre}' for artist in event.artists.all()
+        )
+        location = f'{event.location_name} {event.address}'
+        yield event.pk, event.title, artists, location, event.description
+
+
+def remove_events(event_ids):
+    event_ids = list(event_ids)
+    if not event_ids or not is_supported():
+        return
+    placeholders = ', '.join(['%s'] * len(event_ids))
+    column = 'rowid' if connection.vendor == 'sqlite' else 'event_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE {column} IN ({placeholders})', event_ids)
+
+
+def index_events(event_ids):
+    """(Re)build the search documents for the given events."""
+    event_ids = list(event_ids)
+    if not event_ids or not is_supported():
+        return
+    remove_events(event_ids)
+    rows = list(_documents(event_ids))
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, title, artists, location, description) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+        else:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (event_id, document) VALUES (%s, '
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'D'))",
+                rows,
+            )
+
+
+def rebuild_index(batch_size=2000):
+    """Drop every document and index all events again; returns the count."""
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+
+    indexed = 0
+    ids = Event.objects.order_by('pk').values_list('pk', flat=True)
+    last = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return indexed
+        index_events(batch)
+        indexed += len(batch)
+        last = batch[-1]
+
+
+def result_limit():
+    return getattr(settings, 'FESTIFY_SEARCH_LIMIT', 500)
+
+
+def search_event_ids(query, limit=None):
+    """
+    Ranked event ids matching every word of `query` as a prefix, best
+    first. Returns None when the database has no search index.
+    """
+    if not is_supported():
+        return None
+    words = _WORD_RE.findall(query.lower())
+    if not words:
+        return []
+    limit = limit or result_limit()
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            match = ' '.join(f'"{word}"*' for word in words)
+            # Column weights follow the table layout: title, artists,
+            # location, description.
+            cursor.execute(
+                f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+                f'ORDER BY bm25({TABLE}, 10.0, 5.0, 3.0, 1.0) LIMIT %s',
+                [match, limit],
+            )
+        else:
+            tsquery = ' & '.join(f'{word}:*' for word in words)
+            cursor.execute(
+                f"SELECT event_id FROM {TABLE}, to_tsquery('simple', %s) query "
+                'WHERE document @@ query '
+                'ORDER BY ts_rank_cd(document, query) DESC LIMIT %s',
+                [tsquery, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
@@ -1,8 +1,14 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import UserProfile, Artist, Event, Ticket
-
-class UserSerializer(serializers.ModelSerializer):
+from .models import UserProfile, Artist, Event, Ticket, Reservation, Stage, Performance
+from .accounts import AccountError, email_lookup, register
+from .compiled_serializers import CompiledSerializerMixin
+from .instrumentation import TimedSerializerMixin
+from .purchases import rebalance_shards
+from .sparse_fields import DynamicFieldsMixin
+
+class UserSerializer(DynamicFieldsMixin, TimedSerializerMixin, CompiledSerializerMixin,
+                     serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
@@ -22,7 +28,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ['username', 'email', 'password', 'confirm_password', 'is_organizer']
 
     def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
+        if email_lookup([value]).exists():
             raise serializers.ValidationError("Email already exists")
         return value
 
@@ -32,45 +38,52 @@ class RegisterSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        is_organizer = validated_data.pop('is_organizer', False)
-        validated_data.pop('confirm_password')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
-        UserProfile.objects.create(user=user, is_organizer=is_organizer)
-        return user
-
-class ArtistSerializer(serializers.ModelSerializer):
+        try:
+            return register(
+                validated_data['username'],
+                validated_data['email'],
+                validated_data['password'],
+                is_organizer=validated_data.get('is_organizer', False),
+            )
+        except AccountError as exc:
+            raise serializers.ValidationError(str(exc))
+
+class ArtistSerializer(DynamicFieldsMixin, TimedSerializerMixin, CompiledSerializerMixin,
+                       serializers.ModelSerializer):
     class Meta:
         model = Artist
         fields = ['id', 'name', 'genre', 'description']
 
-class EventListSerializer(serializers.ModelSerializer):
+class EventListSerializer(DynamicFieldsMixin, TimedSerializerMixin, CompiledSerializerMixin,
+                          serializers.ModelSerializer):
     artists = ArtistSerializer(many=True, read_only=True)
+    tickets_sold = serializers.IntegerField(source='sold_count', read_only=True)
     remaining_tickets = serializers.ReadOnlyField()
+    image_variants = serializers.ReadOnlyField()
     host_username = serializers.CharField(source='host.username', read_only=True)
 
     class Meta:
         model = Event
         fields = [
             'id', 'title', 'description', 'start_datetime', 'end_datetime',
-            'location_name', 'address', 'latitude', 'longitude', 'image',
+            'location_name', 'address', 'latitude', 'longitude', 'image', 'image_variants',
             'artists', 'ticket_price', 'capacity', 'tickets_sold',
             'remaining_tickets', 'host_username', 'created_at'
         ]
 
-class EventDetailSerializer(serializers.ModelSerializer):
+class EventDetailSerializer(DynamicFieldsMixin, TimedSerializerMixin, CompiledSerializerMixin,
+                            serializers.ModelSerializer):
     artists = ArtistSerializer(many=True, read_only=True)
+    tickets_sold = serializers.IntegerField(source='sold_count', read_only=True)
     remaining_tickets = serializers.ReadOnlyField()
+    image_variants = serializers.ReadOnlyField()
     host = UserSerializer(read_only=True)
 
     class Meta:
         model = Event
         fields = [
             'id', 'host', 'title', 'description', 'start_datetime', 'end_datetime',
-            'location_name', 'address', 'latitude', 'longitude', 'image',
+            'location_name', 'address', 'latitude', 'longitude', 'image', 'image_variants',
             'artists', 'ticket_price', 'capacity', 'tickets_sold',
             'remaining_tickets', 'created_at', 'updated_at'
         ]
@@ -90,6 +103,19 @@ class EventCreateUpdateSerializer(serializers.ModelSerializer):
             'ticket_price', 'capacity', 'artist_ids'
         ]
 
+    # Chained comparisons are False for nan, so this also keeps NaN and
+    # Infinity out of the table; the renderer would write them as null.
+    def _validate_coordinate(self, value, limit):
+        if value is not None and not -limit <= value <= limit:
+            raise serializers.ValidationError(f'Ensure this value is between {-limit} and {limit}.')
+        return value
+
+    def validate_latitude(self, value):
+        return self._validate_coordinate(value, 90)
+
+    def validate_longitude(self, value):
+        return self._validate_coordinate(value, 180)
+
     def create(self, validated_data):
         artist_ids = validated_data.pop('artist_ids', [])
         event = Event.objects.create(**validated_data)
@@ -100,15 +126,21 @@ class EventCreateUpdateSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         artist_ids = validated_data.pop('artist_ids', None)
+        capacity_changed = (
+            'capacity' in validated_data and validated_data['capacity'] != instance.capacity
+        )
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+        if capacity_changed and instance.shard_count:
+            rebalance_shards(instance)
         if artist_ids is not None:
             artists = Artist.objects.filter(id__in=artist_ids)
             instance.artists.set(artists)
         return instance
 
-class TicketSerializer(serializers.ModelSerializer):
+class TicketSerializer(DynamicFieldsMixin, TimedSerializerMixin, CompiledSerializerMixin,
+                       serializers.ModelSerializer):
     event = EventListSerializer(read_only=True)
     user = UserSerializer(read_only=True)
 
@@ -116,9 +148,24 @@ class TicketSerializer(serializers.ModelSerializer):
         model = Ticket
         fields = ['id', 'user', 'event', 'purchase_datetime']
 
+class ReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Reservation
+        fields = ['id', 'event', 'created_at', 'expires_at']
+
 class ProfileSerializer(serializers.Serializer):
     username = serializers.CharField()
     email = serializers.EmailField()
     is_organizer = serializers.BooleanField()
     tickets = TicketSerializer(many=True)
     hosted_events = EventListSerializer(many=True)
+
+class StageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Stage
+        fields = ['id', 'name', 'location', 'order']
+
+class PerformanceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Performance
+        fields = ['id', 'event', 'artist', 'stage', 'title', 'start_time', 'end_time', 'description']
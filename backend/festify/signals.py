@@ -0,0 +1,159 @@
+"""
+Model signal receivers, connected in FestifyConfig.ready().
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import authentication, caching, search, sync
+from .models import Artist, ChangeLogEntry, Event, Performance, Stage, Ticket, UserProfile
+
+
+# ============================================
+# SEARCH INDEX
+# ============================================
+
+@receiver(post_save, sender=Event)
+def index_saved_event(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_events([instance.pk])
+
+
+@receiver(post_delete, sender=Event)
+def unindex_deleted_event(sender, instance, **kwargs):
+    search.remove_events([instance.pk])
+
+
+@receiver(m2m_changed, sender=Event.artists.through)
+def reindex_event_artists(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # Clearing from the artist side doesn't say which events lost it.
+        instance._search_event_ids = list(instance.events.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        search.index_events(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        search.index_events(instance._search_event_ids if reverse else [instance.pk])
+
+
+@receiver(pre_delete, sender=Artist)
+def remember_artist_events(sender, instance, **kwargs):
+    # The through rows are gone by post_delete, so collect the events now.
+    instance._search_event_ids = list(instance.events.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Artist)
+def reindex_deleted_artist_events(sender, instance, **kwargs):
+    search.index_events(instance._search_event_ids)
+
+
+@receiver(post_save, sender=Artist)
+def reindex_artist_events(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        search.index_events(instance.events.values_list('pk', flat=True))
+
+
+# ============================================
+# RESPONSE CACHE VERSIONS
+# ============================================
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def bump_event_version(sender, instance, **kwargs):
+    caching.bump('event', f'event:{instance.pk}')
+
+
+@receiver(m2m_changed, sender=Event.artists.through)
+def bump_event_artists_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cache_event_ids = list(instance.events.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        event_ids = pk_set if reverse else [instance.pk]
+        caching.bump('event', *(f'event:{pk}' for pk in event_ids))
+    elif action == 'post_clear':
+        event_ids = instance._cache_event_ids if reverse else [instance.pk]
+        caching.bump('event', *(f'event:{pk}' for pk in event_ids))
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Artist)
+def bump_artist_version(sender, **kwargs):
+    caching.bump('artist')
+
+
+@receiver(post_save, sender=Performance)
+@receiver(post_delete, sender=Performance)
+def bump_performance_version(sender, **kwargs):
+    caching.bump('performance')
+
+
+@receiver(post_save, sender=Stage)
+@receiver(post_delete, sender=Stage)
+def bump_stage_version(sender, **kwargs):
+    caching.bump('stage')
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def bump_ticket_version(sender, instance, **kwargs):
+    caching.bump(caching.ticket_version(instance.user_id))
+
+
+# ============================================
+# AUTHENTICATED USERS
+# ============================================
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def restamp_user(sender, instance, **kwargs):
+    # Token claims issued before this change stop being trusted.
+    user_id = instance.pk if sender is User else instance.user_id
+    authentication.forget(user_id)
+    authentication.restamp(user_id)
+
+
+# ============================================
+# SYNC CHANGE LOG
+# ============================================
+
+_SYNC_LABELS = {Event: 'event', Artist: 'artist', Stage: 'stage', Performance: 'performance'}
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Stage)
+@receiver(post_save, sender=Performance)
+def log_saved_object(sender, instance, **kwargs):
+    sync.record(_SYNC_LABELS[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Stage)
+@receiver(post_delete, sender=Performance)
+def log_deleted_object(sender, instance, **kwargs):
+    sync.record(_SYNC_LABELS[sender], [instance.pk], ChangeLogEntry.DELETE)
+
+
+@receiver(m2m_changed, sender=Event.artists.through)
+def log_event_artists(sender, instance, action, reverse, pk_set, **kwargs):
+    # Events embed their artists, so a changed lineup is an event update.
+    if reverse and action == 'pre_clear':
+        instance._sync_event_ids = list(instance.events.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        sync.record('event', pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        sync.record('event', instance._sync_event_ids if reverse else [instance.pk])
+
+
+@receiver(post_delete, sender=Artist)
+def log_deleted_artist_events(sender, instance, **kwargs):
+    # Collected by remember_artist_events before the through rows went.
+    sync.record('event', instance._search_event_ids)
+
+
+@receiver(post_save, sender=Artist)
+def log_artist_events(sender, instance, created=False, **kwargs):
+    if not created:
+        sync.record('event', instance.events.values_list('pk', flat=True))
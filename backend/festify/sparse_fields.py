@@ -0,0 +1,145 @@
+"""
+Sparse fieldsets (`?fields=`) and expansion control (`?expand=`).
+
+Both parameters take comma-separated, dot-separated field paths:
+
+    ?fields=id,title,event.title,event.start_datetime
+    ?expand=event,event.artists
+
+`fields` limits the output to the listed fields; naming a nested field
+alone (`event`) keeps all of it, naming sub-paths (`event.title`) keeps only
+those. Without `expand` nested objects are embedded as before. With it,
+only the listed nested objects are embedded, and every other nested
+relation is rendered as its primary key (a list of keys for to-many
+relations).
+
+DynamicFieldsMixin prunes a serializer's fields accordingly and
+SparseFieldsMixin feeds it from the query string in viewsets. Because
+pruning happens on the serializer instance, festify.query_plans sees only
+the remaining fields: collapsed or dropped relations are not prefetched,
+and restricted serializers load their rows with `.only()` for just the
+columns they render.
+"""
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_paths(value):
+    """'a, b.c' -> frozenset({'a', 'b.c'}); None when absent."""
+    if value is None:
+        return None
+    return frozenset(path.strip() for path in value.split(',') if path.strip())
+
+
+def from_request(request):
+    """(fields, expand) path sets from the query string of a GET request."""
+    if request is None or request.method != 'GET':
+        return None, None
+    params = request.query_params if hasattr(request, 'query_params') else request.GET
+    return parse_paths(params.get(FIELDS_PARAM)), parse_paths(params.get(EXPAND_PARAM))
+
+
+def spec_kwargs(fields, expand):
+    """Serializer kwargs for a (fields, expand) pair, leaving out absent ones."""
+    return {name: paths for name, paths in (('fields', fields), ('expand', expand))
+            if paths is not None}
+
+
+def includes(paths, name):
+    """True when `name` itself or one of its sub-paths is listed."""
+    if paths is None:
+        return True
+    prefix = name + '.'
+    return any(path == name or path.startswith(prefix) for path in paths)
+
+
+def subpaths(paths, name):
+    """Paths below `name`; None (no restriction) if `name` is listed whole."""
+    if paths is None or name in paths:
+        return None
+    prefix = name + '.'
+    return frozenset(path[len(prefix):] for path in paths if path.startswith(prefix))
+
+
+def nested_kwargs(fields, expand, name):
+    """Serializer kwargs for the nested field `name`."""
+    kwargs = {}
+    if fields is not None:
+        kwargs['fields'] = subpaths(fields, name)
+    if expand is not None:
+        kwargs['expand'] = subpaths(expand, name) or frozenset()
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+
+class DynamicFieldsMixin:
+    """
+    Accepts `fields=` and `expand=` path sets. `field_spec` is the hashable
+    (fields, expand) pair, or None for the full serializer.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = frozenset(fields) if fields is not None else None
+        expand = frozenset(expand) if expand is not None else None
+        self.field_spec = (fields, expand) if (fields, expand) != (None, None) else None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.field_spec is None:
+            return fields
+        only, expand = self.field_spec
+
+        pruned = {}
+        for name, field in fields.items():
+            if not includes(only, name):
+                continue
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if isinstance(nested, serializers.BaseSerializer):
+                if expand is not None and not includes(expand, name):
+                    field = self._collapsed(field, many)
+                elif isinstance(nested, DynamicFieldsMixin):
+                    spec = nested_kwargs(only, expand, name)
+                    if spec:
+                        field = self._restricted(nested, many, spec)
+            pruned[name] = field
+        return pruned
+
+    @staticmethod
+    def _collapsed(field, many):
+        kwargs = {'read_only': True, 'many': many}
+        if field.source:
+            kwargs['source'] = field.source
+        return serializers.PrimaryKeyRelatedField(**kwargs)
+
+    @staticmethod
+    def _restricted(nested, many, spec):
+        kwargs = {**nested._kwargs, **spec}
+        if many:
+            kwargs['many'] = True
+        return type(nested)(*nested._args, **kwargs)
+
+
+class SparseFieldsMixin:
+    """
+    Viewset side: hands `?fields=`/`?expand=` to DynamicFieldsMixin
+    serializers on GET requests.
+    """
+
+    def sparse_kwargs(self, serializer_class):
+        if not issubclass(serializer_class, DynamicFieldsMixin):
+            return {}
+        return spec_kwargs(*from_request(self.request))
+
+    def get_serializer(self, *args, **kwargs):
+        for name, paths in self.sparse_kwargs(self.get_serializer_class()).items():
+            kwargs.setdefault(name, paths)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_plan_serializer(self):
+        """The serializer get_queryset should plan for: pruned if sparse."""
+        serializer_class = self.get_serializer_class()
+        kwargs = self.sparse_kwargs(serializer_class)
+        return serializer_class(**kwargs) if kwargs else serializer_class
@@ -0,0 +1,198 @@
+"""
+Delta sync: a "changes since <cursor>" feed over events, artists, stages
+and performances.
+
+Every save and delete of a synced model appends a ChangeLogEntry (see
+festify.signals); its auto-increment id is the cursor. A client that holds
+cursor N asks for entries with id > N, gets the current rows for upserted
+objects and bare ids for deleted ones, and stores the cursor of the last
+entry it saw. Entries are collapsed per object inside a batch, so an event
+edited fifty times since the last sync is sent once.
+
+Ids are handed out when entries are inserted, not when they commit, so on
+PostgreSQL entry 7 can become visible before entry 6 and a client that
+moved its cursor past 7 would never see 6. The feed therefore stops at the
+first entry younger than SETTLE_SECONDS, giving the transactions behind the
+ids before it time to commit or roll back; a reset hands out the cursor
+just below that entry for the same reason.
+
+Compaction keeps the log small without breaking clients: entries that a
+newer entry for the same object supersedes are dropped outright, and
+tombstones older than TOMBSTONE_DAYS are expired behind a COMPACT marker.
+Migration 0008 seeded the log with every row that existed before it, so
+cursor 0 replays the whole catalogue until the first tombstones expire.
+From then on a client whose cursor is older than the newest expired
+tombstone is told to `reset`: fetch the catalogue through the normal list
+endpoints and continue from the cursor returned with the reset.
+
+Ticket counters change without signals and are not part of the feed; the
+event list/detail endpoints stay the source for live availability.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+
+from .models import Artist, ChangeLogEntry, Event, Performance, Stage
+from .query_plans import optimize_for_serializer
+from .serializers import (
+    ArtistSerializer, EventListSerializer, PerformanceSerializer, StageSerializer,
+)
+
+DEFAULTS = {
+    'BATCH_SIZE': 500,
+    'MAX_BATCH_SIZE': 5000,
+    'TOMBSTONE_DAYS': 30,
+    'SETTLE_SECONDS': 5,
+}
+
+# label -> (model, serializer, key in the response)
+SYNCED = {
+    'event': (Event, EventListSerializer, 'events'),
+    'artist': (Artist, ArtistSerializer, 'artists'),
+    'stage': (Stage, StageSerializer, 'stages'),
+    'performance': (Performance, PerformanceSerializer, 'performances'),
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_SYNC', {})}
+
+
+def record(label, object_ids, action=ChangeLogEntry.UPSERT):
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model=label, object_id=object_id, action=action)
+        for object_id in object_ids
+    ])
+
+
+# ============================================
+# FEED
+# ============================================
+
+def current_cursor():
+    return ChangeLogEntry.objects.aggregate(cursor=Max('id'))['cursor'] or 0
+
+
+def _settle_cutoff():
+    return timezone.now() - timedelta(seconds=get_config()['SETTLE_SECONDS'])
+
+
+def settled_cursor():
+    """The newest cursor no entry still settling can land below."""
+    unsettled = (
+        ChangeLogEntry.objects.filter(changed_at__gt=_settle_cutoff())
+        .aggregate(first=Min('id'))['first']
+    )
+    return unsettled - 1 if unsettled is not None else current_cursor()
+
+
+def horizon():
+    """Cursors below this have missed expired tombstones."""
+    return (
+        ChangeLogEntry.objects.filter(action=ChangeLogEntry.COMPACT)
+        .aggregate(horizon=Max('object_id'))['horizon'] or 0
+    )
+
+
+def needs_reset(since):
+    return since < horizon() or since > current_cursor()
+
+
+def changes_since(since, limit, context=None):
+    """One batch of at most `limit` log entries after `since`."""
+    cutoff = _settle_cutoff()
+    entries = []
+    has_more = False
+    candidates = (
+        ChangeLogEntry.objects
+        .filter(id__gt=since)
+        .exclude(action=ChangeLogEntry.COMPACT)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'action', 'changed_at')[:limit + 1]
+    )
+    for row in candidates:
+        if row[4] > cutoff:
+            break   # still settling; served on a later request
+        if len(entries) == limit:
+            has_more = True
+            break
+        entries.append(row)
+
+    latest = {}
+    for _, label, object_id, action, _ in entries:
+        latest[label, object_id] = action
+
+    changes = {}
+    for label, (model, serializer_class, key) in SYNCED.items():
+        upserted = [oid for (lbl, oid), action in latest.items()
+                    if lbl == label and action == ChangeLogEntry.UPSERT]
+        deleted = [oid for (lbl, oid), action in latest.items()
+                   if lbl == label and action == ChangeLogEntry.DELETE]
+        rows = []
+        if upserted:
+            queryset = optimize_for_serializer(
+                model.objects.filter(pk__in=upserted).order_by('pk'), serializer_class
+            )
+            rows = serializer_class(queryset, many=True, context=context or {}).data
+            # Deleted after this batch's entry; the tombstone is still ahead
+            # in the log, but there is nothing left to send now.
+            found = {row['id'] for row in rows}
+            deleted += [oid for oid in upserted if oid not in found]
+        if rows or deleted:
+            changes[key] = {'updated': rows, 'deleted': sorted(deleted)}
+
+    return {
+        'cursor': entries[-1][0] if entries else since,
+        'has_more': has_more,
+        'changes': changes,
+    }
+
+
+def iter_changes(since, limit, context=None):
+    """Batches from `since` until the client has caught up."""
+    while True:
+        batch = changes_since(since, limit, context)
+        yield batch
+        if not batch['has_more']:
+            return
+        since = batch['cursor']
+
+
+# ============================================
+# COMPACTION
+# ============================================
+
+def compact(tombstone_days=None, batch_size=1000, now=None):
+    """Drop superseded entries and expire old tombstones; returns both counts."""
+    if tombstone_days is None:
+        tombstone_days = get_config()['TOMBSTONE_DAYS']
+    now = now or timezone.now()
+    entries = ChangeLogEntry.objects.exclude(action=ChangeLogEntry.COMPACT)
+
+    newer = ChangeLogEntry.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'),
+    ).exclude(action=ChangeLogEntry.COMPACT)
+    superseded = _delete_in_batches(entries.filter(Exists(newer)), batch_size)
+
+    expired_tombstones = entries.filter(
+        action=ChangeLogEntry.DELETE, changed_at__lt=now - timedelta(days=tombstone_days),
+    )
+    newest = expired_tombstones.aggregate(newest=Max('id'))['newest']
+    expired = 0
+    if newest is not None:
+        expired = _delete_in_batches(expired_tombstones.filter(id__lte=newest), batch_size)
+        ChangeLogEntry.objects.filter(action=ChangeLogEntry.COMPACT).delete()
+        ChangeLogEntry.objects.create(model='', object_id=newest, action=ChangeLogEntry.COMPACT)
+    return superseded, expired
+
+
+def _delete_in_batches(queryset, batch_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        ChangeLogEntry.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
@@ -0,0 +1,20 @@
+"""
+Test runner that turns query budget overruns into failures.
+
+Servers, DEBUG ones included, only log overruns (see
+festify/instrumentation.py); under `manage.py test` they raise, so a view
+that outgrows its budget fails the suite instead of scrolling past in a log.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class FestifyTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._budgets = override_settings(FESTIFY_ENFORCE_QUERY_BUDGETS=True)
+        self._budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._budgets.disable()
+        super().teardown_test_environment(**kwargs)
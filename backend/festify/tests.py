@@ -1,3 +1,1707 @@
-from django.test import TestCase
+import base64
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time as time_module
+from collections import Counter
+from unittest import mock
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.forms import inlineformset_factory
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .models import (
+    UserProfile, Artist, ChangeLogEntry, Event, InventoryShard, Performance, Reservation, Stage,
+    Ticket,
+)
+from .purchases import (
+    SoldOut, AlreadyHasTicket, NoReservation, purchase_ticket, refund_ticket,
+    set_shard_count, reserve_ticket, release_expired_holds,
+)
+from .compiled_serializers import CompiledSerializerMixin, builder_for
+from .instrumentation import QueryBudgetExceeded, route_stats
+from .query_plans import optimize_for_serializer
+from .renderers import FastJSONRenderer
+from .geo import cell_for, haversine_km
+from .search import rebuild_index, search_event_ids
+from .serializers import EventDetailSerializer, EventListSerializer, TicketSerializer
+from . import authentication, benchmarks, conflicts, images, revocation, sync, throttling, views
+from .admin import PerformanceAdminForm, PerformanceInlineFormSet
+from .views import EventViewSet, calendar_view
+from .waiting_room import WaitingRoom, get_config
+
+
+def make_user(username, is_organizer=False, password=None):
+    # Hashing is slow on purpose, so only pay for it when a test logs in.
+    user = User.objects.create_user(
+        username=username, email=f'{username}@example.com', password=password
+    )
+    UserProfile.objects.create(user=user, is_organizer=is_organizer)
+    return user
+
+
+def make_event(host, **kwargs):
+    defaults = {
+        'title': 'Festival',
+        'description': 'Music all day',
+        'start_datetime': timezone.now() + timedelta(days=7),
+        'location_name': 'Park',
+        'address': 'Main street 1',
+        'ticket_price': Decimal('10.00'),
+        'capacity': 100,
+    }
+    defaults.update(kwargs)
+    return Event.objects.create(host=host, **defaults)
+
+
+class BuyTicketTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.buyer = make_user('buyer')
+        self.event = make_event(self.host, capacity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_buy_claims_seat(self):
+        response = self.client.post(f'/api/events/{self.event.pk}/buy/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['event']['remaining_tickets'], 0)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, 1)
+
+    def test_buy_twice_is_rejected(self):
+        purchase_ticket(self.buyer, self.event)
+        with self.assertRaises(AlreadyHasTicket):
+            purchase_ticket(self.buyer, self.event)
+
+    def test_sold_out_leaves_no_ticket(self):
+        purchase_ticket(make_user('early'), self.event)
+        response = self.client.post(f'/api/events/{self.event.pk}/buy/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Event is sold out')
+        self.assertFalse(Ticket.objects.filter(user=self.buyer).exists())
+
+    def test_unfollow_returns_seat(self):
+        purchase_ticket(self.buyer, self.event)
+        response = self.client.post(f'/api/events/{self.event.pk}/unfollow/')
+        self.assertEqual(response.status_code, 200)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, 0)
+
+
+class ShardedInventoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user('host', is_organizer=True)
+        self.event = make_event(self.host, capacity=10, tickets_sold=0)
+        User.objects.bulk_create(User(username=f'fan{i}') for i in range(12))
+        self.fans = list(User.objects.filter(username__startswith='fan'))
+
+    def test_existing_sales_carry_over(self):
+        purchase_ticket(self.fans[0], self.event)
+        event = set_shard_count(self.event, 4)
+        shards = InventoryShard.objects.filter(event=event)
+        self.assertEqual(sum(s.capacity for s in shards), 10)
+        self.assertEqual(sum(s.sold for s in shards), 1)
+        self.assertEqual(event.remaining_tickets, 9)
+
+    def test_sells_exactly_capacity_across_shards(self):
+        event = set_shard_count(self.event, 8)
+        for fan in self.fans[:10]:
+            purchase_ticket(fan, event)
+        with self.assertRaises(SoldOut):
+            purchase_ticket(self.fans[10], event)
+        cache.clear()
+        self.assertEqual(event.sold_count, 10)
+        self.assertEqual(event.remaining_tickets, 0)
+
+    def test_refund_and_disable_fold_back_into_event_row(self):
+        event = set_shard_count(self.event, 3)
+        for fan in self.fans[:4]:
+            purchase_ticket(fan, event)
+        refund_ticket(self.fans[0], event)
+        event = set_shard_count(event, 0)
+        self.assertEqual(event.tickets_sold, 3)
+        self.assertFalse(InventoryShard.objects.filter(event=event).exists())
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.buyer = make_user('buyer')
+        self.event = make_event(self.host, capacity=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_hold_counts_against_remaining_until_confirmed(self):
+        response = self.client.post(f'/api/events/{self.event.pk}/reserve/')
+        self.assertEqual(response.status_code, 201)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.remaining_tickets, 1)
+
+        response = self.client.post(f'/api/events/{self.event.pk}/confirm/')
+        self.assertEqual(response.status_code, 201)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.remaining_tickets, 1)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_buying_uses_own_hold(self):
+        reserve_ticket(self.buyer, self.event)
+        reserve_ticket(make_user('other'), self.event)
+        response = self.client.post(f'/api/events/{self.event.pk}/buy/')
+        self.assertEqual(response.status_code, 201)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, 2)
+        self.assertFalse(Reservation.objects.filter(user=self.buyer).exists())
+
+    def test_release_returns_seat(self):
+        reserve_ticket(self.buyer, self.event)
+        response = self.client.post(f'/api/events/{self.event.pk}/release/')
+        self.assertEqual(response.status_code, 200)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, 0)
+
+    def test_expired_hold_cannot_be_confirmed(self):
+        reservation = reserve_ticket(self.buyer, self.event)
+        Reservation.objects.filter(pk=reservation.pk).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        response = self.client.post(f'/api/events/{self.event.pk}/confirm/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], NoReservation.message)
+
+    def test_sweeper_releases_expired_holds_in_batches(self):
+        User.objects.bulk_create(User(username=f'fan{i}') for i in range(5))
+        self.event.capacity = 10
+        self.event.save()
+        for fan in User.objects.filter(username__startswith='fan'):
+            reserve_ticket(fan, self.event)
+        reserve_ticket(self.buyer, self.event)
+        Reservation.objects.exclude(user=self.buyer).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(release_expired_holds(batch_size=2), 5)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, 1)
+        self.assertEqual(Reservation.objects.get().user, self.buyer)
+
+
+class WaitingRoomTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user('host', is_organizer=True)
+        self.event = make_event(self.host, capacity=10_000)
+
+    def test_admits_burst_then_rate(self):
+        now = [1000.0]
+        room = WaitingRoom({**get_config(), 'BURST': 2, 'ADMIT_RATE': 1}, clock=lambda: now[0])
+        results = [room.check(self.event.pk) for _ in range(4)]
+        self.assertEqual([admitted for admitted, _, _ in results], [True, True, False, False])
+        self.assertEqual(results[3][1], 2)
+
+        # A client keeps its place by presenting its token again.
+        now[0] += 2
+        self.assertTrue(room.check(self.event.pk, results[3][2])[0])
+        self.assertFalse(room.check(self.event.pk, 'forged')[0])
+
+    def test_quiet_queue_admits_only_a_burst(self):
+        now = [1000.0]
+        room = WaitingRoom({**get_config(), 'BURST': 2, 'ADMIT_RATE': 1}, clock=lambda: now[0])
+        room.check(self.event.pk)
+        # An hour without anyone would be 3600 positions of credit.
+        now[0] += 3600
+        results = [room.check(self.event.pk) for _ in range(5)]
+        self.assertEqual([admitted for admitted, _, _ in results], [True, True, False, False, False])
+        now[0] += 1
+        self.assertEqual([room.check(self.event.pk, token)[0] for _, _, token in results[2:]], [True, False, False])
+
+    def test_admission_spends_the_token(self):
+        room = WaitingRoom({**get_config(), 'BURST': 1, 'ADMIT_RATE': 0})
+        admitted, _, token = room.check(self.event.pk, scope='event-buy')
+        self.assertTrue(admitted)
+        # A copy of the token queues again, behind the burst.
+        self.assertFalse(room.check(self.event.pk, token, scope='event-buy')[0])
+        self.assertFalse(room.check(self.event.pk, token, scope='event-buy')[0])
+        room.release(self.event.pk, token, 'event-buy')
+        self.assertTrue(room.check(self.event.pk, token, scope='event-buy')[0])
+        self.assertTrue(room.check(self.event.pk, token, scope='event-reserve')[0])
+
+    def _storm(self, requests):
+        cache.clear()
+        Ticket.objects.all().delete()
+        User.objects.filter(username__startswith='fan').delete()
+        User.objects.bulk_create(User(username=f'fan{i}') for i in range(requests))
+        deferred = 0
+        for fan in User.objects.filter(username__startswith='fan'):
+            client = APIClient()
+            client.force_authenticate(fan)
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post(f'/api/events/{self.event.pk}/buy/')
+            if response.status_code == 429:
+                deferred += 1
+                self.assertEqual(len(queries), 0)
+                self.assertIn('position', response.json())
+        return Ticket.objects.count(), deferred
+
+    @override_settings(FESTIFY_WAITING_ROOM={'BURST': 5, 'ADMIT_RATE': 0})
+    def test_db_writes_stay_flat_as_requests_grow(self):
+        self.assertEqual(self._storm(10), (5, 5))
+        self.assertEqual(self._storm(1000), (5, 995))
+
+
+class QueryCountTests(TestCase):
+    """List endpoints must cost the same number of queries for 1 row or 10."""
+
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.fan = make_user('fan')
+        self.artists = [Artist.objects.create(name=f'Artist {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def add_events(self, count):
+        for i in range(count):
+            event = make_event(self.host, title=f'Event {i}')
+            event.artists.set(self.artists)
+            Ticket.objects.create(user=self.host, event=event)
+
+    def assertConstantQueries(self, url):
+        self.add_events(1)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_events(9)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+    def test_event_list(self):
+        self.assertConstantQueries('/api/events/')
+
+    def test_profile(self):
+        self.assertConstantQueries('/api/profile/')
+
+    def test_user_tickets(self):
+        self.assertConstantQueries('/api/profile/tickets/')
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        route_stats.reset()
+        self.host = make_user('host', is_organizer=True)
+        make_event(self.host)
+        self.client = APIClient()
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.client.get('/api/events/')
+        self.client.force_authenticate(self.host)
+        self.assertEqual(self.client.get('/api/stats/').status_code, 403)
+
+        admin = User.objects.create_superuser('root', 'root@example.com', None)
+        self.client.force_authenticate(admin)
+        stats = self.client.get('/api/stats/').json()
+        route = next(r for r in stats if 'events' in r)
+        self.assertEqual(stats[route]['queries']['count'], 1)
+        self.assertIsNotNone(stats[route]['latency_ms']['p95'])
+
+    @override_settings(DEBUG=True)
+    def test_debug_headers(self):
+        response = self.client.get('/api/events/')
+        self.assertIn('X-Query-Count', response)
+        self.assertIn('X-Serializer-Time-ms', response)
+
+    def test_budget_overrun_fails(self):
+        with mock.patch.dict(EventViewSet.query_budgets, {'list': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/events/')
+
+    @override_settings(DEBUG=True, FESTIFY_ENFORCE_QUERY_BUDGETS=False)
+    def test_budget_overrun_logs_outside_tests(self):
+        with mock.patch.dict(EventViewSet.query_budgets, {'list': 1}):
+            with self.assertLogs('festify.instrumentation', 'WARNING') as logs:
+                response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('(budget 1)', logs.output[0])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.jazz = make_event(self.host, title='Jazz in Amsterdam', description='Late night')
+        self.rock = make_event(self.host, title='Rock Night', description='Loud jazz-free guitars',
+                               location_name='Amsterdam Arena')
+
+    def titles(self, query):
+        response = APIClient().get('/api/events/', {'search': query})
+        return [row['title'] for row in response.data['results']]
+
+    def test_prefix_match_and_title_ranks_first(self):
+        self.assertEqual(self.titles('amster'), ['Jazz in Amsterdam', 'Rock Night'])
+        self.assertEqual(self.titles('jaz ams'), ['Jazz in Amsterdam', 'Rock Night'])
+        self.assertEqual(self.titles('guitar'), ['Rock Night'])
+
+    def test_truncated_search_says_so(self):
+        with override_settings(FESTIFY_SEARCH_LIMIT=1):
+            response = APIClient().get('/api/events/', {'search': 'amster'})
+            self.assertEqual([row['title'] for row in response.data['results']], ['Jazz in Amsterdam'])
+            self.assertTrue(response.data['search_truncated'])
+            response = APIClient().get('/api/events/', {'search': 'guitar'})
+            self.assertFalse(response.data['search_truncated'])
+
+    def test_artist_changes_are_indexed(self):
+        artist = Artist.objects.create(name='Metallica', genre='Metal')
+        self.rock.artists.add(artist)
+        self.assertEqual(self.titles('metall'), ['Rock Night'])
+
+        artist.name = 'Slayer'
+        artist.save()
+        self.assertEqual(self.titles('metallica'), [])
+        self.assertEqual(self.titles('slayer'), ['Rock Night'])
+
+        artist.delete()
+        self.assertEqual(self.titles('slayer'), [])
+
+    def test_deleted_event_leaves_index(self):
+        self.jazz.delete()
+        self.assertEqual(search_event_ids('jazz'), [self.rock.pk])
+
+    def test_rebuild(self):
+        self.assertEqual(rebuild_index(batch_size=1), 2)
+        self.assertEqual(self.titles('night'), ['Rock Night', 'Jazz in Amsterdam'])
+
+
+class NearbyEventsTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        # Amsterdam centre, Haarlem (~18 km), Utrecht (~35 km), Paris (~430 km)
+        self.dam = make_event(self.host, title='Dam', latitude=52.3731, longitude=4.8926)
+        self.haarlem = make_event(self.host, title='Haarlem', latitude=52.3874, longitude=4.6462)
+        self.utrecht = make_event(self.host, title='Utrecht', latitude=52.0907, longitude=5.1214)
+        self.paris = make_event(self.host, title='Paris', latitude=48.8566, longitude=2.3522)
+        make_event(self.host, title='Nowhere')
+
+    def near(self, **params):
+        response = APIClient().get('/api/events/near/', {'lat': 52.37, 'lng': 4.89, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(row['title'], row['distance_km']) for row in response.data]
+
+    def test_geo_cell_maintained_on_save(self):
+        self.assertEqual(self.dam.geo_cell, cell_for(52.3731, 4.8926))
+        self.dam.latitude = None
+        self.dam.save()
+        self.assertIsNone(self.dam.geo_cell)
+
+    def test_partial_save_moves_geo_cell(self):
+        self.paris.latitude, self.paris.longitude = 52.3702, 4.8952
+        self.paris.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(Event.objects.get(pk=self.paris.pk).geo_cell, cell_for(52.3702, 4.8952))
+        self.assertIn('Paris', [title for title, _ in self.near(radius_km=5)])
+
+    def test_radius(self):
+        rows = self.near(radius_km=40)
+        self.assertEqual([title for title, _ in rows], ['Dam', 'Haarlem', 'Utrecht'])
+        self.assertAlmostEqual(rows[1][1], haversine_km(52.37, 4.89, 52.3874, 4.6462), places=2)
+
+    def test_k_nearest(self):
+        self.assertEqual([title for title, _ in self.near(k=2)], ['Dam', 'Haarlem'])
+        self.assertEqual([title for title, _ in self.near(k=10)],
+                         ['Dam', 'Haarlem', 'Utrecht', 'Paris'])
+
+    def test_requires_coordinates(self):
+        self.assertEqual(APIClient().get('/api/events/near/').status_code, 400)
+
+    def test_rejects_non_finite_coordinates(self):
+        client = APIClient()
+        client.force_authenticate(self.host)
+        for latitude, longitude in (('NaN', 4.89), (52.37, 'Infinity'), (91, 4.89)):
+            response = client.patch(f'/api/events/{self.dam.pk}/',
+                                    {'latitude': latitude, 'longitude': longitude})
+            self.assertEqual(response.status_code, 400)
+        self.dam.refresh_from_db()
+        self.assertEqual((self.dam.latitude, self.dam.longitude), (52.3731, 4.8926))
+        self.assertEqual(client.get('/api/events/near/', {'lat': 'nan', 'lng': 4.89}).status_code, 400)
+
+    def test_rejects_bad_radius_and_k(self):
+        for params in ({'radius_km': 'nan'}, {'radius_km': 'inf'}, {'radius_km': '-5'},
+                       {'radius_km': '0'}, {'k': '0'}, {'k': '-1'}, {'lat': 'nan'}):
+            response = APIClient().get('/api/events/near/', {'lat': 52.37, 'lng': 4.89, **params})
+            self.assertEqual(response.status_code, 400, params)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        host = make_user('host', is_organizer=True)
+        start = timezone.now() + timedelta(days=1)
+        # Pairs of events share a start time to exercise the id tie-breaker.
+        for i in range(45):
+            make_event(host, title=f'Event {i}', start_datetime=start + timedelta(hours=i // 2))
+        self.client = APIClient()
+
+    def walk(self, url):
+        titles = []
+        while url:
+            page = self.client.get(url).json()
+            titles.extend(row['title'] for row in page['results'])
+            url = page['next']
+        return titles
+
+    def test_cursor_walk_matches_page_numbers(self):
+        by_cursor = self.walk('/api/events/?paginate=cursor')
+        by_page = self.walk('/api/events/')
+        self.assertEqual(len(by_cursor), 45)
+        self.assertEqual(by_cursor, by_page)
+
+    def test_count_is_opt_in(self):
+        self.assertNotIn('count', self.client.get('/api/events/?paginate=cursor').json())
+        page = self.client.get('/api/events/?paginate=cursor&count=1').json()
+        self.assertEqual(page['count'], 45)
+
+    def test_artists_by_name(self):
+        for name in ['Cher', 'Abba', 'Blur']:
+            Artist.objects.create(name=name)
+        page = self.client.get('/api/artists/?paginate=cursor').json()
+        self.assertEqual([a['name'] for a in page['results']], ['Abba', 'Blur', 'Cher'])
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get('/api/events/?cursor=nope').status_code, 404)
+        for values in (5, ['not a date', 1], {'a': 1, 'b': 2}):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.client.get('/api/events/', {'cursor': cursor}).status_code, 404, values)
+
+    def test_search_is_not_keyset_paged(self):
+        response = self.client.get('/api/events/', {'paginate': 'cursor', 'search': 'festival'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('search', response.data)
+        self.assertEqual(self.client.get('/api/events/', {'search': 'festival'}).status_code, 200)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user('host', is_organizer=True)
+        self.event = make_event(self.host, capacity=5)
+        self.client = APIClient()
+
+    def test_cached_list_skips_database(self):
+        self.client.get('/api/events/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/events/')
+        # Only the ETag validator and the inventory overlay may touch the
+        # database on a hit.
+        self.assertLessEqual(len(queries), 2)
+        self.assertEqual(response.data['results'][0]['title'], 'Festival')
+
+    def test_event_save_invalidates(self):
+        self.client.get(f'/api/events/{self.event.pk}/')
+        self.event.title = 'Renamed'
+        self.event.save()
+        self.assertEqual(self.client.get(f'/api/events/{self.event.pk}/').data['title'], 'Renamed')
+
+    def test_artist_change_invalidates_event_payloads(self):
+        artist = Artist.objects.create(name='Old name')
+        self.event.artists.add(artist)
+        self.client.get('/api/events/')
+        artist.name = 'New name'
+        artist.save()
+        rows = self.client.get('/api/events/').data['results']
+        self.assertEqual(rows[0]['artists'][0]['name'], 'New name')
+
+    def test_clearing_artist_events_invalidates_event_detail(self):
+        artist = Artist.objects.create(name='Headliner')
+        self.event.artists.add(artist)
+        url = f'/api/events/{self.event.pk}/'
+        self.assertEqual(len(self.client.get(url).data['artists']), 1)
+        artist.events.clear()
+        self.assertEqual(self.client.get(url).data['artists'], [])
+
+    @override_settings(FESTIFY_RESPONSE_CACHE={'COUNTS_TTL': 0.01})
+    def test_ticket_counts_overlay_without_invalidating(self):
+        self.client.get('/api/events/')
+        purchase_ticket(make_user('fan'), self.event)
+        time_module.sleep(0.02)
+        row = self.client.get('/api/events/').data['results'][0]
+        self.assertEqual((row['tickets_sold'], row['remaining_tickets']), (1, 4))
+
+    def test_pages_are_cached_until_stage_changes(self):
+        stage = Stage.objects.create(name='Main')
+        self.assertContains(self.client.get('/map/'), 'Main')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/map/')
+        self.assertEqual(len(queries), 0)
+        stage.name = 'Second'
+        stage.save()
+        self.assertContains(self.client.get('/map/'), 'Second')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user('host', is_organizer=True)
+        self.event = make_event(self.host, start_datetime=timezone.now())
+        purchase_ticket(self.host, self.event)
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def assertShortCircuits(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertLessEqual(len(queries), 1)
+        return first['ETag']
+
+    def test_event_list_and_detail(self):
+        self.assertShortCircuits('/api/events/')
+        etag = self.assertShortCircuits(f'/api/events/{self.event.pk}/')
+        self.event.title = 'Changed'
+        self.event.save()
+        response = self.client.get(f'/api/events/{self.event.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_lineup_change_changes_etag(self):
+        # Created first: a new artist bumps the 'artist' version on its own.
+        headliner = Artist.objects.create(name='Headliner')
+        list_etag = self.assertShortCircuits('/api/events/')
+        detail_etag = self.assertShortCircuits(f'/api/events/{self.event.pk}/')
+        self.event.artists.add(headliner)
+        self.assertEqual(self.client.get('/api/events/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        response = self.client.get(f'/api/events/{self.event.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_purchase_changes_etag(self):
+        etag = self.assertShortCircuits('/api/events/')
+        purchase_ticket(make_user('fan'), self.event)
+        self.assertEqual(self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sharded_events_send_no_etag(self):
+        set_shard_count(self.event, 2)
+        for url in ('/api/events/', f'/api/events/{self.event.pk}/', '/api/profile/',
+                    '/api/profile/tickets/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('ETag', response, url)
+
+    def test_other_buyers_leave_profile_etags_alone(self):
+        elsewhere = make_event(make_user('other', is_organizer=True))
+        profile_etag = self.assertShortCircuits('/api/profile/')
+        tickets_etag = self.assertShortCircuits('/api/profile/tickets/')
+        purchase_ticket(make_user('fan'), elsewhere)
+        self.assertEqual(self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=profile_etag).status_code, 304)
+        response = self.client.get('/api/profile/tickets/', HTTP_IF_NONE_MATCH=tickets_etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_profile_endpoints(self):
+        self.assertShortCircuits('/api/profile/')
+        etag = self.assertShortCircuits('/api/profile/tickets/')
+        refund_ticket(self.host, self.event)
+        response = self.client.get('/api/profile/tickets/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_calendar(self):
+        now = timezone.now()
+        factory = APIRequestFactory()
+        url = f'/api/calendar/?year={now.year}&month={now.month}'
+        first = calendar_view(factory.get(url))
+        with CaptureQueriesContext(connection) as queries:
+            second = calendar_view(factory.get(url, HTTP_IF_NONE_MATCH=first['ETag']))
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+    def test_calendar_etag_follows_the_date(self):
+        factory = APIRequestFactory()
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2030, 10, 31)):
+            etag = calendar_view(factory.get('/api/calendar/'))['ETag']
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2030, 11, 1)):
+            response = calendar_view(factory.get('/api/calendar/', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['month'], 11)
+
+
+@override_settings(FESTIFY_SYNC={'SETTLE_SECONDS': 0})
+class SyncTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.artist = Artist.objects.create(name='Band')
+        self.event = make_event(self.host)
+        self.client = APIClient()
+        self.cursor = sync.current_cursor()
+
+    def get_changes(self, since, **params):
+        response = self.client.get('/api/sync/', {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_updates_and_deletes_since_cursor(self):
+        self.event.artists.add(self.artist)
+        self.event.title = 'Renamed'
+        self.event.save()
+        stage = Stage.objects.create(name='Main')
+        stage_id = stage.pk
+        stage.delete()
+
+        data = self.get_changes(self.cursor)
+        self.assertFalse(data['has_more'])
+        events = data['changes']['events']
+        self.assertEqual([row['title'] for row in events['updated']], ['Renamed'])
+        self.assertEqual(events['updated'][0]['artists'][0]['name'], 'Band')
+        self.assertEqual(data['changes']['stages'], {'updated': [], 'deleted': [stage_id]})
+        self.assertNotIn('artists', data['changes'])
+
+        self.assertEqual(self.get_changes(data['cursor'])['changes'], {})
+
+    def test_batches_and_stream(self):
+        for index in range(5):
+            Artist.objects.create(name=f'Artist {index}')
+        first = self.get_changes(self.cursor, limit=2)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['changes']['artists']['updated']), 2)
+
+        response = self.client.get('/api/sync/', {'since': self.cursor, 'limit': 2, 'stream': 1})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        batches = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(sum(len(b['changes']['artists']['updated']) for b in batches), 5)
+
+    def test_compaction(self):
+        for title in ('a', 'b', 'c'):
+            self.event.title = title
+            self.event.save()
+        doomed = Artist.objects.create(name='Gone')
+        doomed.delete()
+        self.assertGreater(sync.compact(tombstone_days=30)[0], 0)
+        self.assertEqual(
+            ChangeLogEntry.objects.filter(model='event', object_id=self.event.pk).count(), 1
+        )
+        self.assertEqual(self.get_changes(0)['changes']['events']['updated'][0]['title'], 'c')
+
+        superseded, expired = sync.compact(tombstone_days=0, now=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(expired, 1)
+        data = self.get_changes(self.cursor)
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['cursor'], sync.current_cursor())
+        self.assertNotIn('reset', self.get_changes(data['cursor']))
+
+    @override_settings(FESTIFY_SYNC={'SETTLE_SECONDS': 5})
+    def test_fresh_entries_wait_to_settle(self):
+        Artist.objects.create(name='Early')
+        ChangeLogEntry.objects.update(changed_at=timezone.now() - timedelta(seconds=10))
+        settled = sync.current_cursor()
+        Artist.objects.create(name='Fresh')
+
+        data = self.get_changes(self.cursor)
+        self.assertEqual(data['cursor'], settled)
+        self.assertFalse(data['has_more'])
+        self.assertEqual([row['name'] for row in data['changes']['artists']['updated']], ['Early'])
+        self.assertEqual(sync.settled_cursor(), settled)
+
+        later = timezone.now() + timedelta(seconds=6)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            data = self.get_changes(settled)
+        self.assertEqual([row['name'] for row in data['changes']['artists']['updated']], ['Fresh'])
+
+
+class CompiledSerializerTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        artists = [Artist.objects.create(name=f'Artist {i}', genre='Jazz \u2028') for i in range(3)]
+        self.events = [
+            make_event(self.host, title='Ünïcode', latitude=0.00001, longitude=4.89),
+            make_event(self.host, latitude=None, longitude=None, ticket_price=Decimal('12.5')),
+        ]
+        self.events[0].image = 'event_images/poster.jpg'
+        self.events[0].save()
+        self.events[0].artists.set(artists)
+        Ticket.objects.create(user=self.host, event=self.events[0])
+        self.request = APIRequestFactory().get('/api/events/')
+
+    def render_both(self, serializer_class, queryset, many=True):
+        rendered = []
+        for compiled in (False, True):
+            with override_settings(FESTIFY_COMPILED_SERIALIZERS=compiled):
+                instance = optimize_for_serializer(queryset, serializer_class)
+                if not many:
+                    instance = instance.get()
+                data = serializer_class(instance, many=many, context={'request': self.request}).data
+                rendered.append(JSONRenderer().render(data))
+        return rendered
+
+    def test_byte_identical_to_drf(self):
+        self.assertIsNotNone(builder_for(EventListSerializer))
+        for serializer_class, queryset, many in (
+            (EventListSerializer, Event.objects.all(), True),
+            (EventDetailSerializer, Event.objects.filter(pk=self.events[0].pk), False),
+            (TicketSerializer, Ticket.objects.all(), True),
+        ):
+            drf, compiled = self.render_both(serializer_class, queryset, many)
+            self.assertEqual(drf, compiled)
+        self.assertIn(b'http://testserver/media/event_images/poster.jpg', compiled)
+
+    def test_unsupported_fields_render_normally(self):
+        class WithMethod(CompiledSerializerMixin, serializers.ModelSerializer):
+            shout = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Artist
+                fields = ['id', 'shout']
+
+            def get_shout(self, artist):
+                return artist.name.upper()
+
+        self.assertIsNone(builder_for(WithMethod))
+        self.assertEqual(WithMethod(Artist.objects.first()).data['shout'], 'ARTIST 0')
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'line\u2028sep\u2029 \u00e9 "quoted" \\ \x00',
+            'floats': [52.37, 0.00001, 1e16, 1e-7, 123456.789, -0.0],
+            'ints': [0, -1, 2 ** 63 - 1, 2 ** 70],
+            'when': timezone.now(),
+            'price': Decimal('9.99'),
+            'nested': [{'a': None, 'b': True}],
+            3: 'non-string key',
+        }
+        for value in (data, {'plain': [1, 'two', 3.5]}, [], None):
+            self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+
+    def test_fast_renderer_writes_non_finite_floats_as_null(self):
+        data = {'latitude': float('nan'), 'distance_km': [float('inf'), -float('inf')]}
+        self.assertEqual(FastJSONRenderer().render(data),
+                         b'{"latitude":null,"distance_km":[null,null]}')
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user('host', is_organizer=True)
+        self.artists = [Artist.objects.create(name=f'Artist {i}') for i in range(2)]
+        self.event = make_event(self.host, description='Long ' * 100)
+        self.event.artists.set(self.artists)
+        Ticket.objects.create(user=self.host, event=self.event)
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def test_fields_are_neither_serialized_nor_fetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/events/', {'fields': 'id,title,remaining_tickets'})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.event.pk, 'title': 'Festival', 'remaining_tickets': 100},
+        ])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('festify_artist', sql)
+
+    def test_expand_collapses_nested_objects_to_keys(self):
+        response = self.client.get(f'/api/events/{self.event.pk}/', {'expand': 'artists'})
+        data = response.json()
+        self.assertEqual(data['host'], self.host.pk)
+        self.assertEqual(data['artists'][0]['name'], 'Artist 0')
+
+        response = self.client.get('/api/events/', {'fields': 'id,artists', 'expand': ''})
+        self.assertEqual(response.json()['results'][0]['artists'], [a.pk for a in self.artists])
+
+    def test_profile_and_tickets(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/profile/', {
+                'fields': 'username,tickets.event.title,tickets.event.start_datetime',
+            })
+        data = response.json()
+        self.assertEqual(set(data), {'username', 'tickets'})
+        self.assertEqual(set(data['tickets'][0]), {'event'})
+        self.assertEqual(set(data['tickets'][0]['event']), {'title', 'start_datetime'})
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('"description"', sql)
+
+        response = self.client.get('/api/profile/tickets/', {'fields': 'id,event', 'expand': ''})
+        self.assertEqual(response.json()[0]['event'], self.event.pk)
+
+    def test_compiled_output_matches_drf(self):
+        params = {'fields': 'id,title,host,artists.name,remaining_tickets', 'expand': 'artists'}
+        rendered = []
+        for compiled in (False, True):
+            with override_settings(FESTIFY_COMPILED_SERIALIZERS=compiled):
+                cache.clear()
+                rendered.append(self.client.get(f'/api/events/{self.event.pk}/', params).content)
+        self.assertEqual(rendered[0], rendered[1])
+        self.assertEqual(json.loads(rendered[1])['artists'], [{'name': 'Artist 0'}, {'name': 'Artist 1'}])
+
+
+class AttendeeExportTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.event = make_event(self.host)
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def add_attendees(self, count):
+        # Plain SQL: creating this many rows through the ORM takes minutes.
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s) '
+                'INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, '
+                'email, is_staff, is_active, date_joined) '
+                "SELECT '', %s, 'fan' || i, 'Fan', 'Number ' || i, 'fan' || i || '@example.com', "
+                '%s, %s, %s FROM n',
+                [count, False, False, True, now],
+            )
+            cursor.execute(
+                'INSERT INTO festify_ticket (user_id, event_id, purchase_datetime) '
+                "SELECT id, %s, %s FROM auth_user WHERE username LIKE 'fan%%'",
+                [self.event.pk, now],
+            )
+
+    def export(self, **params):
+        response = self.client.get(f'/api/events/{self.event.pk}/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_csv_and_ndjson(self):
+        self.add_attendees(3)
+        lines = b''.join(self.export().streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'ticket_id,purchased_at,user_id,username,email,first_name,last_name')
+        self.assertEqual(len(lines), 4)
+        self.assertIn(',fan1,fan1@example.com,Fan,Number 1', lines[1])
+
+        response = self.export(**{'as': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['fan1', 'fan2', 'fan3'])
+
+    def test_csv_neutralizes_formulas(self):
+        fan = make_user('@fan')
+        User.objects.filter(pk=fan.pk).update(
+            email='fan@example.com', first_name='=HYPERLINK("http://x")', last_name='-1+2'
+        )
+        Ticket.objects.create(user=fan, event=self.event)
+        lines = b''.join(self.export().streaming_content).decode().splitlines()
+        self.assertIn(',\'@fan,fan@example.com,"\'=HYPERLINK(""http://x"")",\'-1+2', lines[1])
+
+        response = self.export(**{'as': 'ndjson'})
+        row = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((row['username'], row['first_name']), ('@fan', '=HYPERLINK("http://x")'))
+
+    def test_host_only(self):
+        self.client.force_authenticate(make_user('other', is_organizer=True))
+        self.assertEqual(self.client.get(f'/api/events/{self.event.pk}/export/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(f'/api/events/{self.event.pk}/export/').status_code, 401)
+
+    def test_memory_stays_bounded(self):
+        import tracemalloc
+
+        self.add_attendees(500_000)
+        response = self.export()
+        tracemalloc.start()
+        try:
+            lines = 0
+            for chunk in response.streaming_content:
+                lines += chunk.count(b'\n')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(lines, 500_001)
+        # The whole CSV is ~40 MB; streaming keeps a few chunks around.
+        self.assertLess(peak, 5 * 1024 * 1024)
+
+
+class ImportLineupTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.artists = self.write('artists.csv', (
+            'type,name,genre\n'
+            'artist,Band,rock\n'
+            'artist,DJ,techno\n'
+            'artist,Band,\n'
+        ))
+        records = [
+            {'type': 'stage', 'name': 'Main', 'order': 1},
+            {'type': 'event', 'title': 'Festival', 'start_datetime': '2030-07-01T12:00:00+00:00',
+             'description': 'Music all day', 'location_name': 'Park', 'address': 'Main street 1',
+             'latitude': 52.37, 'longitude': 4.89, 'ticket_price': '10.00', 'capacity': 100,
+             'artists': ['Band']},
+            {'type': 'performance', 'event': 'Festival', 'event_start': '2030-07-01T12:00:00+00:00',
+             'stage': 'Main', 'artist': 'DJ', 'start_time': '20:00', 'end_time': '22:00'},
+        ]
+        self.lineup = self.write('lineup.jsonl', ''.join(json.dumps(record) + '\n' for record in records))
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as handle:
+            handle.write(content)
+        return path
+
+    def run_import(self, *paths):
+        out = io.StringIO()
+        call_command('import_lineup', *paths, host='host', batch_size=2, stdout=out)
+        return out.getvalue()
+
+    def test_import_and_rerun(self):
+        cursor = sync.current_cursor()
+        self.run_import(self.artists, self.lineup)
+
+        event = Event.objects.get()
+        self.assertEqual(event.host, self.host)
+        self.assertEqual(event.geo_cell, cell_for(52.37, 4.89))
+        self.assertEqual(sorted(event.artists.values_list('name', flat=True)), ['Band', 'DJ'])
+        self.assertEqual(Artist.objects.get(name='Band').genre, 'rock')
+        self.assertEqual(event.performances.get().stage.name, 'Main')
+        self.assertEqual(search_event_ids('dj'), [event.pk])
+        changes = ChangeLogEntry.objects.filter(pk__gt=cursor)
+        self.assertEqual(set(changes.values_list('model', flat=True)),
+                         {'artist', 'stage', 'event', 'performance'})
+
+        cursor = sync.current_cursor()
+        output = self.run_import(self.artists, self.lineup)
+        self.assertIn('event: 0 created, 0 updated, 1 unchanged', output)
+        self.assertIn('lineup: 0 links added', output)
+        self.assertEqual(Artist.objects.count(), 2)
+        self.assertEqual(Performance.objects.count(), 1)
+        self.assertEqual(sync.current_cursor(), cursor)
+
+    def test_updates_changed_rows(self):
+        self.run_import(self.artists, self.lineup)
+        renamed = self.write('genres.csv', 'name,genre\nDJ,house\n')
+        output = io.StringIO()
+        call_command('import_lineup', renamed, type='artist', stdout=output)
+        self.assertIn('artist: 0 created, 1 updated, 0 unchanged', output.getvalue())
+        self.assertEqual(Artist.objects.get(name='DJ').genre, 'house')
+        self.assertEqual(search_event_ids('house'), [Event.objects.get().pk])
+
+    def test_bad_rows_name_their_location(self):
+        missing = self.write('missing.jsonl', json.dumps({
+            'type': 'performance', 'event': 'Nope', 'event_start': '2030-07-01T12:00:00+00:00',
+            'stage': 'Main', 'artist': 'DJ', 'start_time': '20:00', 'end_time': '22:00',
+        }) + '\n')
+        with self.assertRaisesMessage(CommandError, f"{missing}:1: no event 'Nope'"):
+            self.run_import(missing)
+
+        bad = self.write('bad.csv', 'type,title,start_datetime\nevent,Festival,soon\n')
+        with self.assertRaisesMessage(CommandError, f'{bad}:2: start_datetime'):
+            self.run_import(bad)
+
+    def test_reports_conflicts(self):
+        clash = self.write('clash.jsonl', json.dumps({
+            'type': 'performance', 'event': 'Festival', 'event_start': '2030-07-01T12:00:00+00:00',
+            'stage': 'Main', 'artist': 'Band', 'start_time': '21:00', 'end_time': '23:00',
+        }) + '\n')
+        output = self.run_import(self.artists, self.lineup, clash)
+        self.assertIn('1 schedule conflicts:', output)
+        self.assertIn('DJ (20:00-22:00) overlaps Band (21:00-23:00, Festival) on Main', output)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        benchmarks.seed(users=30, events=6, artists=10, stages=2, performances=3, tickets=60, seed=7,
+                        revoked=50)
+
+    def test_seed_is_skewed_and_repeatable(self):
+        counts = benchmarks.dataset()
+        self.assertEqual(counts['events'], 6)
+        self.assertEqual(counts['performances'], 18)
+        self.assertEqual(counts['revoked'], 50)
+        sold = sorted(Event.objects.values_list('tickets_sold', flat=True), reverse=True)
+        self.assertEqual(sum(sold), counts['tickets'])
+        self.assertGreater(sold[0], 3 * sold[-1])
+
+        first = list(Ticket.objects.values_list('event__title', 'user__username').order_by('pk'))
+        benchmarks.clear()
+        self.assertFalse(benchmarks.is_seeded())
+        self.assertFalse(BlacklistedToken.objects.exists())
+        benchmarks.seed(users=30, events=6, artists=10, stages=2, performances=3, tickets=60, seed=7)
+        self.assertEqual(
+            list(Ticket.objects.values_list('event__title', 'user__username').order_by('pk')), first
+        )
+
+    def test_run_covers_every_scenario(self):
+        tickets = Ticket.objects.count()
+        results = benchmarks.run(requests=3, warmup=1)
+        self.assertEqual(set(results['scenarios']), set(benchmarks.SCENARIOS))
+        for name, result in results['scenarios'].items():
+            self.assertEqual(sum(result['statuses'].values()), 3, name)
+            expected = benchmarks.EXPECTED_STATUSES.get(name)
+            self.assertTrue(all(
+                int(status) in expected if expected else int(status) < 300
+                for status in result['statuses']
+            ), (name, result))
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+            self.assertIsNotNone(result['queries'])
+        # Trusted claims and the user cache spare the user lookup.
+        scenarios = results['scenarios']
+        self.assertEqual(
+            scenarios['auth-lookup']['queries']['max'] - scenarios['auth-claims']['queries']['max'], 1
+        )
+        self.assertEqual(scenarios['auth-cached']['queries']['max'], scenarios['auth-claims']['queries']['max'])
+        # Buys are rolled back.
+        self.assertEqual(Ticket.objects.count(), tickets)
+        self.assertEqual(results['meta']['dataset']['events'], 6)
+
+        lines = benchmarks.compare(results, results)
+        self.assertIn('p50', lines[0])
+
+
+class CalendarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user('host', is_organizer=True)
+        self.client = APIClient()
+
+    def at(self, day, hour=18):
+        return timezone.make_aware(datetime(2030, 7, day, hour))
+
+    def get(self, **params):
+        response = self.client.get('/api/calendar/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_month_buckets(self):
+        # Runs from June 29 into July 2.
+        make_event(self.host, title='Long', start_datetime=self.at(1) - timedelta(days=2),
+                   end_datetime=self.at(2))
+        make_event(self.host, title='Gig', start_datetime=self.at(2, 20))
+        make_event(self.host, title='August', start_datetime=self.at(31) + timedelta(days=1))
+
+        data = self.get(year=2030, month=7)
+        self.assertEqual((data['start'], data['end'], len(data['days'])), ('2030-07-01', '2030-07-31', 31))
+        self.assertEqual([e['title'] for e in data['days'][0]['events']], ['Long'])
+        self.assertEqual([e['title'] for e in data['days'][1]['events']], ['Long', 'Gig'])
+        self.assertEqual(data['days'][1]['count'], 2)
+        self.assertEqual(sum(day['count'] for day in data['days']), 3)
+
+        page = self.client.get('/calendar/2030/7/')
+        self.assertContains(page, 'Long', count=2)
+
+    @override_settings(FESTIFY_CALENDAR={'DAY_LIMIT': 2})
+    def test_week_and_day_limit(self):
+        for index in range(5):
+            make_event(self.host, title=f'Event {index}', start_datetime=self.at(3, 12 + index))
+        data = self.get(granularity='week', year=2030, week=27)
+        self.assertEqual((data['start'], data['week']), ('2030-07-01', 27))
+        wednesday = data['days'][2]
+        self.assertEqual(wednesday['count'], 5)
+        self.assertEqual([e['title'] for e in wednesday['events']], ['Event 0', 'Event 1'])
+
+        self.assertEqual(self.client.get('/api/calendar/', {'granularity': 'day'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/calendar/', {'month': 13}).status_code, 400)
+
+    def test_first_and_last_years_are_rejected(self):
+        for params in ({'year': 9999, 'month': 12}, {'year': 9999, 'week': 52},
+                       {'year': 1, 'month': 1}, {'year': 0, 'month': 1}):
+            self.assertEqual(self.client.get('/api/calendar/', params).status_code, 400, params)
+        # An event longer than the years before the window leaves no lower bound.
+        make_event(self.host, start_datetime=self.at(5), end_datetime=self.at(5) + timedelta(days=365 * 3000))
+        for params in ({'year': 9998, 'month': 12}, {'year': 2, 'week': 1}):
+            self.assertEqual(self.client.get('/api/calendar/', params).status_code, 200, params)
+
+    def test_one_range_query(self):
+        make_event(self.host, start_datetime=self.at(5), end_datetime=self.at(6))
+        self.get(year=2030, month=6)
+        with CaptureQueriesContext(connection) as queries:
+            self.get(year=2030, month=7)
+        # The ETag's aggregate over the window, then the buckets' range query.
+        self.assertEqual(len(queries), 2)
+
+
+class ScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = make_event(
+            make_user('host', is_organizer=True), title='Summer Fest',
+            start_datetime=timezone.make_aware(datetime(2026, 7, 10, 10)),
+            end_datetime=timezone.make_aware(datetime(2026, 7, 10, 23, 30)),
+        )
+        self.main = Stage.objects.create(name='Main', order=1)
+        self.tent = Stage.objects.create(name='Tent', order=2)
+        artist = Artist.objects.create(name='Band')
+        self.sets = {
+            title: Performance.objects.create(
+                event=self.event, artist=artist, stage=self.main, title=title,
+                start_time=start, end_time=end,
+            )
+            for title, start, end in (
+                ('Opener', '12:00', '13:00'), ('Second', '14:00', '15:00'), ('Late', '23:00', '02:00'),
+            )
+        }
+        self.client = APIClient()
+
+    def now_playing(self, at):
+        response = self.client.get('/api/schedule/now/', {'at': at})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def titles(self, at):
+        return [
+            ((stage['now'] or {}).get('title'), (stage['next'] or {}).get('title'))
+            for stage in self.now_playing(at).json()['stages']
+        ]
+
+    def test_now_and_next_per_stage(self):
+        self.assertEqual(self.titles('2026-07-10T12:30:00'), [('Opener', 'Second'), (None, None)])
+        self.assertEqual(self.titles('2026-07-10T13:30:00'), [(None, 'Second'), (None, None)])
+        self.assertEqual(self.titles('2026-07-10T09:00:00'), [(None, 'Opener'), (None, None)])
+        self.assertIn('max-age=30', self.now_playing('2026-07-10T12:59:30')['Cache-Control'])
+        for at in ('soon', '2026-13-01T10:00:00', '2026-02-30T10:00'):
+            self.assertEqual(self.client.get('/api/schedule/now/', {'at': at}).status_code, 400, at)
+        self.assertEqual(views.now_playing.query_budget, 2)
+
+    def test_late_sets_run_past_midnight(self):
+        self.assertEqual(self.titles('2026-07-10T23:30:00')[0], ('Late', None))
+        self.assertEqual(self.titles('2026-07-11T01:00:00')[0], ('Late', None))
+        self.assertEqual(self.titles('2026-07-11T03:00:00')[0], (None, None))
+
+    def test_rebuilt_only_after_changes(self):
+        self.now_playing('2026-07-10T12:30:00')
+        with CaptureQueriesContext(connection) as queries:
+            self.now_playing('2026-07-10T12:40:00')
+        self.assertEqual(len(queries), 0)
+
+        opener = self.sets['Opener']
+        opener.end_time = '12:20'
+        opener.save()
+        self.assertEqual(self.titles('2026-07-10T12:30:00')[0], (None, 'Second'))
+        self.tent.name = 'Big Tent'
+        self.tent.save()
+        self.assertEqual(self.now_playing('2026-07-10T12:30:00').json()['stages'][1]['name'], 'Big Tent')
+
+        cache.clear()
+        opener.delete()
+        self.assertEqual(self.titles('2026-07-10T12:10:00')[0], (None, 'Second'))
+
+    def test_home_page(self):
+        moment = timezone.make_aware(datetime(2026, 7, 10, 12, 30))
+        with mock.patch('django.utils.timezone.now', return_value=moment):
+            response = self.client.get('/')
+        self.assertContains(response, 'Now: Opener (Summer Fest)')
+        self.assertContains(response, 'Next: Second at 14:00')
+
+
+class ConflictTests(TestCase):
+    def setUp(self):
+        self.host = make_user('host', is_organizer=True)
+        self.event = make_event(
+            self.host, start_datetime=timezone.make_aware(datetime(2030, 7, 1, 12)),
+            end_datetime=timezone.make_aware(datetime(2030, 7, 2, 23)),
+        )
+        self.main, self.tent = (Stage.objects.create(name=name) for name in ('Main', 'Tent'))
+        self.band, self.dj = (Artist.objects.create(name=name) for name in ('Band', 'DJ'))
+
+    def perform(self, stage, artist, start, end, event=None):
+        return Performance.objects.create(
+            event=event or self.event, stage=stage, artist=artist, start_time=start, end_time=end,
+        )
+
+    def pairs(self, event=None):
+        return sorted(
+            (conflict['type'], *sorted(slot.id for slot in conflict['performances']))
+            for conflict in conflicts.for_events([(event or self.event).pk])
+        )
+
+    def test_stage_and_artist_overlaps(self):
+        late = self.perform(self.main, self.band, '23:00', '01:30')
+        dj = self.perform(self.main, self.dj, '01:00', '02:00')
+        early = self.perform(self.tent, self.band, '18:00', '19:00')
+        self.perform(self.tent, self.dj, '19:00', '20:00')
+        double = self.perform(self.main, self.band, '18:30', '19:30')
+        self.assertEqual(self.pairs(), [
+            ('artist', early.pk, double.pk), ('stage', late.pk, dj.pk),
+        ])
+
+        other = make_event(
+            self.host, start_datetime=timezone.make_aware(datetime(2030, 7, 3, 10)),
+            end_datetime=timezone.make_aware(datetime(2030, 7, 3, 23)),
+        )
+        # The late set of 2 July still plays at 01:00 on the 3rd.
+        morning = self.perform(self.tent, self.band, '01:00', '03:00', event=other)
+        self.perform(self.main, self.dj, '18:00', '19:00', event=other)
+        self.assertEqual(self.pairs(other), [('artist', late.pk, morning.pk)])
+
+    def test_admin_form_and_inline(self):
+        self.perform(self.main, self.band, '20:00', '22:00')
+        data = {'event': self.event.pk, 'stage': self.main.pk, 'artist': self.dj.pk,
+                'title': '', 'start_time': '21:00', 'end_time': '23:00', 'description': ''}
+        form = PerformanceAdminForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('DJ (21:00-23:00) overlaps Band (20:00-22:00, Festival) on Main',
+                      form.non_field_errors()[0])
+        self.assertTrue(PerformanceAdminForm({**data, 'start_time': '22:00'}).is_valid())
+
+        formset_class = inlineformset_factory(
+            Event, Performance, formset=PerformanceInlineFormSet, fields='__all__', extra=0,
+        )
+        existing = Performance.objects.get()
+        prefix = formset_class.get_default_prefix()
+        rows = {
+            f'{prefix}-TOTAL_FORMS': '2', f'{prefix}-INITIAL_FORMS': '1',
+            f'{prefix}-0-id': existing.pk, f'{prefix}-0-stage': self.main.pk,
+            f'{prefix}-0-artist': self.band.pk, f'{prefix}-0-start_time': '20:00',
+            f'{prefix}-0-end_time': '21:00',
+            f'{prefix}-1-stage': self.main.pk, f'{prefix}-1-artist': self.dj.pk,
+            f'{prefix}-1-start_time': '20:30', f'{prefix}-1-end_time': '23:00',
+        }
+        self.assertFalse(formset_class(rows, instance=self.event).is_valid())
+        rows[f'{prefix}-1-start_time'] = '21:00'
+        self.assertTrue(formset_class(rows, instance=self.event).is_valid())
+
+    def test_event_endpoint(self):
+        first = self.perform(self.main, self.band, '20:00', '22:00')
+        second = self.perform(self.main, self.dj, '21:00', '23:00')
+        client = APIClient()
+        client.force_authenticate(self.host)
+        response = client.get(f'/api/events/{self.event.pk}/conflicts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{
+            'type': 'stage', 'stage': self.main.pk,
+            'performances': [
+                {'id': first.pk, 'event': self.event.pk, 'title': 'Band', 'stage': self.main.pk,
+                 'artist': self.band.pk, 'start_time': '20:00:00', 'end_time': '22:00:00'},
+                {'id': second.pk, 'event': self.event.pk, 'title': 'DJ', 'stage': self.main.pk,
+                 'artist': self.dj.pk, 'start_time': '21:00:00', 'end_time': '23:00:00'},
+            ],
+        }])
+        client.force_authenticate(make_user('other', is_organizer=True))
+        self.assertEqual(client.get(f'/api/events/{self.event.pk}/conflicts/').status_code, 403)
+
+
+@override_settings(FESTIFY_AUTH={'TRUST_CLAIMS': True})
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.clear()
+        self.host = make_user('host', is_organizer=True, password='secret-pass')
+        self.event = make_event(self.host)
+        self.client = APIClient()
+        response = self.client.post('/api/auth/login/', {'username': 'host', 'password': 'secret-pass'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def auth_queries(self, method, url):
+        """The response, and the queries that loaded the user or its profile."""
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url)
+        return response, [
+            q['sql'] for q in queries
+            if q['sql'].startswith('SELECT "festify_userprofile"."id"')
+            or q['sql'].startswith('SELECT "auth_user"."id"') and '"festify_userprofile"' in q['sql']
+        ]
+
+    def test_permissions_come_from_claims(self):
+        response, queries = self.auth_queries('get', f'/api/events/{self.event.pk}/conflicts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+        # Other fields load the user once; later requests reuse it.
+        response, queries = self.auth_queries('get', '/api/profile/')
+        self.assertEqual(response.data['email'], 'host@example.com')
+        self.assertEqual(len(queries), 1)
+        response, queries = self.auth_queries('get', '/api/profile/?fields=email')
+        self.assertEqual(queries, [])
+        response = self.client.post(f'/api/events/{make_event(self.host).pk}/buy/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Ticket.objects.filter(user=self.host).exists())
+
+    def test_changes_outdate_claims(self):
+        profile = self.host.profile
+        profile.is_organizer = False
+        profile.save()
+        self.assertEqual(self.client.get(f'/api/events/{self.event.pk}/conflicts/').status_code, 403)
+
+        self.host.is_active = False
+        self.host.save()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+        self.host.delete()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_lost_stamp_never_matches_old_tokens(self):
+        profile = self.host.profile
+        profile.is_organizer = False
+        profile.save()
+        # The cache loses the stamp, and the user is saved a few times more.
+        cache.clear()
+        for _ in range(3):
+            profile.save()
+        response = self.client.post('/api/events/', {'title': 'Encore'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_claims_untrusted_without_shared_cache(self):
+        url = f'/api/events/{self.event.pk}/conflicts/'
+        with override_settings(FESTIFY_AUTH={'TRUST_CLAIMS': 'shared-cache'}):
+            # The claims aren't used, but the loaded user is cached.
+            response, queries = self.auth_queries('get', url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(queries), 1)
+            response, queries = self.auth_queries('get', url)
+            self.assertEqual(queries, [])
+
+            # Another worker's change shows once the entry expires...
+            UserProfile.objects.filter(user=self.host).update(is_organizer=False)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            with mock.patch('time.monotonic', return_value=time_module.monotonic() + 61):
+                self.assertEqual(self.client.get(url).status_code, 403)
+
+            # ...and a change saved in this process right away.
+            profile = UserProfile.objects.get(user=self.host)
+            profile.is_organizer = True
+            profile.save()
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(FESTIFY_REVOCATION={'USE_FILTER': True})
+class RevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        revocation.reset()
+        self.user = make_user('fan', password='secret-pass')
+        self.client = APIClient()
+        self.tokens = self.client.post('/api/auth/login/', {'username': 'fan', 'password': 'secret-pass'}).data
+
+    def refresh(self):
+        return self.client.post('/api/auth/refresh/', {'refresh': self.tokens['refresh']})
+
+    def test_refresh_skips_blacklist_until_logout(self):
+        self.assertEqual(self.refresh().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.refresh()
+        self.assertIn('access', response.data)
+        self.assertFalse([q for q in queries if 'token_blacklist' in q['sql']])
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        response = self.client.post('/api/auth/logout/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh().status_code, 401)
+        self.assertEqual(self.client.post('/api/auth/refresh/', {}).status_code, 400)
+
+    def test_revocations_by_other_processes(self):
+        self.refresh()
+        # Another process blacklists the token and changes the stamp.
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get())
+        self.assertEqual(self.refresh().status_code, 200)
+        revocation._changed(revocation.CHANGED_KEY)
+        self.assertEqual(self.refresh().status_code, 401)
+
+    def test_new_process_starts_from_shared_filter(self):
+        self.refresh()
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get())
+        revocation.reset()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh().status_code, 401)
+        # Only the rows past the shared copy are read, not the whole blacklist.
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+    def test_sync_reads_rows_committed_late(self):
+        self.refresh()
+        other = OutstandingToken.objects.create(jti='other', token='', expires_at=timezone.now() + timedelta(days=1))
+        BlacklistedToken.objects.create(id=100, token=other)
+        revocation._changed(revocation.CHANGED_KEY)
+        self.assertEqual(self.refresh().status_code, 200)
+        # A row whose id was handed out earlier commits after id 100 was read.
+        BlacklistedToken.objects.create(id=50, token=OutstandingToken.objects.exclude(pk=other.pk).get())
+        revocation._changed(revocation.CHANGED_KEY)
+        self.assertEqual(self.refresh().status_code, 401)
+
+    def test_per_process_cache_checks_the_table(self):
+        self.refresh()
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get())
+        # No stamp change reaches this process, but the table is read.
+        with override_settings(FESTIFY_REVOCATION={'USE_FILTER': 'shared-cache'}):
+            self.assertEqual(self.refresh().status_code, 401)
+
+    def test_bloom_filter_error_rate(self):
+        bloom = revocation.BloomFilter(5000, 0.01)
+        for index in range(5000):
+            bloom.add(f'revoked-{index}')
+        self.assertTrue(all(f'revoked-{index}' in bloom for index in range(5000)))
+        false_positives = sum(f'live-{index}' in bloom for index in range(20_000))
+        self.assertLess(false_positives, 20_000 * 0.02)
+
+    def test_prune_tokens(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        tokens = OutstandingToken.objects.bulk_create(
+            OutstandingToken(jti=f'old-{index}', token='', expires_at=expired) for index in range(5)
+        )
+        BlacklistedToken.objects.bulk_create(BlacklistedToken(token=token) for token in tokens[:3])
+        out = io.StringIO()
+        call_command('prune_tokens', batch_size=2, stdout=out)
+        self.assertIn('Removed 5 expired tokens, 3 of them blacklisted', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertEqual(self.refresh().status_code, 200)
+
+
+class AccountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, username, email):
+        return self.client.post('/api/auth/register/', {
+            'username': username, 'email': email,
+            'password': 'secret-pass', 'confirm_password': 'secret-pass',
+        })
+
+    def test_email_is_unique_and_logs_in_ignoring_case(self):
+        self.assertEqual(self.register('fan', 'Fan@Example.com').status_code, 201)
+        response = self.register('other', 'fan@example.COM')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/auth/login/', {'username': 'FAN@example.com', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('LOWER("auth_user"."email")', queries[0]['sql'])
+
+    def test_non_ascii_email_logs_in(self):
+        # SQLite's LOWER() leaves the É alone; str.lower() does not.
+        user = User.objects.create_user('elise', email='Élise@exemple.fr', password='secret-pass')
+        UserProfile.objects.create(user=user)
+        self.assertEqual(self.register('lea', 'Lea@Écoles.fr').status_code, 201)
+        for email in ('Élise@exemple.fr', 'ÉLISE@EXEMPLE.FR', 'Lea@Écoles.fr', 'LEA@écoles.fr'):
+            response = self.client.post('/api/auth/login/', {'username': email, 'password': 'secret-pass'})
+            self.assertEqual(response.status_code, 200, email)
+        self.assertEqual(self.register('other', 'lea@ÉCOLES.FR').status_code, 400)
+
+    def test_registration_is_one_transaction(self):
+        with mock.patch.object(UserProfile.objects, 'create', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                self.register('fan', 'fan@example.com')
+        self.assertFalse(User.objects.exists())
+
+    def test_provision_users(self):
+        make_user('taken')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'holders.csv')
+        with open(path, 'w') as handle:
+            handle.write(
+                'email,username,password\n'
+                'One@Example.com,,pass-one\n'
+                'two@example.com,two,\n'
+                'ONE@example.com,again,pass-one\n'
+                'TAKEN@example.com,new,pass\n'
+                'three@example.com,three,pass-three\n'
+            )
+        out = io.StringIO()
+        call_command('provision_users', path, iterations=1000, batch_size=2, stdout=out)
+        self.assertIn('Created 3 accounts, skipped 2 existing', out.getvalue())
+
+        one = User.objects.get(username='one@example.com')
+        self.assertTrue(one.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(UserProfile.objects.filter(user=one).exists())
+        self.assertFalse(User.objects.get(username='two').has_usable_password())
+        # The first login re-hashes at the default cost.
+        response = self.client.post('/api/auth/login/', {'username': 'one@example.com', 'password': 'pass-one'})
+        self.assertEqual(response.status_code, 200)
+        one.refresh_from_db()
+        self.assertFalse(one.password.startswith('pbkdf2_sha256$1000$'))
+
+        call_command('provision_users', path, iterations=1000, stdout=out)
+        self.assertEqual(User.objects.count(), 4)
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        self.addCleanup(throttling.reset)
+        self.user = make_user('fan', password='secret-pass')
+        self.client = APIClient()
+
+    def login(self, username, password='wrong-pass'):
+        return self.client.post('/api/auth/login/', {'username': username, 'password': password})
+
+    @override_settings(FESTIFY_THROTTLE={'POLICIES': {'login': (('username', 3, 60),)}})
+    def test_login_rejected_before_authenticate(self):
+        for _ in range(3):
+            self.assertEqual(self.login('fan').status_code, 401)
+        with mock.patch('festify.views.authenticate') as authenticate:
+            response = self.login('FAN')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+        # Other accounts are counted separately.
+        self.assertEqual(self.login('other').status_code, 401)
+
+    @override_settings(FESTIFY_THROTTLE={'POLICIES': {'login': (('username', 4, 60),)}})
+    def test_username_and_email_share_a_budget(self):
+        codes = [self.login(name).status_code for name in ('fan', 'Fan@Example.com') * 3]
+        self.assertEqual(codes, [401] * 4 + [429] * 2)
+        # Unknown emails are counted as given.
+        self.assertEqual(self.login('nobody@example.com').status_code, 401)
+
+    def test_sliding_window(self):
+        for store in ('local', 'cache'):
+            throttling.reset()
+            policies = {'login': (('ip', 4, 10),)}
+            with override_settings(FESTIFY_THROTTLE={'STORE': store, 'POLICIES': policies}), \
+                    mock.patch.object(throttling.PolicyThrottle, 'clock') as clock:
+                clock.return_value = 1000.0
+                codes = [self.login('fan').status_code for _ in range(5)]
+                self.assertEqual(codes, [401] * 4 + [429], store)
+                # Half a window later the 5 earlier requests still count as 2.5.
+                clock.return_value = 1015.0
+                codes = [self.login('fan').status_code for _ in range(2)]
+                self.assertEqual(codes, [401, 429], store)
+                clock.return_value = 1030.0
+                self.assertEqual(self.login('fan', 'secret-pass').status_code, 200, store)
+
+    @override_settings(FESTIFY_THROTTLE={'POLICIES': {'buy': (('user', 1, 60),)}})
+    def test_buy_policy(self):
+        event = make_event(make_user('host', is_organizer=True))
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(f'/api/events/{event.pk}/buy/').status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/events/{event.pk}/buy/')
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse([q for q in queries if 'festify_ticket' in q['sql']])
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.host = make_user('host', is_organizer=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def upload(self, size=(2000, 1000), name='poster.jpg'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def open_variant(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_upload_queues_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/events/', {
+                'title': 'Festival', 'description': 'Music all day',
+                'start_datetime': '2030-07-01T12:00:00Z', 'location_name': 'Park',
+                'address': 'Main street 1', 'ticket_price': '10.00', 'capacity': 100,
+                'image': self.upload(),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        event = Event.objects.get()
+        names = [images.variant_name(event.image_hash, variant, width, extension)
+                 for variant, width in images.get_config()['VARIANTS'].items()
+                 for extension in ('webp', 'jpg')]
+        deadline = time_module.monotonic() + 10
+        while not all(default_storage.exists(name) for name in names):
+            self.assertLess(time_module.monotonic(), deadline, 'variants were not written')
+            time_module.sleep(0.05)
+
+        variants = self.client.get(f'/api/events/{event.pk}/').data['image_variants']
+        self.assertEqual((variants['card']['width'], variants['card']['height']), (480, 240))
+        self.assertIn(f"{variants['thumbnail']['webp']} 160w", variants['srcset']['webp'])
+        _, image = self.open_variant(variants['card']['webp'])
+        self.assertEqual((image.format, image.size), ('WEBP', (480, 240)))
+
+        # A new upload gets new URLs.
+        old = variants['full']['jpeg']
+        event.image = self.upload(size=(800, 600), name='other.jpg')
+        event.save()
+        variants = event.image_variants
+        self.assertNotEqual(variants['full']['jpeg'], old)
+        self.assertEqual(variants['full']['width'], 800)
+
+    @override_settings(FESTIFY_IMAGES={'EAGER': False})
+    def test_variants_made_on_first_request(self):
+        event = make_event(self.host, image=self.upload(size=(300, 600)))
+        variants = event.image_variants
+        self.assertEqual((variants['thumbnail']['width'], variants['thumbnail']['height']), (160, 320))
+        # Narrower than the variant: re-encoded, not enlarged.
+        self.assertEqual(variants['card']['width'], 300)
+
+        response, image = self.open_variant(variants['thumbnail']['jpeg'])
+        self.assertEqual((image.format, image.size), ('JPEG', (160, 320)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        directory = f"{images.get_config()['DIRECTORY']}/{event.image_hash}"
+        self.assertEqual(default_storage.listdir(directory)[1], ['thumbnail-160.jpg'])
+
+        base = f'/media/{directory}'
+        self.assertEqual(self.client.get(f'{base}/thumbnail-161.jpg').status_code, 404)
+        self.assertEqual(self.client.get(f'{base}/huge-160.jpg').status_code, 404)
+        self.assertEqual(self.client.get(f'/media/{images.get_config()["DIRECTORY"]}/{"0" * 16}/card-480.jpg').status_code, 404)
+
+
+class ConcurrentBuyTests(TransactionTestCase):
+    """Fire thousands of concurrent buys at a small event and check nothing oversells."""
+
+    buyers = 2000
+    workers = 32
+    capacity = 150
+
+    def test_no_oversell_under_concurrency(self):
+        host = make_user('host', is_organizer=True)
+        event = make_event(host, capacity=self.capacity)
+        User.objects.bulk_create(User(username=f'fan{i}') for i in range(self.buyers))
+        pending = list(User.objects.filter(username__startswith='fan'))
+        outcomes = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(self.workers)
+
+        def worker():
+            start.wait()
+            try:
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        user = pending.pop()
+                    # SQLite reports lock contention instead of waiting, so
+                    # retry until the buyer gets a definite answer.
+                    outcome = 'gave up'
+                    deadline = time_module.monotonic() + 30
+                    for attempt in itertools.count():
+                        if time_module.monotonic() > deadline:
+                            break
+                        try:
+                            purchase_ticket(user, event)
+                            outcome = 'bought'
+                            break
+                        except SoldOut:
+                            outcome = 'sold out'
+                            break
+                        except OperationalError:
+                            # Back off so the writer holding the lock can finish.
+                            time_module.sleep(min(attempt, 20) / 1000)
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        event.refresh_from_db()
+        sold = Ticket.objects.filter(event=event).count()
+        self.assertEqual(sold, self.capacity)
+        self.assertEqual(event.tickets_sold, sold)
+        # Every buyer got an answer: a ticket or sold out.
+        self.assertEqual(outcomes, {'bought': self.capacity, 'sold out': self.buyers - self.capacity})
@@ -0,0 +1,220 @@
+"""
+Sliding-window rate limits for login, registration and ticket purchases.
+
+Each route names a policy in POLICIES: a list of (key, limit, window) rules
+that must all pass. The key says what is counted:
+
+    ip        the client address (DRF's get_ident, so NUM_PROXIES applies)
+    username  the account named by the username or email in the request
+              body: an email of an existing user counts as that user's
+              username (one indexed lookup), so alternating between the
+              two doesn't double the budget; anything else is lowercased
+    user      the authenticated user
+
+The throttles are DRF throttle classes, which run after authentication and
+permissions but before the view, so a rejected login never reaches
+authenticate() and its password hashing. A rejection is DRF's 429 with a
+Retry-After of the seconds until the estimate falls under the limit.
+
+Windows are counted with the sliding-window counter: every key keeps a
+count for the current fixed window and the one before, and the estimate is
+the current count plus the previous count weighted by how much of the
+previous window still overlaps the sliding one. That is two integers per
+key however many requests arrive, and every request is counted, including
+rejected ones, so a client has to back off for the window to clear.
+
+The counts live in a store. `LocalStore` keeps them in this process
+(bounded to LOCAL_MAX_KEYS, least recently used dropped first), which
+costs no round trip but multiplies the limits by the number of worker
+processes. `CacheStore` keeps them in a Django cache alias (CACHE), shared
+by every process pointed at it. STORE picks one by name or dotted path.
+
+A username rule lets anyone lock an account out of logging in for one
+window by guessing at it; keep that window short.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from .accounts import email_lookup
+
+DEFAULTS = {
+    'ENABLED': True,
+    'STORE': 'local',         # 'local', 'cache' or a dotted path to a store class
+    'CACHE': 'default',       # alias for the cache store
+    'LOCAL_MAX_KEYS': 100_000,
+    'POLICIES': {
+        # (key, requests, seconds)
+        'login': (('ip', 30, 60), ('username', 10, 300)),
+        'register': (('ip', 10, 3600),),
+        # Per user only: a venue's Wi-Fi puts thousands of buyers behind
+        # one address, and the waiting room already paces the crowd.
+        'buy': (('user', 10, 60),),
+    },
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_THROTTLE', {})}
+
+
+# ============================================
+# STORES
+# ============================================
+
+class LocalStore:
+    """Window counts in this process."""
+
+    def __init__(self, config):
+        self.max_keys = config['LOCAL_MAX_KEYS']
+        self.counts = OrderedDict()   # key -> [window index, current, previous]
+        self.lock = threading.Lock()
+
+    def hit(self, key, index, window):
+        """Count one request in window `index`; returns (current, previous)."""
+        with self.lock:
+            entry = self.counts.get(key)
+            if entry is None:
+                entry = self.counts[key] = [index, 0, 0]
+                if len(self.counts) > self.max_keys:
+                    self.counts.popitem(last=False)
+            else:
+                self.counts.move_to_end(key)
+                if entry[0] != index:
+                    # Moving on by one window keeps the count as the previous one.
+                    entry[2] = entry[1] if entry[0] == index - 1 else 0
+                    entry[0], entry[1] = index, 0
+            entry[1] += 1
+            return entry[1], entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+
+
+class CacheStore:
+    """Window counts in a shared cache, one entry per key and window."""
+
+    def __init__(self, config):
+        self.cache = caches[config['CACHE']]
+
+    def hit(self, key, index, window):
+        current_key, previous_key = f'{key}:{index}', f'{key}:{index - 1}'
+        # Kept for two windows: while current and then while previous.
+        self.cache.add(current_key, 0, 2 * window)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Evicted between add() and incr().
+            self.cache.set(current_key, 1, 2 * window)
+            current = 1
+        return current, self.cache.get(previous_key, 0)
+
+    def clear(self):
+        pass
+
+
+STORES = {'local': LocalStore, 'cache': CacheStore}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    config = get_config()
+    store_class = STORES.get(config['STORE']) or import_string(config['STORE'])
+    with _store_lock:
+        if not isinstance(_store, store_class):
+            _store = store_class(config)
+        return _store
+
+
+def reset():
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.clear()
+        _store = None
+
+
+# ============================================
+# THROTTLES
+# ============================================
+
+def _identity(throttle, kind, request):
+    if kind == 'ip':
+        return throttle.get_ident(request)
+    if kind == 'username':
+        value = request.data.get('username') or request.data.get('email')
+        return _account(value.strip()) if isinstance(value, str) and value.strip() else None
+    if kind == 'user':
+        return request.user.pk if request.user and request.user.is_authenticated else None
+    raise ValueError(f'Unknown throttle key {kind!r}')
+
+
+def _account(value):
+    # Login takes anything with an @ for an email, and so does this.
+    if '@' in value:
+        username = email_lookup([value]).values_list('username', flat=True).first()
+        if username is not None:
+            return username.lower()
+    return value.lower()
+
+
+def _estimate(current, previous, window, now):
+    overlap = 1 - (now % window) / window
+    return current + previous * overlap
+
+
+class PolicyThrottle(BaseThrottle):
+    """Applies the rules of POLICIES[policy]; subclasses name the policy."""
+
+    policy = None
+    clock = staticmethod(time.time)
+
+    def allow_request(self, request, view):
+        config = get_config()
+        self.retry_after = None
+        if not config['ENABLED']:
+            return True
+        store = get_store()
+        now = self.clock()
+        for kind, limit, window in config['POLICIES'].get(self.policy, ()):
+            ident = _identity(self, kind, request)
+            if ident is None:
+                continue
+            key = f'festify:throttle:{self.policy}:{kind}:{ident}'
+            index = int(now // window)
+            current, previous = store.hit(key, index, window)
+            if _estimate(current, previous, window, now) > limit:
+                self.retry_after = self._retry_after(current, previous, limit, window, now)
+                return False
+        return True
+
+    def _retry_after(self, current, previous, limit, window, now):
+        elapsed = now % window
+        if current > limit or not previous:
+            return window - elapsed
+        # Seconds until previous * (1 - t / window) drops to limit - current.
+        return max(elapsed, (1 - (limit - current) / previous) * window) - elapsed
+
+    def wait(self):
+        return self.retry_after
+
+
+class LoginThrottle(PolicyThrottle):
+    policy = 'login'
+
+
+class RegisterThrottle(PolicyThrottle):
+    policy = 'register'
+
+
+class BuyThrottle(PolicyThrottle):
+    policy = 'buy'
@@ -19,6 +19,7 @@ urlpatterns = [
     # Auth API
     path("auth/register/", views.register, name="register"),
     path("auth/login/", views.login, name="login"),
+    path("auth/refresh/", views.refresh, name="refresh"),
     path("auth/logout/", views.logout, name="logout"),
 
     # Profile / tickets API
@@ -28,9 +29,13 @@ urlpatterns = [
     # DRF API under /api/
     path("api/auth/register/", views.register, name="register-api"),
     path("api/auth/login/", views.login, name="login-api"),
+    path("api/auth/refresh/", views.refresh, name="refresh-api"),
     path("api/auth/logout/", views.logout, name="logout-api"),
     path("api/profile/", views.profile, name="profile-api"),
     path("api/profile/tickets/", views.user_tickets, name="user-tickets-api"),
+    path("api/stats/", views.request_stats, name="request-stats"),
+    path("api/sync/", views.sync_changes, name="sync"),
+    path("api/schedule/now/", views.now_playing, name="now-playing"),
     path("api/", include(router.urls)),
     # Backwards-compatible route: allow /api/map/ to render the map page
     path("api/map/", views.map_page, name="api-map"),
@@ -1,17 +1,23 @@
 import calendar
-from datetime import datetime, date, timedelta
-from calendar import monthrange
+import math
+from datetime import datetime, date
 
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth import authenticate
-from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
 
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import TokenError
 
 from .models import (
     UserProfile,
@@ -25,10 +31,29 @@ from .models import (
 from .serializers import (
     RegisterSerializer, UserSerializer, ArtistSerializer,
     EventListSerializer, EventDetailSerializer, EventCreateUpdateSerializer,
-    TicketSerializer, ProfileSerializer
+    TicketSerializer, ReservationSerializer, ProfileSerializer
 )
 
+from . import caching, conflicts, event_calendar, exports, geo, images, schedule, sparse_fields, sync
+from .accounts import user_for_email
+from .authentication import issue_tokens, refresh_tokens
+from .caching import CachedResponseMixin, cache_page_versioned
+from .conditional import (
+    ConditionalGetMixin, conditional_get,
+    events_validators, event_validators, profile_validators, user_events_validators,
+)
+from .instrumentation import query_budget, route_stats
+from .pagination import SelectablePaginationMixin
 from .permissions import IsOrganizerAndOwner
+from .query_plans import optimize_for_serializer
+from .search import result_limit, search_event_ids
+from .sparse_fields import SparseFieldsMixin
+from .throttling import BuyThrottle, LoginThrottle, RegisterThrottle
+from .revocation import RevocableRefreshToken
+from .purchases import (
+    PurchaseError, purchase_ticket, refund_ticket,
+    reserve_ticket, confirm_reservation, release_reservation,
+)
 
 
 # ============================================
@@ -37,21 +62,21 @@ from .permissions import IsOrganizerAndOwner
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterThrottle])
 def register(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        refresh = RefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
+            **issue_tokens(user),
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginThrottle])
 def login(request):
     username_or_email = request.data.get('username')
     password = request.data.get('password')
@@ -64,20 +89,16 @@ def login(request):
 
     user = None
     if '@' in username_or_email:
-        try:
-            user_obj = User.objects.get(email=username_or_email)
+        user_obj = user_for_email(username_or_email)
+        if user_obj is not None:
             user = authenticate(username=user_obj.username, password=password)
-        except User.DoesNotExist:
-            pass
     else:
         user = authenticate(username=username_or_email, password=password)
 
     if user:
-        refresh = RefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
+            **issue_tokens(user),
         })
 
     return Response(
@@ -86,12 +107,25 @@ def login(request):
     )
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def refresh(request):
+    refresh_token = request.data.get('refresh')
+    if not refresh_token:
+        return Response({'error': 'Refresh token required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        token = RevocableRefreshToken(refresh_token)
+    except TokenError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(refresh_tokens(token))
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout(request):
     try:
         refresh_token = request.data.get('refresh')
-        token = RefreshToken(refresh_token)
+        token = RevocableRefreshToken(refresh_token)
         token.blacklist()
         return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
     except Exception:
@@ -102,8 +136,18 @@ def logout(request):
 # EVENT API (DRF)
 # ============================================
 
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(ConditionalGetMixin, CachedResponseMixin, SelectablePaginationMixin,
+                   SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Event.objects.all()
+    cache_dependencies = {
+        'list': ('event', 'artist'),
+        'retrieve': ('event:{pk}', 'artist'),
+    }
+    overlay_inventory = True
+    keyset_ordering = ('start_datetime', 'id')
+    ranked_query_params = ('search',)
+    query_budgets = {'list': 5, 'retrieve': 4, 'conflicts': 5}
+    owner_only_actions = ('export', 'conflicts')
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -113,7 +157,7 @@ class EventViewSet(viewsets.ModelViewSet):
         return EventCreateUpdateSerializer
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', *self.owner_only_actions]:
             return [IsAuthenticated(), IsOrganizerAndOwner()]
         return [AllowAny()]
 
@@ -122,11 +166,24 @@ class EventViewSet(viewsets.ModelViewSet):
 
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search) |
-                Q(location_name__icontains=search)
-            )
+            # One id past the limit tells a full result from a cut one.
+            limit = result_limit()
+            ranked_ids = search_event_ids(search, limit + 1)
+            self.search_truncated = ranked_ids is not None and len(ranked_ids) > limit
+            if ranked_ids is None:
+                queryset = queryset.filter(
+                    Q(title__icontains=search) |
+                    Q(description__icontains=search) |
+                    Q(location_name__icontains=search)
+                )
+            else:
+                ranked_ids = ranked_ids[:limit]
+                # Best matches first, then the usual date order.
+                rank = Case(
+                    *[When(pk=pk, then=Value(i)) for i, pk in enumerate(ranked_ids)],
+                    output_field=IntegerField(),
+                )
+                queryset = queryset.filter(pk__in=ranked_ids).order_by(rank, 'start_datetime')
 
         start_date = self.request.query_params.get('start_date')
         end_date = self.request.query_params.get('end_date')
@@ -139,31 +196,130 @@ class EventViewSet(viewsets.ModelViewSet):
         if upcoming:
             queryset = queryset.filter(start_datetime__gte=datetime.now())
 
-        return queryset
+        return optimize_for_serializer(
+            queryset, self.get_plan_serializer(), keep=self.keyset_ordering
+        )
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if 'search' in self.request.query_params:
+            # Part of the cached payload, so cache hits report it too.
+            response.data['search_truncated'] = getattr(self, 'search_truncated', False)
+        return response
+
+    def get_validators(self, action):
+        # Search results are ranked per keystroke and rarely re-requested,
+        # so they skip the extra validator query.
+        if action == 'list' and 'search' not in self.request.query_params:
+            return events_validators(self.get_queryset())
+        if action == 'retrieve':
+            return event_validators(self.kwargs['pk'])
+        return None
 
     def perform_create(self, serializer):
         serializer.save(host=self.request.user)
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
-    def buy(self, request, pk=None):
-        event = self.get_object()
-        user = request.user
+    @action(detail=False, methods=['get'])
+    def near(self, request):
+        """
+        Events near ?lat=&lng=, nearest first. Pass radius_km for everything
+        inside a radius, k for the k nearest, or both.
+        """
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lng'])
+            radius_km = request.query_params.get('radius_km')
+            radius_km = float(radius_km) if radius_km else None
+            k = request.query_params.get('k')
+            k = int(k) if k else None
+            # nan and inf parse as floats but would reach the bounding box.
+            if radius_km is not None and not (math.isfinite(radius_km) and radius_km > 0):
+                raise ValueError(radius_km)
+            if k is not None and k < 1:
+                raise ValueError(k)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'lat and lng are required; radius_km and k must be positive numbers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return Response(
+                {'error': 'lat/lng out of range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        if Ticket.objects.filter(user=user, event=event).exists():
+        max_radius = getattr(settings, 'FESTIFY_NEAR_MAX_RADIUS_KM', 500)
+        max_results = getattr(settings, 'FESTIFY_NEAR_MAX_RESULTS', 100)
+        k = min(k, max_results) if k else None
+        radius_km = min(radius_km, max_radius) if radius_km else None
+
+        events = Event.objects.all()
+        if request.query_params.get('upcoming'):
+            events = events.filter(start_datetime__gte=datetime.now())
+
+        if radius_km is None and k is None:
+            radius_km = 10
+        if radius_km is None:
+            hits = geo.nearest(events, latitude, longitude, k, max_radius)
+        else:
+            hits = geo.within(events, latitude, longitude, radius_km, limit=k or max_results)
+
+        sparse = self.sparse_kwargs(EventListSerializer)
+        by_id = optimize_for_serializer(
+            Event.objects.filter(pk__in=[pk for pk, _ in hits]),
+            EventListSerializer(**sparse) if sparse else EventListSerializer,
+        ).in_bulk()
+        results = EventListSerializer(
+            [by_id[pk] for pk, _ in hits], many=True, context=self.get_serializer_context(), **sparse
+        ).data
+        for data, (_, distance) in zip(results, hits):
+            data['distance_km'] = round(distance, 3)
+        return Response(results)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Attendee list for the host, streamed as ?as=csv (default) or ?as=ndjson."""
+        export_format = request.query_params.get('as', 'csv')
+        if export_format not in exports.FORMATS:
             return Response(
-                {'error': 'You already have a ticket for this event'},
+                {'error': f"as must be one of: {', '.join(exports.FORMATS)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        event = get_object_or_404(Event.objects.only('id', 'host'), pk=pk)
+        self.check_object_permissions(request, event)
 
-        if event.tickets_sold >= event.capacity:
+        response = StreamingHttpResponse(
+            exports.stream_attendees(event, export_format),
+            content_type=exports.FORMATS[export_format],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="event-{event.pk}-attendees.{export_format}"'
+        )
+        return response
+
+    @action(detail=True, methods=['get'])
+    def conflicts(self, request, pk=None):
+        """Sets of this event that overlap another on the same stage or of the same artist."""
+        event = get_object_or_404(Event.objects.only('id', 'host'), pk=pk)
+        self.check_object_permissions(request, event)
+        return Response([conflicts.describe(clash) for clash in conflicts.for_events([event.pk])])
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated],
+            throttle_classes=[BuyThrottle])
+    def buy(self, request, pk=None):
+        event = self.get_object()
+
+        try:
+            ticket = purchase_ticket(request.user, event)
+        except PurchaseError as exc:
             return Response(
-                {'error': 'Event is sold out'},
+                {'error': str(exc)},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        ticket = Ticket.objects.create(user=user, event=event)
-        event.tickets_sold += 1
-        event.save()
+        # The seat was claimed with a conditional UPDATE, so reload the
+        # counter for the response instead of trusting the stale instance.
+        event.refresh_from_db(fields=['tickets_sold'])
 
         return Response(
             TicketSerializer(ticket).data,
@@ -173,101 +329,273 @@ class EventViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def unfollow(self, request, pk=None):
         event = self.get_object()
-        user = request.user
 
         try:
-            ticket = Ticket.objects.get(user=user, event=event)
-            ticket.delete()
-            event.tickets_sold -= 1
-            event.save()
+            refund_ticket(request.user, event)
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            {'message': 'Successfully unfollowed event'},
+            status=status.HTTP_200_OK
+        )
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def reserve(self, request, pk=None):
+        event = self.get_object()
+
+        try:
+            reservation = reserve_ticket(request.user, event)
+        except PurchaseError as exc:
             return Response(
-                {'message': 'Successfully unfollowed event'},
-                status=status.HTTP_200_OK
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        except Ticket.DoesNotExist:
+
+        return Response(
+            ReservationSerializer(reservation).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def confirm(self, request, pk=None):
+        event = self.get_object()
+
+        try:
+            ticket = confirm_reservation(request.user, event)
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            TicketSerializer(ticket).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def release(self, request, pk=None):
+        event = self.get_object()
+
+        try:
+            release_reservation(request.user, event)
+        except PurchaseError as exc:
             return Response(
-                {'error': 'You do not have a ticket for this event'},
+                {'error': str(exc)},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        return Response(
+            {'message': 'Hold released'},
+            status=status.HTTP_200_OK
+        )
+
 
 # ============================================
 # PROFILE / TICKETS
 # ============================================
 
+@query_budget(6)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(lambda request: profile_validators(request.user))
 def profile(request):
     user = request.user
     profile = user.profile
-
-    tickets = Ticket.objects.filter(user=user).select_related('event')
-    hosted_events = Event.objects.filter(host=user) if profile.is_organizer else []
+    fields, expand = sparse_fields.from_request(request)
 
     data = {
-        'username': user.username,
-        'email': user.email,
-        'is_organizer': profile.is_organizer,
-        'tickets': TicketSerializer(tickets, many=True).data,
-        'hosted_events': EventListSerializer(hosted_events, many=True).data if hosted_events else []
+        name: value for name, value in (
+            ('username', user.username),
+            ('email', user.email),
+            ('is_organizer', profile.is_organizer),
+        ) if sparse_fields.includes(fields, name)
     }
+    # Sections left out of ?fields= are not queried at all.
+    if sparse_fields.includes(fields, 'tickets'):
+        data['tickets'] = _sparse_list(
+            TicketSerializer, Ticket.objects.filter(user=user),
+            sparse_fields.nested_kwargs(fields, expand, 'tickets'),
+        )
+    if sparse_fields.includes(fields, 'hosted_events'):
+        data['hosted_events'] = _sparse_list(
+            EventListSerializer, Event.objects.filter(host=user),
+            sparse_fields.nested_kwargs(fields, expand, 'hosted_events'),
+        ) if profile.is_organizer else []
 
     return Response(data)
 
 
+# One query loads the user when neither its claims nor the user cache answer.
+@query_budget(4)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(lambda request: user_events_validators(request.user))
 def user_tickets(request):
-    tickets = Ticket.objects.filter(user=request.user).select_related('event')
-    serializer = TicketSerializer(tickets, many=True)
-    return Response(serializer.data)
+    sparse = sparse_fields.spec_kwargs(*sparse_fields.from_request(request))
+    return Response(_sparse_list(TicketSerializer, Ticket.objects.filter(user=request.user), sparse))
+
+
+def _sparse_list(serializer_class, queryset, sparse):
+    """Plan, fetch and render `queryset` with ?fields=/?expand= applied."""
+    queryset = optimize_for_serializer(
+        queryset, serializer_class(**sparse) if sparse else serializer_class
+    )
+    return serializer_class(queryset, many=True, **sparse).data
+
+
+# ============================================
+# INSTRUMENTATION
+# ============================================
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_stats(request):
+    """Per-route latency, DB time, serializer time and query histograms."""
+    return Response(route_stats.snapshot())
+
+
+# ============================================
+# DELTA SYNC
+# ============================================
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def sync_changes(request):
+    """
+    Changes to events, artists, stages and performances after `?since=`.
+    `?stream=1` streams every remaining batch as NDJSON.
+    """
+    config = sync.get_config()
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = int(request.query_params.get('limit', config['BATCH_SIZE']))
+    except ValueError:
+        return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if since < 0 or limit < 1:
+        return Response({'error': 'since must be >= 0 and limit >= 1'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(limit, config['MAX_BATCH_SIZE'])
+
+    if sync.needs_reset(since):
+        return Response({'reset': True, 'cursor': sync.settled_cursor()})
+
+    context = {'request': request}
+    if request.query_params.get('stream'):
+        encoder = JSONEncoder()
+        lines = (encoder.encode(batch) + '\n' for batch in sync.iter_changes(since, limit, context))
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    return Response(sync.changes_since(since, limit, context))
 
 
 # ============================================
 # JSON CALENDAR API
 # ============================================
 
+def _calendar_window(request):
+    """(granularity, year, month or week, first day, last day); ValueError if invalid."""
+    params = request.query_params
+    today = timezone.localdate()
+    granularity = params.get('granularity', 'week' if 'week' in params else 'month')
+    if granularity == 'week':
+        iso_year, iso_week, _ = today.isocalendar()
+        year, week = int(params.get('year', iso_year)), int(params.get('week', iso_week))
+        return (granularity, year, week, *event_calendar.week_window(year, week))
+    if granularity == 'month':
+        year, month = int(params.get('year', today.year)), int(params.get('month', today.month))
+        return (granularity, year, month, *event_calendar.month_window(year, month))
+    raise ValueError(granularity)
+
+
+def _calendar_validators(request):
+    # Without ?year= the window follows the date, so the resolved window is
+    # part of the ETag, and one aggregate covers the events inside it.
+    try:
+        granularity, year, number, first, last = _calendar_window(request)
+    except ValueError:
+        return None
+    stats = event_calendar.window_stats(first, last)
+    parts = [granularity, year, number, timezone.get_current_timezone_name(),
+             stats['latest'], stats['count'], *caching.versions('event')]
+    return parts, stats['latest']
+
+
 @api_view(['GET'])
+@conditional_get(_calendar_validators)
 def calendar_view(request):
-    year = int(request.query_params.get('year', datetime.now().year))
-    month = int(request.query_params.get('month', datetime.now().month))
-
-    start_date = datetime(year, month, 1)
-    last_day = monthrange(year, month)[1]
-    end_date = datetime(year, month, last_day, 23, 59, 59)
-
-    events = Event.objects.filter(
-        start_datetime__gte=start_date,
-        start_datetime__lte=end_date
-    ).order_by('start_datetime')
-
-    days_dict = {}
-    for event in events:
-        date_key = event.start_datetime.date().isoformat()
-        if date_key not in days_dict:
-            days_dict[date_key] = []
-        days_dict[date_key].append(EventListSerializer(event).data)
-
-    days = [{
-        'date': datetime(year, month, day).date().isoformat(),
-        'events': days_dict.get(datetime(year, month, day).date().isoformat(), [])
-    } for day in range(1, last_day + 1)]
+    try:
+        granularity, year, number, first, last = _calendar_window(request)
+    except ValueError:
+        return Response(
+            {'error': 'granularity must be month or week, with a valid year and month or ISO week'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     return Response({
+        'granularity': granularity,
         'year': year,
-        'month': month,
-        'days': days
+        granularity: number,
+        'start': first,
+        'end': last,
+        'days': event_calendar.days(first, last),
     })
 
 
+# ============================================
+# NOW PLAYING API
+# ============================================
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def now_playing(request):
+    """
+    The set playing now and the next one on every stage. `?at=` asks about
+    another moment. Cheap enough to poll: answered from festify.schedule,
+    and cacheable until the next set starts or ends (at most a minute).
+    """
+    moment = None
+    if 'at' in request.query_params:
+        try:
+            moment = parse_datetime(request.query_params['at'])
+        except ValueError:
+            # Well formed but not a date, such as February 30th.
+            moment = None
+        if moment is None:
+            return Response({'error': 'at must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+
+    day_schedule, moment, cards = schedule.now_playing(moment)
+    response = Response({
+        'date': moment.date(),
+        'time': moment.time().replace(microsecond=0),
+        'stages': [{**card['stage'], 'now': card['now'], 'next': card['next']} for card in cards],
+    })
+    until_change = day_schedule.seconds_until_change(moment.time())
+    patch_cache_control(response, public=True, max_age=min(max(until_change or 60, 1), 60))
+    return response
+
+
 # ============================================
 # ARTIST API
 # ============================================
 
-class ArtistViewSet(viewsets.ModelViewSet):
+class ArtistViewSet(CachedResponseMixin, SelectablePaginationMixin, SparseFieldsMixin,
+                    viewsets.ModelViewSet):
     queryset = Artist.objects.all()
+    cache_dependencies = {'list': ('artist',), 'retrieve': ('artist',)}
+    keyset_ordering = ('name', 'id')
     serializer_class = ArtistSerializer
+    query_budgets = {'list': 3, 'retrieve': 2}
+
+    def get_queryset(self):
+        return optimize_for_serializer(
+            Artist.objects.all(), self.get_plan_serializer(), keep=self.keyset_ordering
+        )
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -318,7 +646,6 @@ def map_image(request):
     image into STATIC during quick local development.
     """
     import os
-    from django.http import FileResponse, Http404
 
     base = os.path.dirname(__file__)
     path = os.path.join(base, 'templates', 'events', 'map.png')
@@ -328,6 +655,37 @@ def map_image(request):
     return FileResponse(open(path, 'rb'), content_type='image/png')
 
 
+def image_variant(request, digest, filename):
+    """
+    One resized variant of an event image, made on this request if it
+    does not exist yet (see festify.images). The URL names the content, so
+    the response may be cached for good.
+    """
+    stem, _, extension = filename.rpartition('.')
+    variant, _, width = stem.rpartition('-')
+    image_format = images.EXTENSIONS.get(extension)
+    if image_format is None or str(images.get_config()['VARIANTS'].get(variant)) != width:
+        raise Http404("Unknown image variant")
+
+    path = images.variant_name(digest, variant, int(width), extension)
+    if not default_storage.exists(path):
+        source = (
+            Event.objects.filter(image_hash=digest).exclude(image='')
+            .values_list('image', flat=True).first()
+        )
+        if source is None:
+            raise Http404("Image not found")
+        try:
+            images.generate(digest, source, only=(variant, image_format))
+        except OSError:
+            raise Http404("Image not found")
+
+    response = FileResponse(default_storage.open(path, 'rb'), content_type=f'image/{image_format}')
+    patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    return response
+
+
+@cache_page_versioned('stage')
 def map_page(request):
     """Render a dedicated HTML page that displays the festival map.
 
@@ -360,6 +718,8 @@ def map_page(request):
     })
 
 
+@query_budget(2)
+@cache_page_versioned('stage', 'performance', 'artist', 'event')
 def stage_detail(request, pk):
     stage = get_object_or_404(Stage, pk=pk)
     # Show upcoming performances for this stage across events
@@ -380,68 +740,31 @@ def stage_detail(request, pk):
 # FESTIVAL HTML VIEWS (Stage + Performance)
 # ============================================
 
+# Both queries only run when festify.schedule rebuilds the day. The page
+# is not cached whole: what is playing changes with the clock.
+@query_budget(2)
 def home(request):
-    """Show the earliest performance TODAY for each stage."""
-    today = date.today()
-
-    events_today = Event.objects.filter(
-        start_datetime__date__lte=today
-    ).filter(
-        Q(end_datetime__date__gte=today) | Q(end_datetime__isnull=True)
-    )
-
-    performances_today = (
-        Performance.objects
-        .filter(event__in=events_today)
-        .select_related("artist", "stage", "event")
-        .order_by("start_time")
-    )
-
-    earliest_by_stage = {}
-    for perf in performances_today:
-        stage = perf.stage
-        current = earliest_by_stage.get(stage)
-        if current is None or perf.start_time < current.start_time:
-            earliest_by_stage[stage] = perf
-
-    stages = Stage.objects.order_by("order")
-    stage_cards = [{
-        "stage": stage,
-        "performance": earliest_by_stage.get(stage),
-    } for stage in stages]
+    """Show what is playing now and next on each stage TODAY."""
+    _, moment, stage_cards = schedule.now_playing()
 
     return render(request, "events/home.html", {
-        "today": today,
+        "today": moment.date(),
         "stage_cards": stage_cards,
     })
 
 
+# The second query (longest event duration) only runs after events change.
+@query_budget(2)
+@cache_page_versioned('event')
 def month_calendar(request, year=None, month=None):
     today = date.today()
     year = int(year) if year else today.year
     month = int(month) if month else today.month
 
-    _, num_days = calendar.monthrange(year, month)
-    first_day = date(year, month, 1)
-    last_day = date(year, month, num_days)
-
-    events = Event.objects.filter(
-        start_datetime__date__lte=last_day
-    ).filter(
-        Q(end_datetime__date__gte=first_day) | Q(end_datetime__isnull=True)
-    )
-
-    event_by_day = {}
-    for evt in events:
-        evt_start = evt.start_datetime.date()
-        evt_end = evt.end_datetime.date() if evt.end_datetime else evt_start
-
-        current = max(evt_start, first_day)
-        final = min(evt_end, last_day)
-
-        while current <= final:
-            event_by_day.setdefault(current, []).append(evt)
-            current += timedelta(days=1)
+    by_day = {
+        day['date']: day
+        for day in event_calendar.days(*event_calendar.month_window(year, month))
+    }
 
     cal = calendar.Calendar(firstweekday=0)
     raw_weeks = cal.monthdatescalendar(year, month)
@@ -450,10 +773,12 @@ def month_calendar(request, year=None, month=None):
     for week in raw_weeks:
         rows = []
         for d in week:
+            day = by_day.get(d)
             rows.append({
                 "date": d,
                 "in_month": d.month == month,
-                "events": event_by_day.get(d, []),
+                "events": day["events"] if day else [],
+                "more": day["count"] - len(day["events"]) if day else 0,
             })
         weeks.append(rows)
 
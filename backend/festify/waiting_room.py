@@ -0,0 +1,160 @@
+"""
+Virtual waiting room in front of the ticket purchase endpoints.
+
+Every client that hits a guarded route gets a signed, ordered queue token.
+Admission is a token bucket over queue positions: it holds at most `BURST`
+positions and refills at `ADMIT_RATE` a second, so a quiet queue admits the
+next BURST arrivals straight away and a crowd after that at the rate, no
+matter how long the event's queue has been open. Anyone further back gets a
+429 with their token, an estimated position and a Retry-After, and never
+reaches the view. The deferral path only talks to the cache, never to the
+database.
+
+The bucket is kept as an epoch (p0, t0): positions up to p0 + BURST are
+admitted from t0, and one more every 1 / ADMIT_RATE seconds after it. A new
+position that finds the bucket full (the schedule has fallen behind the
+clock) starts a new epoch at itself, which is where the balance is capped.
+
+An admitted token is spent on the route it was admitted to: copies of it,
+or the same client coming back, queue again. A response other than 2xx
+gives the admission back, so a failed attempt can be retried in place.
+
+The counters live in a Django cache (`CACHE` alias). The default local-memory
+cache keeps one queue per process; point the alias at a shared cache to run
+a single queue across workers.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'ROUTES': ('event-buy', 'event-reserve'),
+    'ADMIT_RATE': 20,
+    'BURST': 50,
+    'TOKEN_MAX_AGE': 900,
+}
+
+TOKEN_HEADER = 'HTTP_X_QUEUE_TOKEN'
+TOKEN_SALT = 'festify.waiting-room'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FESTIFY_WAITING_ROOM', {})}
+
+
+class WaitingRoom:
+    def __init__(self, config=None, clock=time.time):
+        self.config = config or get_config()
+        self.cache = caches[self.config['CACHE']]
+        self.clock = clock
+
+    def _key(self, event_id, name):
+        return f'festify:queue:{event_id}:{name}'
+
+    def epoch(self, event_id):
+        key = self._key(event_id, 'epoch')
+        self.cache.add(key, (0, self.clock()), None)
+        return self.cache.get(key)
+
+    def issue(self, event_id):
+        """Hand out the next position in the event's queue."""
+        key = self._key(event_id, 'issued')
+        self.cache.add(key, 0, None)
+        position = self.cache.incr(key)
+        first, started = self.epoch(event_id)
+        rate, now = self.config['ADMIT_RATE'], self.clock()
+        if rate and started + (position - 1 - first) / rate < now:
+            # More than BURST positions of credit: start over from here.
+            self.cache.set(self._key(event_id, 'epoch'), (position - 1, now), None)
+        token = signing.dumps({'e': str(event_id), 'n': position}, salt=TOKEN_SALT)
+        return position, token
+
+    def position_from_token(self, event_id, token):
+        try:
+            data = signing.loads(token, salt=TOKEN_SALT, max_age=self.config['TOKEN_MAX_AGE'])
+        except signing.BadSignature:
+            return None
+        if data.get('e') != str(event_id):
+            return None
+        return data.get('n')
+
+    def admitted_through(self, event_id):
+        first, started = self.epoch(event_id)
+        elapsed = max(self.clock() - started, 0)
+        return first + self.config['BURST'] + int(elapsed * self.config['ADMIT_RATE'])
+
+    def _spent_key(self, event_id, scope, position):
+        return self._key(event_id, f'spent:{scope}:{position}')
+
+    def check(self, event_id, token=None, scope=None):
+        """
+        Returns (admitted, position, token). `position` is how many places
+        the client still is from the front when not admitted. With a
+        `scope`, an admission spends the token there.
+        """
+        position = self.position_from_token(event_id, token) if token else None
+        if position is not None and scope is not None and self.cache.get(self._spent_key(event_id, scope, position)):
+            position = None
+        if position is None:
+            position, token = self.issue(event_id)
+
+        ahead = position - self.admitted_through(event_id)
+        admitted = ahead <= 0
+        if admitted and scope is not None:
+            # add() lets one of several requests sent with the same token through.
+            admitted = self.cache.add(
+                self._spent_key(event_id, scope, position), True, self.config['TOKEN_MAX_AGE']
+            )
+        return admitted, max(ahead, 0), token
+
+    def release(self, event_id, token, scope):
+        """Give back the admission `token` spent on `scope`."""
+        position = self.position_from_token(event_id, token)
+        if position is not None:
+            self.cache.delete(self._spent_key(event_id, scope, position))
+
+
+class WaitingRoomMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        self.room = WaitingRoom(self.config)
+
+    def __call__(self, request):
+        if not self.config['ENABLED'] or request.method != 'POST':
+            return self.get_response(request)
+
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        if match.url_name not in self.config['ROUTES'] or 'pk' not in match.kwargs:
+            return self.get_response(request)
+
+        event_id = match.kwargs['pk']
+        admitted, ahead, token = self.room.check(event_id, request.META.get(TOKEN_HEADER), match.url_name)
+        if admitted:
+            response = self.get_response(request)
+            if not 200 <= response.status_code < 300:
+                self.room.release(event_id, token, match.url_name)
+            response['X-Queue-Token'] = token
+            return response
+
+        wait = math.ceil(ahead / self.config['ADMIT_RATE']) if self.config['ADMIT_RATE'] else None
+        response = JsonResponse({
+            'error': 'You are in the queue for this event',
+            'queue_token': token,
+            'position': ahead,
+            'estimated_wait': wait,
+        }, status=429)
+        response['X-Queue-Token'] = token
+        if wait is not None:
+            response['Retry-After'] = str(max(wait, 1))
+        return response
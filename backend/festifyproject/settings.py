@@ -47,8 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'festify.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'festify.waiting_room.WaitingRoomMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,6 +92,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory evicts least-recently-used entries past MAX_ENTRIES. Point this
+# at a shared backend (e.g. django.core.cache.backends.redis.RedisCache) to
+# share the response cache, waiting room and inventory counts across workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+FESTIFY_RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,    # seconds a cached payload/page may live
+    'COUNTS_TTL': 2,   # seconds tickets_sold/remaining_tickets may lag behind
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -135,16 +157,28 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # simplejwt, but answering from token claims and a user cache (see
+    # festify/authentication.py).
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'festify.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # orjson-backed when orjson is installed, stock JSON otherwise; same
+    # bytes either way (see festify/renderers.py).
+    'DEFAULT_RENDERER_CLASSES': (
+        'festify.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Render hot read serializers through precompiled field plans
+# (see festify/compiled_serializers.py).
+FESTIFY_COMPILED_SERIALIZERS = True
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -155,6 +189,86 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Users loaded for authenticated requests (see festify/authentication.py).
+FESTIFY_AUTH = {
+    'USER_CACHE_SIZE': 1024,  # users kept per process
+    'USER_CACHE_TTL': 60,     # seconds before a cached user is reloaded
+    # Trust token claims while the user's stamp matches: 'shared-cache'
+    # only when the cache alias is shared by every worker, True for a
+    # single process, False never. Untrusted requests use the user cache.
+    'TRUST_CLAIMS': 'shared-cache',
+}
+
+# Resized WebP/JPEG variants of event images (see festify/images.py).
+FESTIFY_IMAGES = {
+    'VARIANTS': {'thumbnail': 160, 'card': 480, 'full': 1600},  # name -> width
+    'WORKERS': 2,    # threads making variants after uploads
+    'EAGER': True,   # False: make each variant on its first request only
+}
+
+# Bulk account imports (see festify/accounts.py).
+FESTIFY_ACCOUNTS = {
+    'PASSWORD_ITERATIONS': 1000,    # PBKDF2 rounds until the first login
+    'WORKERS': 8,                   # password hashing threads
+    'BATCH_SIZE': 1000,
+}
+
+# Sliding-window rate limits on login, register and buy
+# (see festify/throttling.py). 'local' counts per process; 'cache' shares
+# the counts through the CACHE alias.
+FESTIFY_THROTTLE = {
+    'STORE': 'local',
+    'POLICIES': {
+        # (key, requests, seconds); key is 'ip', 'username' or 'user'
+        'login': (('ip', 30, 60), ('username', 10, 300)),
+        'register': (('ip', 10, 3600),),
+        'buy': (('user', 10, 60),),
+    },
+}
+
+# Bloom filter in front of the refresh-token blacklist
+# (see festify/revocation.py).
+FESTIFY_REVOCATION = {
+    'CAPACITY': 1_000_000,  # revoked tokens it is sized for (grows past that)
+    'ERROR_RATE': 0.01,     # share of live tokens still checked in the DB
+    'SYNC_OVERLAP': 1000,   # ids a sync re-reads for rows that committed late
+    # Ask the filter before the table: 'shared-cache' only when the cache
+    # alias is shared by every worker, True for a single process, False never.
+    'USE_FILTER': 'shared-cache',
+}
+
+# Raise on per-view query budget overruns (see festify/instrumentation.py).
+# Servers, DEBUG ones included, log a warning instead; the test runner
+# below turns this on so overruns fail the suite.
+FESTIFY_ENFORCE_QUERY_BUDGETS = False
+TEST_RUNNER = 'festify.test_runner.FestifyTestRunner'
+
+# Admission queue in front of /api/events/<id>/buy/ and reserve/.
+# See festify/waiting_room.py.
+FESTIFY_WAITING_ROOM = {
+    'ENABLED': True,
+    'ADMIT_RATE': 20,  # queue positions admitted per second, per event
+    'BURST': 50,       # most positions admitted at once, after a quiet spell
+}
+
+# Delta-sync feed at /api/sync/ (see festify/sync.py).
+FESTIFY_SYNC = {
+    'BATCH_SIZE': 500,       # change-log entries per batch by default
+    'MAX_BATCH_SIZE': 5000,  # upper bound for ?limit=
+    'TOMBSTONE_DAYS': 30,    # compact_changelog expires older tombstones
+    'SETTLE_SECONDS': 5,     # newer entries wait for earlier ids to commit
+}
+
+# Per-day summaries behind /api/calendar/ and the calendar page
+# (see festify/event_calendar.py).
+FESTIFY_CALENDAR = {
+    'DAY_LIMIT': 20,  # events listed per day; `count` has the full number
+}
+
+# Rows fetched and written per step by /api/events/<id>/export/
+# (see festify/exports.py).
+FESTIFY_EXPORT_CHUNK_SIZE = 2000
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://localhost:3001",
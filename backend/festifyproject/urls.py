@@ -14,13 +14,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from festify import images
+from festify.views import calendar_view, image_variant
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # JSON calendar. Listed here because the api/ include below would hand
+    # /api/calendar/ to the HTML calendar/ page.
+    path('api/calendar/', calendar_view, name='calendar-api'),
+    # Resized event images (see festify/images.py). The web server serves
+    # the ones already in MEDIA_ROOT and sends misses here to be made.
+    re_path(
+        r'^{}{}/(?P<digest>[0-9a-f]{{16}})/(?P<filename>[\w-]+\.\w+)$'.format(
+            re.escape(settings.MEDIA_URL.lstrip('/')), re.escape(images.get_config()['DIRECTORY']),
+        ),
+        image_variant,
+        name='image-variant',
+    ),
     path('api/', include('festify.urls')),
     path('', include('festify.urls')),
 ]